@@ -1,4 +1,5 @@
-from .realstate_scrap import scrap_rent, scrap_buy
+from .realstate_scrap import scrap_rent, scrap_buy, scrape
+from .session import ScraperSession
 
 __author__ = """Lucas Abreu"""
 __email__ = 'lag.programmer@gmail.com'
@@ -0,0 +1,249 @@
+import contextlib
+import functools
+import html
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+from .fakes import FakeGeocoder, FakeSupabase
+from .parsing import fixture_cards
+from .realstate_scrap import OPERATIONS, scrape, url_template_for
+
+_CARD_TEMPLATE = (
+    '<div data-qa="posting PROPERTY" data-to-posting="{posting}">'
+    '<div class="flickity-slider"><img src="{image}"></div>'
+    '<div class="sc-12dh9kl-0">{condo}</div>'
+    '<div class="sc-ge2uzh-0">{address}</div>'
+    '<div data-qa="POSTING_CARD_LOCATION">{location}</div>'
+    '<div data-qa="POSTING_CARD_FEATURES">{features}</div>'
+    '</div>'
+)
+
+
+def _lines(text):
+    # one element per line, read back as one line each like WebElement.text
+    return "".join(f"<span>{html.escape(line)}</span>" for line in (text or "").split("\n"))
+
+
+def render_page(page):
+    """Renders a page dict as a results page with the markup of the listing site."""
+
+    cards = []
+    for i in range(len(page["posting"])):
+        cards.append(_CARD_TEMPLATE.format(
+            posting=html.escape(page["posting"][i]),
+            image=html.escape(page["image"][i] or f"/img/{i}.jpg"),
+            condo=_lines(page["condo"][i]),
+            address=_lines(page["address"][i]),
+            location=_lines(page["location"][i]),
+            features=_lines(page["features"][i]),
+        ))
+    return f"<html><body>{''.join(cards)}</body></html>"
+
+
+_DETAIL_TEMPLATE = (
+    '<html><body><h1>{title}</h1>'
+    '<div class="price-items"><span>IPTU R$ {iptu}</span></div>'
+    '<ul id="section-icon-features-property"><li>{floor}º andar</li></ul>'
+    '<div id="longDescription">{description}</div>'
+    '<ul id="section-general-features">{amenities}</ul>'
+    '<div id="user-views"><p>Publicado há {days} dias</p></div>'
+    '</body></html>'
+)
+
+
+def render_detail_page(index, rng):
+    """Renders a synthetic listing page with the fields parse_detail_page reads."""
+
+    amenities = rng.sample(("Piscina", "Academia", "Portaria 24h", "Churrasqueira", "Elevador", "Varanda"), 3)
+    return _DETAIL_TEMPLATE.format(
+        title=f"Apartamento {index}",
+        iptu=f"{rng.randint(50, 900) * 10:,}".replace(",", "."),
+        floor=rng.randint(1, 20),
+        description=html.escape(f"Apartamento {index}, reformado, perto do metrô."),
+        amenities="".join(f"<li>{html.escape(name)}</li>" for name in amenities),
+        days=rng.randint(1, 60),
+    )
+
+
+def write_fixture_pages(directory, pages=10, cards_per_page=20, seed=0):
+    """Writes synthetic results pages and listing pages for every operation, named like the site urls.
+
+    Pages recorded from the site can be saved in the same directory under their url path
+    (e.g. "apartamentos-venda-belo-horizonte-mg-pagina-1.html"); existing files are kept.
+
+    Args:
+        directory (str): Directory served by serve_fixtures.
+        pages (int, optional): Pages written per operation.
+        cards_per_page (int, optional): Cards on each page.
+        seed (int, optional): Seed used to build the cards.
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    for offset, operation in enumerate(OPERATIONS):
+        cards = fixture_cards(pages * cards_per_page, seed + offset)
+        for page_num in range(1, pages + 1):
+            path = os.path.join(directory, url_template_for(operation, base_url="").format(page_num).lstrip("/"))
+            if os.path.exists(path):
+                continue
+            start = (page_num - 1) * cards_per_page
+            page = {field: values[start:start + cards_per_page] for field, values in cards.items()}
+            # listing ids must differ between operations and pages, or the dedup drops them
+            page["posting"] = [posting.replace("apto-", f"apto-{offset}-") for posting in page["posting"]]
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(render_page(page))
+
+            rng = random.Random(f"{seed}-{offset}-{page_num}")
+            for i, posting in enumerate(page["posting"]):
+                detail_path = os.path.join(directory, posting.lstrip("/"))
+                os.makedirs(os.path.dirname(detail_path), exist_ok=True)
+                with open(detail_path, "w", encoding="utf-8") as f:
+                    f.write(render_detail_page(start + i, rng))
+
+
+@contextlib.contextmanager
+def serve_fixtures(directory, throttle_qps=None, latency=0.0):
+    """Serves a directory over HTTP on a free local port.
+
+    Args:
+        directory (str): Directory with the pages.
+        throttle_qps (float, optional): Requests per second above which the server answers
+                                        HTTP 429, like a site throttling a crawler.
+        latency (float, optional): Seconds each request waits before it is answered.
+
+    Yields:
+        The base url of the server, e.g. "http://127.0.0.1:54321".
+    """
+
+    from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+    recent = []
+    lock = threading.Lock()
+
+    def throttled():
+        if throttle_qps is None:
+            return False
+        with lock:
+            now = time.monotonic()
+            recent[:] = [t for t in recent if now - t < 1.0]
+            recent.append(now)
+            return len(recent) > throttle_qps
+
+    class Handler(SimpleHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            if throttled():
+                self.send_response(429)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            super().do_GET()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(Handler, directory=directory))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def run_benchmark(operations=("buy", "rent"), pages=10, cards_per_page=20, engine="http",
+                  geocode_latency=0.05, db_latency=0.02, fixtures_dir=None, output=None, throttle_qps=None,
+                  page_latency=0.0, **options):
+    """Runs scrape() offline against fixture pages, a fake geocoder and a fake database.
+
+    Every run starts from empty caches, seen index, listing states, mirror and checkpoints,
+    so the numbers only depend on the code and the simulated latencies.
+
+    Args:
+        operations (tuple, optional): Operations to run, see OPERATIONS.
+        pages (int, optional): Pages scraped per operation.
+        cards_per_page (int, optional): Cards on each synthetic page.
+        engine (str, optional): Engine passed to scrape. "selenium" needs Chrome.
+        geocode_latency (float, optional): Seconds each fake geocode call takes.
+        db_latency (float, optional): Seconds each fake database request takes.
+        fixtures_dir (str, optional): Directory with the fixture pages. Missing pages are generated.
+        output (str, optional): JSON file receiving the results.
+        throttle_qps (float, optional): Requests per second above which the fixture server answers HTTP 429.
+        page_latency (float, optional): Seconds the fixture server takes to answer each request.
+        **options: Any other argument of scrape().
+
+    Returns:
+        A dict with the configuration and, per operation, the run summary of scrape()
+        plus its pages per minute.
+    """
+
+    results = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"pages": pages, "cards_per_page": cards_per_page, "engine": engine,
+                   "geocode_latency": geocode_latency, "db_latency": db_latency, "throttle_qps": throttle_qps,
+                   "page_latency": page_latency, **options},
+        "operations": {},
+    }
+
+    with tempfile.TemporaryDirectory() as workdir:
+        fixtures_dir = fixtures_dir or os.path.join(workdir, "fixtures")
+        write_fixture_pages(fixtures_dir, pages=pages, cards_per_page=cards_per_page)
+
+        with serve_fixtures(fixtures_dir, throttle_qps=throttle_qps, latency=page_latency) as base_url:
+            for operation in operations:
+                geocoder = FakeGeocoder(latency=geocode_latency)
+                database = FakeSupabase(latency=db_latency)
+                summary = scrape(operation, 1, pages + 1, engine=engine, base_url=base_url,
+                                 supabase_client=database, geocoder=geocoder,
+                                 geocode_cache=os.path.join(workdir, f"{operation}-geocode.sqlite3"),
+                                 seen_index=os.path.join(workdir, f"{operation}-seen.bin"),
+                                 listing_state=os.path.join(workdir, f"{operation}-state.sqlite3"),
+                                 detail_cache=os.path.join(workdir, f"{operation}-details.sqlite3"),
+                                 mirror=os.path.join(workdir, "listings.sqlite3"),
+                                 checkpoint_dir=os.path.join(workdir, "checkpoints"),
+                                 regional_memo=None, **options)
+                summary["pages_per_minute"] = summary["pages"] / summary["elapsed"] * 60
+                summary["geocode_calls"] = geocoder.calls
+                summary["db_requests"] = database.requests
+                results["operations"][operation] = summary
+
+    if output is not None:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+def compare(baseline, current):
+    """Compares two benchmark results, as dicts or JSON files.
+
+    Returns:
+        A dict with, per operation, the ratio current / baseline of pages per minute and of
+        the seconds spent in each stage. Below 1 means less time; for pages per minute,
+        above 1 means faster.
+    """
+
+    def load(result):
+        if isinstance(result, str):
+            with open(result, encoding="utf-8") as f:
+                return json.load(f)
+        return result
+
+    baseline, current = load(baseline), load(current)
+    ratios = {}
+    for operation, summary in current["operations"].items():
+        before = baseline["operations"].get(operation)
+        if before is None:
+            continue
+        ratios[operation] = {"pages_per_minute": summary["pages_per_minute"] / before["pages_per_minute"]}
+        for stage, seconds in summary["timings"].items():
+            if before["timings"].get(stage):
+                ratios[operation][stage] = seconds / before["timings"][stage]
+    return ratios
+
+
+if __name__ == "__main__":
+    print(json.dumps(run_benchmark(output="benchmark.json"), indent=2))
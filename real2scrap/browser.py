@@ -0,0 +1,402 @@
+import itertools
+import json
+import queue
+import threading
+import time
+
+
+# Fields read from every property card, shared by both engines
+CARD_FIELDS = ("address", "features", "condo", "location", "image", "posting")
+
+# Reads every property card of the page in one round trip, one record per card so a
+# missing field never shifts the fields of the following cards.
+_EXTRACT_CARDS_SCRIPT = """
+function text(card, selector) {
+    const el = card.querySelector(selector);
+    return el ? el.innerText : "";
+}
+return Array.from(document.querySelectorAll('[data-qa="posting PROPERTY"]')).map(function (card) {
+    const img = card.querySelector('.flickity-slider img:first-child');
+    return {
+        address: text(card, '.sc-ge2uzh-0'),
+        features: text(card, '[data-qa="POSTING_CARD_FEATURES"]'),
+        condo: text(card, '.sc-12dh9kl-0'),
+        location: text(card, '[data-qa="POSTING_CARD_LOCATION"]'),
+        // with images blocked, lazy images may still only carry their url in data-src
+        image: img && img.getAttribute('src') ? img.src : (img && img.getAttribute('data-src')) || null,
+        posting: card.getAttribute('data-to-posting') || ""
+    };
+});
+"""
+
+# Scrolls one step (unless told not to) and reports how far the results page has loaded.
+_LOAD_STATE_SCRIPT = """
+const step = arguments[0];
+if (step > 0) {
+    window.scrollBy(0, step);
+}
+const cards = document.querySelectorAll('[data-qa="posting PROPERTY"]');
+const images = document.querySelectorAll('[data-qa="posting PROPERTY"] .flickity-slider img:first-child');
+let pending = 0;
+images.forEach(function (img) {
+    if (!img.getAttribute('src')) {
+        pending += 1;
+    }
+});
+const bottom = window.innerHeight + window.scrollY >= document.documentElement.scrollHeight - 2;
+return {cards: cards.length, pending_images: pending, bottom: bottom};
+"""
+
+# url patterns blocked through DevTools, by kind of resource
+BLOCKED_RESOURCES = {
+    "images": ("*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico"),
+    "media": ("*.mp4", "*.webm", "*.m3u8", "*.mp3"),
+    "fonts": ("*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot"),
+    "analytics": ("*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+                  "*googlesyndication.com*", "*facebook.net*", "*connect.facebook.com*", "*hotjar.com*",
+                  "*clarity.ms*", "*tiktok.com*", "*criteo.com*", "*taboola.com*", "*newrelic.com*",
+                  "*nr-data.net*"),
+}
+
+
+class ResourcePolicy:
+    """What a headless Chrome is allowed to download while browsing the results pages.
+
+    Only the card DOM and the image urls are read, so images, media, fonts and analytics
+    scripts are blocked through DevTools before they are requested, images are also
+    turned off in the Chrome preferences (their src attributes are still set), and pages
+    load with the "eager" strategy, i.e. driver.get returns once the DOM is ready.
+
+    Args:
+        eager (bool, optional): Use pageLoadStrategy "eager" instead of "normal".
+        block (tuple, optional): Kinds of resources to block, keys of BLOCKED_RESOURCES.
+        extra_patterns (tuple, optional): More url patterns to block, "*" being a wildcard.
+        disable_images (bool, optional): Turn images off in the Chrome preferences.
+        track_bytes (bool, optional): Enable the performance log to count the bytes of every page.
+    """
+
+    def __init__(self, eager=True, block=("images", "media", "fonts", "analytics"), extra_patterns=(),
+                 disable_images=True, track_bytes=True):
+        unknown = set(block) - set(BLOCKED_RESOURCES)
+        if unknown:
+            raise ValueError(f"Invalid resource kinds: {', '.join(sorted(unknown))}. "
+                             f"Must be among {', '.join(BLOCKED_RESOURCES)}.")
+        self.eager = eager
+        self.block = tuple(block)
+        self.extra_patterns = tuple(extra_patterns)
+        self.disable_images = disable_images
+        self.track_bytes = track_bytes
+
+    @property
+    def patterns(self):
+        return [pattern for kind in self.block for pattern in BLOCKED_RESOURCES[kind]] + list(self.extra_patterns)
+
+    def apply_options(self, option):
+        """Sets the load strategy, image preference and performance log on a ChromeOptions object."""
+
+        if self.eager:
+            option.page_load_strategy = "eager"
+        if self.disable_images:
+            option.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+        if self.track_bytes:
+            option.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+
+    def apply_driver(self, driver):
+        """Installs the url blocklist on a freshly started driver."""
+
+        patterns = self.patterns
+        if patterns:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+
+    def bytes_transferred(self, driver):
+        """Returns the bytes the driver received since the last call, or None when not tracked.
+
+        Reads (and so empties) the performance log, summing the encoded length of every
+        finished request.
+        """
+
+        if not self.track_bytes:
+            return None
+        total = 0
+        for entry in driver.get_log("performance"):
+            message = json.loads(entry["message"])["message"]
+            if message.get("method") == "Network.loadingFinished":
+                total += int(message["params"].get("encodedDataLength", 0))
+        return total
+
+
+def build_options(policy=None):
+    """Creates the Options object shared by every headless Chrome driver.
+
+    Args:
+        policy (ResourcePolicy, optional): Resource policy applied to the options.
+
+    Returns:
+        A selenium ChromeOptions object.
+    """
+
+    from selenium.webdriver.chrome.options import Options
+
+    # Create a new Options object for configuring the Chrome driver
+    option = Options()
+
+    # Set the window size of the browser to 1920x1080 pixels
+    option.add_argument("--window-size=1920,1080")
+
+    # Disable GPU acceleration to improve performance
+    option.add_argument("--disable-gpu")
+
+    # Disable any installed browser extensions to avoid potential conflicts
+    option.add_argument("--disable-extensions")
+
+    # Disable the use of automation extensions, which could interfere with website behavior
+    option.add_argument('--disable-useAutomationExtension')
+
+    # Specify a direct connection to the internet, bypassing any proxy settings
+    option.add_argument("--proxy-server='direct://'")
+    option.add_argument("--proxy-bypass-list=*")
+
+    # Start the browser maximized to fill the screen
+    option.add_argument("--start-maximized")
+
+    # Run the browser in headless mode, meaning without a visible user interface
+    option.add_argument("--headless")
+
+    # Set the User-Agent header of the browser to mimic a Windows 10 desktop machine running Chrome 87
+    option.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64)" +
+                        "AppleWebKit/537.36 (KHTML, like Gecko)"+"Chrome/87.0.4280.141 Safari/537.36")
+
+    # Load only what is needed to read the cards
+    if policy is not None:
+        policy.apply_options(option)
+
+    return option
+
+
+def wait_for_cards(driver, timeout=20, poll=0.25, stable_polls=3, scroll_step=1100):
+    """Scrolls a results page until its property cards are loaded, instead of sleeping a fixed time.
+
+    The page counts as ready once the bottom has been reached and either the card count
+    stopped growing for `stable_polls` checks in a row or every lazy card image got a src.
+    Scrolling stops as soon as the bottom is reached.
+
+    Args:
+        driver (WebDriver): Driver sitting on a results page.
+        timeout (float, optional): Maximum seconds to wait for the page.
+        poll (float, optional): Seconds between two checks.
+        stable_polls (int, optional): Checks without new cards needed to call the page loaded.
+        scroll_step (int, optional): Pixels scrolled per check.
+
+    Returns:
+        A dict with the seconds waited, the number of cards found, whether the timeout was hit and
+        the number of checks (each one a round trip to the driver).
+    """
+
+    start_time = time.time()
+    deadline = start_time + timeout
+    last_count = -1
+    stable = 0
+    bottom = False
+    polls = 0
+
+    while True:
+        state = driver.execute_script(_LOAD_STATE_SCRIPT, 0 if bottom else scroll_step)
+        polls += 1
+        count = state["cards"]
+        bottom = bottom or state["bottom"]
+
+        if count > 0 and count == last_count:
+            stable += 1
+        else:
+            stable = 0
+        last_count = count
+
+        if bottom and count > 0 and (stable >= stable_polls or state["pending_images"] == 0):
+            timed_out = False
+            break
+        if time.time() >= deadline:
+            timed_out = True
+            break
+        time.sleep(poll)
+
+    return {"wait": time.time() - start_time, "cards": max(last_count, 0), "timed_out": timed_out, "polls": polls}
+
+
+def extract_cards(driver):
+    """Reads every property card of the current page with a single execute_script call.
+
+    Args:
+        driver (WebDriver): Driver sitting on a loaded results page.
+
+    Returns:
+        A dict with one list per field in CARD_FIELDS, aligned card by card.
+    """
+
+    cards = driver.execute_script(_EXTRACT_CARDS_SCRIPT) or []
+    return {field: [card.get(field) for card in cards] for field in CARD_FIELDS}
+
+
+class BrowserPool:
+    """A fixed number of long-lived headless Chrome drivers that take pages from a shared queue.
+
+    Each worker thread owns one driver and keeps it between pages. A driver is quit and
+    replaced after `recycle_after` pages, or as soon as a page raises, so a leaking or
+    crashed browser never serves more than one bad page.
+
+    Args:
+        service (Service): chromedriver service used to start every driver.
+        options (Options, optional): Chrome options. Defaults to build_options(policy).
+        workers (int, optional): Number of drivers running at the same time.
+        recycle_after (int, optional): Pages served by a driver before it is restarted.
+        retries (int, optional): Extra attempts given to a page whose driver crashed.
+        policy (ResourcePolicy, optional): Resource policy installed on every driver.
+    """
+
+    def __init__(self, service, options=None, workers=4, recycle_after=10, retries=1, policy=None):
+        if workers < 1:
+            raise ValueError("The number of workers must be at least 1.")
+        if recycle_after < 1:
+            raise ValueError("recycle_after must be at least 1.")
+
+        self.service = service
+        self.policy = policy
+        self.options = options if options is not None else build_options(policy)
+        self.workers = workers
+        self.recycle_after = recycle_after
+        self.retries = retries
+
+    def _start_driver(self):
+        from selenium import webdriver
+
+        driver = webdriver.Chrome(service=self.service, options=self.options)
+        if self.policy is not None:
+            self.policy.apply_driver(driver)
+        return driver
+
+    @staticmethod
+    def _quit_driver(driver):
+        try:
+            driver.quit()
+        except Exception:
+            # the browser is already gone, nothing left to clean up
+            pass
+
+    def _work(self, tasks, page_fn, deliver):
+        driver = None
+        served = 0
+
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            index, url, attempt = task
+
+            try:
+                if driver is None:
+                    driver = self._start_driver()
+                    served = 0
+                result = page_fn(driver, url)
+                served += 1
+            except Exception as e:
+                # throw the driver away, it may be in a broken state
+                if driver is not None:
+                    self._quit_driver(driver)
+                driver = None
+                if attempt < self.retries:
+                    print(f"Retrying {url} after error: {e}")
+                    tasks.put((index, url, attempt + 1))
+                else:
+                    print(f"Giving up on {url}: {e}")
+                    deliver(index, None)
+                continue
+
+            deliver(index, result)
+
+            if served >= self.recycle_after:
+                self._quit_driver(driver)
+                driver = None
+
+        if driver is not None:
+            self._quit_driver(driver)
+
+    def imap(self, page_fn, urls, prefetch=None):
+        """Runs page_fn(driver, url) on the pool drivers, yielding the results in order as they are ready.
+
+        Urls are taken from the iterable lazily, at most `prefetch` pages ahead of the consumer,
+        so urls can be an open-ended generator and the consumer can stop at any time; closing
+        the generator stops the drivers.
+
+        Args:
+            page_fn (callable): Function receiving a live driver and a url.
+            urls (iterable): Urls to visit.
+            prefetch (int, optional): Pages queued ahead of the consumer. Defaults to twice the workers.
+
+        Yields:
+            The page_fn result for each url, or None for pages that kept failing after all retries.
+        """
+
+        prefetch = prefetch or 2 * self.workers
+        urls = iter(urls)
+        tasks = queue.Queue()
+        results = {}
+        ready = threading.Condition()
+
+        def deliver(index, result):
+            with ready:
+                results[index] = result
+                ready.notify_all()
+
+        def submit(index):
+            url = next(urls, None)
+            if url is None:
+                return False
+            tasks.put((index, url, 0))
+            return True
+
+        threads = [threading.Thread(target=self._work, args=(tasks, page_fn, deliver), daemon=True)
+                   for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            submitted = 0
+            while submitted < prefetch and submit(submitted):
+                submitted += 1
+
+            for index in itertools.count():
+                if index >= submitted:
+                    break
+                with ready:
+                    while index not in results:
+                        ready.wait()
+                    result = results.pop(index)
+                if submit(submitted):
+                    submitted += 1
+                yield result
+        finally:
+            # drop the pages nobody is going to read and stop the drivers
+            while True:
+                try:
+                    tasks.get_nowait()
+                except queue.Empty:
+                    break
+            for _ in threads:
+                tasks.put(None)
+            for thread in threads:
+                thread.join()
+
+    def map(self, page_fn, urls):
+        """Runs page_fn(driver, url) for every url on the pool drivers.
+
+        Args:
+            page_fn (callable): Function receiving a live driver and a url.
+            urls (list): Urls to visit.
+
+        Returns:
+            A list with the page_fn result for each url, in the same order as urls.
+            Pages that kept failing after all retries are returned as None.
+        """
+
+        urls = list(urls)
+        return list(self.imap(page_fn, urls, prefetch=max(1, len(urls))))
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import sqlite3
+import threading
+
+from .seen import listing_id
+
+# the columns a listing change is detected on: price, fee, area and features
+HASHED_COLUMNS = ("price(R$)", "condo(R$)", "area(m²)", "bedroom", "bathrooms", "parkings")
+
+
+def _normalize(value):
+    # 450000, 450000.0 and "450000" are the same price
+    if value is None:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return str(value)
+    return None if value != value else round(value, 2)
+
+
+def _as_int(value):
+    return int(value) if isinstance(value, float) and value.is_integer() else value
+
+
+def content_hash(record, columns=HASHED_COLUMNS):
+    """Hashes the columns of a listing a change is detected on.
+
+    Args:
+        record (dict): Row as returned by frame_to_records.
+        columns (tuple, optional): Columns hashed.
+
+    Returns:
+        A 16 character hex digest, the same for rows that only differ in other columns.
+    """
+
+    values = json.dumps([_normalize(record.get(column)) for column in columns])
+    return hashlib.blake2b(values.encode(), digest_size=8).hexdigest()
+
+
+class ChangeTracker:
+    """Remembers the content hash of every listing stored, to only write the ones that changed.
+
+    Listings are keyed by operation and posting id (see seen.listing_id), which stays the same
+    while the price or the text of a listing changes; the same posting listed for sale and for
+    rent is two listings. diff() drops the rows whose hash matches the
+    stored one before they are written; commit() is called with the rows the database
+    confirmed, stores their new state and returns one delta per listing that changed, with
+    the old and new value of each changed column.
+
+    Args:
+        operation (str): "buy" or "rent".
+        path (str, optional): SQLite file holding the listing states.
+        columns (tuple, optional): Columns a change is detected on.
+        key (str, optional): Column holding the listing url.
+    """
+
+    def __init__(self, operation, path="listing_state.sqlite3", columns=HASHED_COLUMNS, key="url(apt)"):
+        self.operation = operation
+        self.path = path
+        self.columns = tuple(columns)
+        self.key = key
+        self.stats = {"new": 0, "changed": 0, "unchanged": 0}
+        self._lock = threading.Lock()
+        # several worker processes may share the file
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # the listings table of earlier versions had no operation, its states are left alone
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS listing_states (operation TEXT NOT NULL, listing_id TEXT NOT NULL, "
+            "hash TEXT NOT NULL, state TEXT NOT NULL, updated_at TEXT, PRIMARY KEY (operation, listing_id))")
+
+    def _stored(self, ids):
+        stored = {}
+        ids = list(ids)
+        # stay below the SQLite limit of bound parameters
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            stored.update((row[0], row[1:]) for row in self._conn.execute(
+                f"SELECT listing_id, hash, state FROM listing_states "
+                f"WHERE operation = ? AND listing_id IN ({','.join('?' * len(chunk))})",
+                [self.operation] + chunk))
+        return stored
+
+    def diff(self, records):
+        """Drops the rows of listings that did not change since they were last stored.
+
+        Args:
+            records (list): Dicts as returned by frame_to_records.
+
+        Returns:
+            The records of new and changed listings, in their original order.
+        """
+
+        ids = [str(listing_id(record.get(self.key))) for record in records]
+        with self._lock:
+            stored = self._stored(ids)
+
+            kept = []
+            for id_, record in zip(ids, records):
+                if id_ not in stored:
+                    self.stats["new"] += 1
+                elif stored[id_][0] != content_hash(record, self.columns):
+                    self.stats["changed"] += 1
+                else:
+                    self.stats["unchanged"] += 1
+                    continue
+                kept.append(record)
+        return kept
+
+    def commit(self, records, changed_at):
+        """Stores the state of rows the database confirmed.
+
+        Args:
+            records (list): Dicts written to the database.
+            changed_at (str): Timestamp stored with the deltas.
+
+        Returns:
+            A list of delta rows for the history table, one per listing whose stored state
+            differed: change_id, url(apt), changed_at and changes, a dict of
+            column -> [old, new]. New listings have no delta.
+        """
+
+        ids = [str(listing_id(record.get(self.key))) for record in records]
+        deltas = []
+        states = []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                stored = self._stored(ids)
+                for id_, record in zip(ids, records):
+                    # counts stay ints in the deltas; 3 == 3.0, so older float states still compare equal
+                    state = {column: _as_int(_normalize(record.get(column))) for column in self.columns}
+                    digest = content_hash(record, self.columns)
+                    states.append((self.operation, id_, digest, json.dumps(state), changed_at))
+
+                    if id_ in stored and stored[id_][0] != digest:
+                        old = json.loads(stored[id_][1])
+                        changes = {column: [old.get(column), value] for column, value in state.items()
+                                   if old.get(column) != value}
+                        deltas.append({"change_id": f"{id_}:{changed_at}", self.key: record.get(self.key),
+                                       "changed_at": changed_at, "changes": changes})
+
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO listing_states (operation, listing_id, hash, state, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    states)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return deltas
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,137 @@
+import json
+import os
+import time
+
+
+class Checkpoint:
+    """Append-only record of a crawl, so a crashed run can be resumed where it stopped.
+
+    Each run gets a directory holding a manifest.json with the run parameters and status,
+    a pages.jsonl with one line per finished page (its page number and enriched rows) and
+    a written.txt with the url of every row the database confirmed. Resuming skips the
+    pages in pages.jsonl and only replays the rows missing from written.txt.
+
+    Args:
+        directory (str): Directory of this run, usually <checkpoint_dir>/<run_id>.
+        manifest (dict): Run parameters and status.
+    """
+
+    def __init__(self, directory, manifest):
+        self.directory = directory
+        self.manifest = manifest
+        self.run_id = manifest["run_id"]
+
+    @classmethod
+    def create(cls, checkpoint_dir, operation, params):
+        """Starts the checkpoint of a new run.
+
+        Args:
+            checkpoint_dir (str): Directory holding every run.
+            operation (str): "buy" or "rent".
+            params (dict): JSON-serializable parameters of the run.
+
+        Returns:
+            A new Checkpoint.
+        """
+
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        base_id = f"{operation}-{time.strftime('%Y%m%d-%H%M%S')}"
+        run_id, suffix = base_id, 1
+        while True:
+            directory = os.path.join(checkpoint_dir, run_id)
+            try:
+                # runs started in the same second, e.g. by scheduler workers, get a suffix
+                os.mkdir(directory)
+                break
+            except FileExistsError:
+                suffix += 1
+                run_id = f"{base_id}-{suffix}"
+
+        checkpoint = cls(directory, {"run_id": run_id, "operation": operation, "status": "running", **params})
+        checkpoint._write_manifest()
+        return checkpoint
+
+    @classmethod
+    def open(cls, checkpoint_dir, run_id):
+        """Opens the checkpoint of an earlier run.
+
+        Raises:
+            ValueError: When no checkpoint exists for run_id.
+        """
+
+        directory = os.path.join(checkpoint_dir, run_id)
+        path = os.path.join(directory, "manifest.json")
+        if not os.path.exists(path):
+            raise ValueError(f"No checkpoint found for run {run_id!r} in {checkpoint_dir!r}.")
+        with open(path, encoding="utf-8") as f:
+            return cls(directory, json.load(f))
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _write_manifest(self):
+        self.manifest["updated_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        tmp = self._path("manifest.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self._path("manifest.json"))
+
+    @staticmethod
+    def _append(path, line):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _read_lines(self, name):
+        path = self._path(name)
+        if not os.path.exists(path):
+            return []
+        with open(path, encoding="utf-8") as f:
+            return [line for line in f.read().split("\n") if line]
+
+    def pages(self):
+        """Returns the finished pages as a list of dicts with page_num, url and rows."""
+
+        pages = []
+        for line in self._read_lines("pages.jsonl"):
+            try:
+                pages.append(json.loads(line))
+            except ValueError:
+                # a crash can leave the last line half written
+                continue
+        return pages
+
+    def pages_done(self):
+        """Returns the set of page numbers already finished."""
+
+        return {page["page_num"] for page in self.pages()}
+
+    def written(self):
+        """Returns the set of listing urls the database confirmed."""
+
+        return set(self._read_lines("written.txt"))
+
+    def pending_rows(self, key="url(apt)"):
+        """Returns the checkpointed rows the database has not confirmed yet."""
+
+        written = self.written()
+        return [row for page in self.pages() for row in page["rows"] if row.get(key) not in written]
+
+    def record_page(self, page_num, url, rows):
+        """Appends a finished page and its rows."""
+
+        self._append(self._path("pages.jsonl"),
+                     json.dumps({"page_num": page_num, "url": url, "rows": rows}, ensure_ascii=False))
+
+    def record_written(self, rows, key="url(apt)"):
+        """Appends the urls of rows the database confirmed."""
+
+        if rows:
+            self._append(self._path("written.txt"), "\n".join(str(row.get(key)) for row in rows))
+
+    def finish(self, status):
+        """Stores the final status of the run ("complete", "partial" or "failed") in the manifest."""
+
+        self.manifest["status"] = status
+        self._write_manifest()
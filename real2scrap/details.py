@@ -0,0 +1,280 @@
+import json
+import random
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from .geocoding import TokenBucket
+from .seen import listing_id
+
+# columns added to the rows of new listings by the detail pages
+DETAIL_COLUMNS = ("iptu(R$)", "floor", "amenities", "description", "published_at")
+
+_IPTU_RE = re.compile(r"IPTU\s*(?:R\$)?\s*([\d.]+)", re.I)
+_FLOOR_RE = re.compile(r"(\d+)\s*[º°o]?\s*andar\b|\bandar\s*:?\s*(\d+)", re.I)
+_PUBLISHED_RE = re.compile(r"publicado\s+(?:h[aá]\s+(\d+)\s+(dia|dias|m[eê]s|meses|ano|anos)|(hoje|ontem))", re.I)
+_LD_JSON_RE = re.compile(r'<script[^>]+type="application/ld\+json"[^>]*>(.*?)</script>', re.S | re.I)
+
+# where the listing pages keep the description and the amenities, newest layout first
+_DESCRIPTION_SELECTORS = ("#longDescription", '[data-qa="POSTING_DESCRIPTION"]', ".section-description")
+_AMENITY_SELECTORS = ("#section-general-features li", '[data-qa="POSTING_GENERAL_FEATURES"] li',
+                      ".general-features li", "#section-icon-features-property li")
+
+
+def _published_at(text, today):
+    match = _PUBLISHED_RE.search(text)
+    if match is None:
+        return None
+    number, unit, word = match.groups()
+    if word:
+        days = 0 if word.lower() == "hoje" else 1
+    else:
+        # months and years are rounded, the site only shows them for old listings anyway
+        days = int(number) * {"d": 1, "m": 30, "a": 365}[unit[0].lower()]
+    return (today - timedelta(days=days)).strftime("%Y-%m-%d")
+
+
+def parse_detail_page(html, today=None):
+    """Reads the fields the results cards do not show out of a listing page.
+
+    Structured data (JSON-LD) is used when the page has it, the rest is read from the
+    description and amenities blocks and from the page text.
+
+    Args:
+        html (str): Source of a listing page.
+        today (datetime, optional): Date "publicado há 3 dias" is counted from. Defaults to today in Brasilia.
+
+    Returns:
+        A dict with one value per DETAIL_COLUMNS: IPTU as a float, the floor as an int, the
+        amenities joined by "; ", the description and the publish date as YYYY-MM-DD. Fields
+        the page does not show are None.
+    """
+
+    from bs4 import BeautifulSoup
+
+    today = today or datetime.utcnow() - timedelta(hours=3)
+    soup = BeautifulSoup(html, "lxml")
+    text = soup.get_text("\n", strip=True)
+
+    structured = {}
+    for block in _LD_JSON_RE.findall(html):
+        try:
+            data = json.loads(block)
+        except ValueError:
+            continue
+        for item in data if isinstance(data, list) else [data]:
+            if isinstance(item, dict):
+                structured.update((key, value) for key, value in item.items() if key not in structured)
+
+    description = None
+    for selector in _DESCRIPTION_SELECTORS:
+        node = soup.select_one(selector)
+        if node is not None:
+            description = node.get_text("\n", strip=True)
+            break
+    description = description or structured.get("description") or None
+
+    amenities = []
+    for selector in _AMENITY_SELECTORS:
+        amenities = [node.get_text(" ", strip=True) for node in soup.select(selector)]
+        if amenities:
+            break
+
+    iptu = _IPTU_RE.search(text)
+    floor = _FLOOR_RE.search(text)
+    published = structured.get("datePosted") or _published_at(text, today)
+
+    return {
+        "iptu(R$)": float(iptu.group(1).replace(".", "")) if iptu else None,
+        "floor": int(floor.group(1) or floor.group(2)) if floor else None,
+        "amenities": "; ".join(amenities) or None,
+        "description": description,
+        "published_at": str(published)[:10] if published else None,
+    }
+
+
+class DetailCache:
+    """On-disk cache of parsed listing pages, keyed by listing id.
+
+    Args:
+        path (str, optional): SQLite file holding the cache.
+        ttl (float, optional): Seconds a parsed page stays valid.
+    """
+
+    def __init__(self, path="detail_cache.sqlite3", ttl=30 * 24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self.stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        # several worker processes may share the file
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS details ("
+            "listing_id TEXT PRIMARY KEY, fields TEXT NOT NULL, fetched_at REAL NOT NULL)")
+        self._conn.commit()
+
+    def lookup(self, url):
+        """Returns the cached fields of a listing, or None when they have to be fetched."""
+
+        with self._lock:
+            row = self._conn.execute("SELECT fields, fetched_at FROM details WHERE listing_id = ?",
+                                     (str(listing_id(url)),)).fetchone()
+            if row is not None and time.time() - row[1] < self.ttl:
+                self.stats["hits"] += 1
+                return json.loads(row[0])
+            self.stats["misses"] += 1
+            return None
+
+    def store(self, url, fields):
+        """Saves the parsed fields of a listing."""
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO details (listing_id, fields, fetched_at) VALUES (?, ?, ?)",
+                (str(listing_id(url)), json.dumps(fields, ensure_ascii=False), time.time()))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class HostRateLimiter:
+    """One token bucket per host, so every site gets at most `qps` requests per second.
+
+    Args:
+        qps (float): Requests per second allowed to each host.
+    """
+
+    def __init__(self, qps):
+        self.qps = qps
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, url):
+        """Blocks until the host of url may get another request."""
+
+        from urllib.parse import urlsplit
+
+        host = urlsplit(url).netloc
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(self.qps)
+        bucket.acquire()
+
+
+class DetailFetcher:
+    """Fetches and parses listing pages concurrently, for a whole run.
+
+    One HTTP client and one thread pool serve every call to fetch(), so connections to the
+    site are reused from page to page. Cached listings are answered right away; the others
+    are fetched from the pool, each host within the rate of the limiter. Timeouts, server
+    errors and throttling are retried with jittered backoff.
+
+    Args:
+        cache (DetailCache, optional): Cache to read from and fill.
+        workers (int, optional): Number of requests in flight.
+        limiter (HostRateLimiter, optional): Per-host rate limit. Defaults to 2 requests per second.
+        timeout (float, optional): Seconds allowed for each request.
+        retries (int, optional): Extra attempts for a page failing with a transient error.
+        backoff (float, optional): Base delay in seconds before a retry.
+        metrics (Metrics, optional): Receives the detail_requests and detail_errors counters.
+    """
+
+    def __init__(self, cache=None, workers=4, limiter=None, timeout=20, retries=1, backoff=1.0, metrics=None):
+        import httpx
+
+        from .http_engine import HEADERS
+
+        self.cache = cache
+        self.limiter = limiter or HostRateLimiter(2)
+        self.retries = retries
+        self.backoff = backoff
+        self.metrics = metrics
+        self._httpx = httpx
+        limits = httpx.Limits(max_connections=max(1, workers), max_keepalive_connections=max(1, workers))
+        self._client = httpx.Client(headers=HEADERS, timeout=timeout, limits=limits, follow_redirects=True)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers))
+
+    def _count(self, name):
+        if self.metrics is not None:
+            self.metrics.inc(name)
+
+    def _resolve(self, url):
+        if self.cache is not None:
+            fields = self.cache.lookup(url)
+            if fields is not None:
+                return fields
+
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire(url)
+            self._count("detail_requests")
+            transient = True
+            try:
+                response = self._client.get(url)
+            except self._httpx.HTTPError as e:
+                error = repr(e)
+            else:
+                if response.status_code == 200:
+                    break
+                error = f"HTTP {response.status_code}"
+                # a listing that is gone is not coming back
+                transient = response.status_code >= 500 or response.status_code == 429
+            if attempt == self.retries or not transient:
+                print(f"Could not fetch the details of {url}: {error}")
+                self._count("detail_errors")
+                return None
+            time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+        fields = parse_detail_page(response.text)
+        if self.cache is not None:
+            self.cache.store(url, fields)
+        return fields
+
+    def fetch(self, urls):
+        """Fetches the details of listings.
+
+        Args:
+            urls (list): Listing pages, the url(apt) of the rows.
+
+        Returns:
+            A list with the fields of each url, in the same order as urls, None for the pages
+            that could not be fetched.
+        """
+
+        return list(self._executor.map(self._resolve, urls))
+
+    def close(self):
+        """Stops the pool and closes the client."""
+
+        self._executor.shutdown()
+        self._client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def fetch_details(urls, cache=None, workers=4, limiter=None, timeout=20, retries=1, backoff=1.0, metrics=None):
+    """Fetches and parses listing pages concurrently, with a DetailFetcher of its own.
+
+    Args:
+        urls (list): Listing pages, the url(apt) of the rows.
+        cache, workers, limiter, timeout, retries, backoff, metrics: See DetailFetcher.
+
+    Returns:
+        A list with the fields of each url, in the same order as urls, None for the pages
+        that could not be fetched.
+    """
+
+    if not urls:
+        return []
+    with DetailFetcher(cache, workers, limiter, timeout, retries, backoff, metrics) as fetcher:
+        return fetcher.fetch(urls)
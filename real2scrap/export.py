@@ -0,0 +1,183 @@
+import os
+
+# compact dtypes of the exported files, the other columns stay as they are
+EXPORT_DTYPES = {
+    "price(R$)": "float64",
+    "condo(R$)": "float32",
+    "district": "category",
+    "area(m²)": "float32",
+    "bedroom": "Int8",
+    "bathrooms": "Int8",
+    "parkings": "Int8",
+    "regional": "category",
+    "lat": "float32",
+    "lng": "float32",
+    "geocode_confidence": "float32",
+    "iptu(R$)": "float32",
+    "floor": "Int16",
+}
+
+FORMATS = ("parquet", "csv")
+
+
+def compact_frame(frame):
+    """Casts the scraped columns to the dtypes in EXPORT_DTYPES.
+
+    Districts and regionals repeat a handful of values, so they become categoricals; counts
+    fit in 8 bits and coordinates in float32, which is about a metre at this latitude.
+
+    Args:
+        frame (DataFrame): Rows as built by rows_to_frame.
+
+    Returns:
+        A new DataFrame with compact dtypes.
+    """
+
+    import pandas as pd
+
+    frame = frame.copy()
+    for column, dtype in EXPORT_DTYPES.items():
+        if column not in frame:
+            continue
+        if dtype == "category":
+            frame[column] = frame[column].astype("category")
+        else:
+            # columns with missing values come as object, to_numeric makes them NaN before the nullable cast
+            frame[column] = pd.to_numeric(frame[column], errors="coerce").astype(dtype)
+    return frame
+
+
+def _arrow_schema(columns):
+    import pyarrow as pa
+
+    # fixed up front, so a page where a column is all empty cannot change the file schema
+    types = {
+        "float64": pa.float64(),
+        "float32": pa.float32(),
+        "Int8": pa.int8(),
+        "Int16": pa.int16(),
+        "category": pa.dictionary(pa.int32(), pa.string()),
+    }
+    return pa.schema([(column, types.get(EXPORT_DTYPES.get(column), pa.string())) for column in columns])
+
+
+class ExportWriter:
+    """Streams scraped rows to a local Parquet or CSV file while the crawl runs.
+
+    Rows are buffered up to `chunk_size` and then written as one Parquet row group or one
+    CSV chunk, so memory stays flat no matter how many pages are crawled, and the row groups
+    are large enough for analytics tools to read the file quickly.
+
+    With append, the rows go after the ones of an existing file, e.g. the export of the run
+    being resumed, whose checkpointed pages are not scraped again. A Parquet file cannot
+    grow in place, so its row groups are copied into a new file that replaces it on close.
+
+    Args:
+        path (str): File to write. An existing file is replaced, unless append is set.
+        format (str, optional): "parquet" or "csv". Defaults to the extension of path.
+        chunk_size (int, optional): Rows per row group or CSV chunk.
+        append (bool, optional): Keep the rows of an existing file.
+    """
+
+    def __init__(self, path, format=None, chunk_size=10000, append=False):
+        if format is None:
+            format = os.path.splitext(path)[1].lstrip(".").lower()
+        if format not in FORMATS:
+            raise ValueError(f"Invalid export format. Must be one of {', '.join(FORMATS)}.")
+
+        self.path = path
+        self.format = format
+        self.chunk_size = chunk_size
+        self.append = append and os.path.exists(path) and os.path.getsize(path) > 0
+        self.rows = 0
+        self.chunks = 0
+        self._buffer = []
+        self._buffered = 0
+        self._schema = None
+        self._writer = None
+        self._replaces = None
+
+    def write(self, frame):
+        """Buffers the rows of a page, writing a chunk once chunk_size rows are waiting."""
+
+        if frame.empty:
+            return
+        self._buffer.append(frame)
+        self._buffered += len(frame)
+        if self._buffered >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered rows."""
+
+        import pandas as pd
+
+        if not self._buffer:
+            return
+        frame = compact_frame(pd.concat(self._buffer, ignore_index=True))
+        self._buffer = []
+        self._buffered = 0
+
+        if self.format == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            if self._writer is None:
+                self._open_parquet(frame.columns)
+            self._writer.write_table(pa.Table.from_pandas(frame, schema=self._schema, preserve_index=False))
+        else:
+            first = self.chunks == 0 and not self.append
+            frame.to_csv(self.path, mode="w" if first else "a", header=first, index=False)
+
+        self.rows += len(frame)
+        self.chunks += 1
+
+    def _open_parquet(self, columns):
+        import pyarrow.parquet as pq
+
+        existing = None
+        if self.append:
+            try:
+                existing = pq.ParquetFile(self.path)
+            except Exception as e:
+                # e.g. the interrupted run was killed before it closed the file
+                print(f"Could not read {self.path}, starting it over: {e}")
+
+        self._schema = existing.schema_arrow if existing is not None else _arrow_schema(columns)
+        target = self.path + ".tmp" if existing is not None else self.path
+        self._writer = pq.ParquetWriter(target, self._schema, compression="zstd")
+        if existing is not None:
+            for group in range(existing.num_row_groups):
+                self._writer.write_table(existing.read_row_group(group))
+            self._replaces = target
+
+    def close(self):
+        """Writes what is left and closes the file."""
+
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._replaces is not None:
+            os.replace(self._replaces, self.path)
+            self._replaces = None
+
+
+def read_export(path, columns=None):
+    """Loads a file written by ExportWriter with its compact dtypes.
+
+    Args:
+        path (str): Parquet or CSV file.
+        columns (list, optional): Columns to load. Parquet only reads those from disk.
+
+    Returns:
+        A DataFrame.
+    """
+
+    import pandas as pd
+
+    if path.lower().endswith(".parquet"):
+        frame = pd.read_parquet(path, columns=columns)
+        # nullable integer columns come back as float64 without the pandas metadata
+        return frame.astype({column: dtype for column, dtype in EXPORT_DTYPES.items() if column in frame})
+    return pd.read_csv(path, usecols=columns, dtype=EXPORT_DTYPES)
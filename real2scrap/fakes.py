@@ -0,0 +1,152 @@
+import random
+import threading
+import time
+
+from .geocoding import RateLimitError
+from .sink import POSTGREST_RESERVED
+
+
+class FakeGeocoder:
+    """Offline stand-in for googlemaps.Client, with simulated latency and rate limiting.
+
+    Every address resolves to a stable point derived from its hash, except the ones listed
+    in `unknown`, which return no result like the real API does.
+
+    Args:
+        latency (float, optional): Seconds each geocode call takes.
+        error_rate (float, optional): Fraction of calls failing with RateLimitError.
+        max_qps (float, optional): Calls per second above which RateLimitError is raised.
+        unknown (set, optional): Addresses that return no result.
+        seed (int, optional): Seed for the simulated errors.
+    """
+
+    def __init__(self, latency=0.05, error_rate=0.0, max_qps=None, unknown=(), seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.max_qps = max_qps
+        self.unknown = set(unknown)
+        self.calls = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._recent = []
+        self._lock = threading.Lock()
+
+    def geocode(self, address):
+        with self._lock:
+            self.calls += 1
+            now = time.monotonic()
+            self._recent = [t for t in self._recent if now - t < 1.0]
+            self._recent.append(now)
+            limited = self.max_qps is not None and len(self._recent) > self.max_qps
+            if limited or self._random.random() < self.error_rate:
+                self.errors += 1
+                raise RateLimitError("OVER_QUERY_LIMIT")
+
+        time.sleep(self.latency)
+
+        if address in self.unknown:
+            return []
+        digest = hash(address) & 0xFFFFFF
+        lat = -19.80 - (digest % 1000) / 5000
+        lng = -43.85 + (digest // 1000 % 1000) / 5000
+        return [{"geometry": {"location": {"lat": lat, "lng": lng}}}]
+
+
+class _FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class _FakeQuery:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self._action = None
+        self._range = None
+
+    def upsert(self, rows, on_conflict=None):
+        self._action = ("upsert", rows if isinstance(rows, list) else [rows], on_conflict)
+        return self
+
+    def insert(self, rows):
+        self._action = ("insert", rows if isinstance(rows, list) else [rows], None)
+        return self
+
+    def select(self, columns="*"):
+        self._action = ("select", None, None)
+        return self
+
+    def range(self, start, end):
+        self._range = (start, end)
+        return self
+
+    def execute(self):
+        response = self.client._execute(self.table, *self._action)
+        if self._range is not None:
+            response.data = response.data[self._range[0]:self._range[1] + 1]
+        return response
+
+
+def _parse_column(name):
+    # PostgREST only accepts reserved characters in a double-quoted column name
+    if len(name) > 1 and name[0] == name[-1] == '"':
+        return name[1:-1].replace('\\"', '"')
+    if set(name) & POSTGREST_RESERVED:
+        raise ValueError(f'"failed to parse columns parameter ({name})", code PGRST100')
+    return name
+
+
+class FakeSupabase:
+    """In-memory stand-in for the supabase client, following PostgREST upsert semantics.
+
+    Rows upserted with on_conflict update the columns they carry in the stored row with the
+    same value in that column; other rows get a new id. on_conflict is parsed like PostgREST
+    does, so a column name with reserved characters has to be double-quoted. Each request
+    waits `latency` seconds and fails with `error_rate` probability, or always when a row has
+    a key listed in `reject`.
+
+    Args:
+        latency (float, optional): Seconds each request takes.
+        error_rate (float, optional): Fraction of requests failing.
+        reject (set, optional): on_conflict values the database refuses.
+        seed (int, optional): Seed for the simulated errors.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, reject=(), seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.reject = set(reject)
+        self.tables = {}
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def table(self, name):
+        return _FakeQuery(self, name)
+
+    def _execute(self, table, action, rows, on_conflict):
+        time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+            stored = self.tables.setdefault(table, [])
+            if action == "select":
+                return _FakeResponse([dict(row) for row in stored])
+
+            if on_conflict is not None:
+                on_conflict = _parse_column(on_conflict)
+            if self._random.random() < self.error_rate:
+                raise ConnectionError("simulated PostgREST failure")
+            if on_conflict is not None and any(row.get(on_conflict) in self.reject for row in rows):
+                raise ValueError("simulated constraint violation")
+
+            index = {row.get(on_conflict): i for i, row in enumerate(stored)} if on_conflict else {}
+            for row in rows:
+                row = dict(row)
+                if on_conflict is not None and row.get(on_conflict) in index:
+                    i = index[row[on_conflict]]
+                    stored[i] = {**stored[i], **row}
+                else:
+                    row["id"] = len(stored) + 1
+                    index[row.get(on_conflict)] = len(stored)
+                    stored.append(row)
+            return _FakeResponse(rows)
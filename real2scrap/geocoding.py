@@ -0,0 +1,372 @@
+import random
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+# abbreviations of street types seen on the listings, spelled out by normalize_address
+STREET_TYPES = {"r": "rua", "av": "avenida", "al": "alameda", "pc": "praca", "pca": "praca", "tv": "travessa",
+                "trav": "travessa", "rod": "rodovia", "est": "estrada"}
+_ABBREV_RE = re.compile(r"^(" + "|".join(STREET_TYPES) + r")(?:\.\s*|\s+)")
+
+# words left out when street names are compared
+_STOPWORDS = {"de", "da", "do", "das", "dos", "e"}
+
+
+def normalize_address(address):
+    """Turns an address into the key used by the geocoding cache.
+
+    Accents, case and repeated spaces/commas are dropped and abbreviated street types are
+    spelled out ("R." and "Av." become "rua" and "avenida"), so trivial variants of the
+    same address share a cache entry.
+
+    Args:
+        address (str): Address as sent to the geocoding API.
+
+    Returns:
+        The normalized address string.
+    """
+
+    from unidecode import unidecode
+
+    address = unidecode(str(address)).lower()
+    address = re.sub(r"\s*,\s*", ", ", address)
+    address = re.sub(r"\s+", " ", address).strip(" ,")
+    return _ABBREV_RE.sub(lambda m: STREET_TYPES[m.group(1)] + " ", address)
+
+
+@lru_cache(maxsize=65536)
+def _split_address(address):
+    # "rua antonio de albuquerque 300, savassi, belo horizonte" ->
+    # (("rua", ("300",), "savassi, belo horizonte"), "albuquerque antonio")
+    # numbers (house numbers, "rua 7 de setembro") are part of the group, so they only ever
+    # match exactly; only the words of the street name are compared with a fuzzy score
+    street, _, rest = normalize_address(address).partition(", ")
+    words = street.split()
+    kind = words.pop(0) if words and words[0] in set(STREET_TYPES.values()) else ""
+    numbers = tuple(word for word in words if any(char.isdigit() for char in word))
+    name = " ".join(sorted(word for word in words if word not in _STOPWORDS and word not in numbers))
+    return (kind, numbers, rest), name
+
+
+class GeocodeCache:
+    """On-disk cache of geocoding results, keyed by normalized address.
+
+    Addresses the API could not resolve are cached too (negative caching), with their own
+    and usually shorter time to live, so they are not paid for on every run.
+
+    Args:
+        path (str, optional): SQLite file holding the cache.
+        ttl (float, optional): Seconds a resolved address stays valid.
+        negative_ttl (float, optional): Seconds an unresolved address stays valid.
+    """
+
+    def __init__(self, path="geocode_cache.sqlite3", ttl=90 * 24 * 3600, negative_ttl=7 * 24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stats = {"hits": 0, "negative_hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        # several worker processes may share the file
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS geocode ("
+            "address TEXT PRIMARY KEY, lat REAL, lng REAL, fetched_at REAL NOT NULL)")
+        self._conn.commit()
+
+    def lookup(self, address):
+        """Looks an address up in the cache.
+
+        Args:
+            address (str): Address as sent to the geocoding API.
+
+        Returns:
+            A tuple (found, location). found is False when the address has to be geocoded;
+            otherwise location is a (lat, lng) tuple, or None for a cached miss.
+        """
+
+        key = normalize_address(address)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT lat, lng, fetched_at FROM geocode WHERE address = ?", (key,)).fetchone()
+
+            if row is not None:
+                lat, lng, fetched_at = row
+                age = time.time() - fetched_at
+                if lat is None and age < self.negative_ttl:
+                    self.stats["negative_hits"] += 1
+                    return True, None
+                if lat is not None and age < self.ttl:
+                    self.stats["hits"] += 1
+                    return True, (lat, lng)
+
+            self.stats["misses"] += 1
+            return False, None
+
+    def resolved(self):
+        """Returns the (address, lat, lng) of every address resolved within the ttl."""
+
+        with self._lock:
+            return self._conn.execute(
+                "SELECT address, lat, lng FROM geocode WHERE lat IS NOT NULL AND fetched_at >= ?",
+                (time.time() - self.ttl,)).fetchall()
+
+    def store(self, address, location):
+        """Saves the geocoding result of an address.
+
+        Args:
+            address (str): Address as sent to the geocoding API.
+            location (tuple): (lat, lng) tuple, or None when the API returned nothing.
+        """
+
+        lat, lng = location if location is not None else (None, None)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocode (address, lat, lng, fetched_at) VALUES (?, ?, ?, ?)",
+                (normalize_address(address), lat, lng, time.time()))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class AddressIndex:
+    """In-memory index of resolved addresses, answering near-duplicates without the API.
+
+    Addresses are grouped by street type, numbers and what follows the street (district and
+    city), and compared on their street name without stopwords and with its words sorted,
+    so "R. Antônio de Albuquerque" finds "Rua Antonio Albuquerque" with a dict lookup, and
+    a misspelled name is matched with rapidfuzz against the streets of the same district
+    and house number only; "Afonso Pena 3500" never takes the location of "Afonso Pena 1500".
+    Every match comes with a confidence between 0 and 1.
+
+    Args:
+        entries (iterable, optional): (address, lat, lng) tuples, e.g. GeocodeCache.resolved().
+    """
+
+    def __init__(self, entries=()):
+        self._exact = {}
+        self._groups = {}
+        self._lock = threading.Lock()
+        for address, lat, lng in entries:
+            self.add(address, (lat, lng))
+
+    @classmethod
+    def from_cache(cls, cache):
+        """Builds the index from the addresses a GeocodeCache resolved."""
+
+        return cls(cache.resolved())
+
+    def __len__(self):
+        return len(self._exact)
+
+    def add(self, address, location):
+        """Adds a resolved address. Addresses without a location are ignored."""
+
+        if location is None:
+            return
+        group, name = _split_address(address)
+        with self._lock:
+            if (group, name) not in self._exact:
+                self._groups.setdefault(group, {})[name] = location
+            self._exact[group, name] = location
+
+    def lookup(self, address, min_confidence=0.9):
+        """Finds the location of an address or of its closest indexed variant.
+
+        Args:
+            address (str): Address as sent to the geocoding API.
+            min_confidence (float, optional): Lowest confidence accepted for a fuzzy match.
+
+        Returns:
+            A tuple (location, confidence): the (lat, lng) of the match and 1.0 for an
+            exact match, or (None, 0.0) when nothing is close enough.
+        """
+
+        group, name = _split_address(address)
+        location = self._exact.get((group, name))
+        if location is not None:
+            return location, 1.0
+
+        from rapidfuzz import fuzz, process
+
+        # a street name without words, or a district without streets, has nothing to compare
+        names = self._groups.get(group)
+        if not name or not names:
+            return None, 0.0
+        with self._lock:
+            match = process.extractOne(name, list(names), scorer=fuzz.ratio, score_cutoff=min_confidence * 100)
+        if match is None:
+            return None, 0.0
+        return names[match[0]], match[1] / 100
+
+
+class RateLimitError(Exception):
+    """Raised by a geocoding client refusing a request over its quota; geocode_batch retries it."""
+
+
+def _to_location(geocode_result):
+    if not geocode_result:
+        return None
+    point = geocode_result[0]['geometry']['location']
+    return (point['lat'], point['lng'])
+
+
+class TokenBucket:
+    """Thread-safe token bucket limiting how many calls per second reach an API.
+
+    Args:
+        rate (float): Tokens added per second, i.e. the sustained queries per second.
+        capacity (float, optional): Largest burst allowed. Defaults to rate.
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("The rate must be greater than zero.")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available and takes it."""
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def _transient_errors():
+    errors = (ConnectionError, TimeoutError, RateLimitError)
+    try:
+        # HTTPError is a TransportError; _OverQueryLimit is what the client raises past its own retries
+        from googlemaps.exceptions import Timeout, TransportError, _OverQueryLimit
+    except ImportError:
+        return errors
+    return errors + (Timeout, TransportError, _OverQueryLimit)
+
+
+def geocode_batch(client, addresses, cache=None, workers=8, qps=10, retries=3, backoff=0.5, transient=None,
+                  metrics=None, index=None, min_confidence=0.9, fallback_confidence=0.75, bucket=None,
+                  with_confidence=False):
+    """Geocodes a batch of addresses concurrently, within the API quota.
+
+    Cached addresses, and then addresses close enough to one already resolved in the index,
+    are answered right away; the others are sent to the client from a thread pool,
+    throttled by a token bucket. Transient errors are retried with jittered exponential
+    backoff. Each distinct address is geocoded at most once per batch. An address the API
+    cannot resolve takes the location of its closest indexed variant, if one reaches
+    fallback_confidence.
+
+    Args:
+        client: Object with a googlemaps-like geocode(address) method.
+        addresses (list): Addresses to geocode.
+        cache (GeocodeCache, optional): Cache to read from and fill.
+        workers (int, optional): Number of requests in flight.
+        qps (float, optional): Maximum queries per second sent to the client, when no bucket is given.
+        retries (int, optional): Extra attempts for an address hitting a transient error.
+        backoff (float, optional): Base delay in seconds before the first retry.
+        transient (tuple, optional): Exception types worth a retry. Defaults to connection
+                                     errors, timeouts, the googlemaps transport, timeout and
+                                     quota errors, and RateLimitError.
+        metrics (Metrics, optional): Receives the geocode_requests, geocode_retries, geocode_errors,
+                                     geocode_index_hits and geocode_index_fallbacks counters, and one
+                                     geocode_index_confidence_<band> counter per answer of the index,
+                                     band being the confidence rounded down to a tenth (100, 90, ...).
+        index (AddressIndex, optional): Resolved addresses consulted for the addresses missing from the
+                                        cache, and filled with the new results.
+        min_confidence (float, optional): Lowest index match confidence used instead of the client.
+        fallback_confidence (float, optional): Lowest index match confidence used when the client
+                                               returns nothing.
+        bucket (TokenBucket, optional): Rate limiter shared by every batch of a run, so the quota
+                                        holds across batches. Defaults to a new bucket of qps.
+        with_confidence (bool, optional): Return a (location, confidence) tuple per address.
+
+    Returns:
+        A list with a (lat, lng) tuple, or None, for each address, in the same order as addresses.
+        With with_confidence, a list of (location, confidence) tuples instead: 1.0 for a location
+        from the API or the cache, the match score for one taken from an indexed variant, and
+        None without a location.
+    """
+
+    transient = transient if transient is not None else _transient_errors()
+    bucket = bucket or TokenBucket(qps)
+
+    def count(name):
+        if metrics is not None:
+            metrics.inc(name)
+
+    def from_index(address, threshold, counter):
+        if index is None:
+            return None, None
+        location, confidence = index.lookup(address, threshold)
+        if location is None:
+            return None, None
+        count(counter)
+        count(f"geocode_index_confidence_{int(confidence * 10) * 10}")
+        return location, confidence
+
+    def fallback(address):
+        # the API has no result, a close enough variant is better than no location
+        return from_index(address, fallback_confidence, "geocode_index_fallbacks")
+
+    def resolve(address):
+        if cache is not None:
+            found, location = cache.lookup(address)
+            if found:
+                return (location, 1.0) if location is not None else fallback(address)
+
+        # a variant of an address resolved before saves a request
+        location, confidence = from_index(address, min_confidence, "geocode_index_hits")
+        if location is not None:
+            return location, confidence
+
+        for attempt in range(retries + 1):
+            bucket.acquire()
+            count("geocode_requests")
+            try:
+                geocode_result = client.geocode(address)
+                break
+            except transient as e:
+                if attempt == retries:
+                    print(f"Could not geocode {address}: {e}")
+                    count("geocode_errors")
+                    return None, None
+                count("geocode_retries")
+                time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+            except Exception as e:
+                print(f"Could not geocode {address}: {e}")
+                count("geocode_errors")
+                return None, None
+
+        location = _to_location(geocode_result)
+        if cache is not None:
+            cache.store(address, location)
+        if location is None:
+            return fallback(address)
+        if index is not None:
+            index.add(address, location)
+        return location, 1.0
+
+    # the same building shows up several times in a batch, ask for it once
+    unique = {}
+    for address in addresses:
+        unique.setdefault(normalize_address(address), address)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        resolved = dict(zip(unique, executor.map(resolve, unique.values())))
+
+    results = [resolved[normalize_address(address)] for address in addresses]
+    return results if with_confidence else [location for location, _ in results]
@@ -0,0 +1,302 @@
+import json
+import re
+import time
+
+from .browser import CARD_FIELDS
+from .throttle import THROTTLE_STATUSES
+
+
+_CARD_SELECTOR = '[data-qa="posting PROPERTY"]'
+
+# window.__PRELOADED_STATE__ = {...}; as rendered by the listing pages
+_STATE_RE = re.compile(r"window\.__PRELOADED_STATE__\s*=\s*(\{.*?\})\s*;?\s*</script>", re.S)
+
+# what a captcha or bot wall says instead of showing cards
+_BLOCKED_RE = re.compile(r"captcha|cf-chl|challenge-platform|access denied", re.I)
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+                  "Chrome/87.0.4280.141 Safari/537.36",
+    "Accept-Language": "pt-BR,pt;q=0.9",
+}
+
+
+def _text(node):
+    # mimics WebElement.text: one line per block of text
+    return node.get_text("\n", strip=True) if node is not None else ""
+
+
+def _cards_from_html(soup):
+    cards = {field: [] for field in CARD_FIELDS}
+
+    for card in soup.select(_CARD_SELECTOR):
+        img = card.select_one(".flickity-slider img:first-child")
+        cards["address"].append(_text(card.select_one(".sc-ge2uzh-0")))
+        cards["features"].append(_text(card.select_one('[data-qa="POSTING_CARD_FEATURES"]')))
+        cards["condo"].append(_text(card.select_one(".sc-12dh9kl-0")))
+        cards["location"].append(_text(card.select_one('[data-qa="POSTING_CARD_LOCATION"]')))
+        cards["image"].append((img.get("src") or None) if img is not None else None)
+        cards["posting"].append(card.get("data-to-posting", ""))
+
+    return cards
+
+
+def _find_postings(state):
+    # the postings list sits at different depths depending on the page version
+    if isinstance(state, dict):
+        if "postingId" in state and "url" in state:
+            return [state]
+        if isinstance(state.get("listPostings"), list):
+            return [p for p in state["listPostings"] if isinstance(p, dict)]
+        values = state.values()
+    elif isinstance(state, list):
+        values = state
+    else:
+        return []
+
+    found = []
+    for value in values:
+        found.extend(_find_postings(value))
+    return found
+
+
+def _cards_from_state(state):
+    cards = {field: [] for field in CARD_FIELDS}
+
+    for posting in _find_postings(state):
+        operations = posting.get("priceOperationTypes") or [{}]
+        prices = operations[0].get("prices") or [{}]
+        price = prices[0].get("amount")
+        expenses = (posting.get("expenses") or {}).get("amount")
+        condo = f"R$ {price}" if price is not None else ""
+        if expenses is not None:
+            condo += f"\nCondominio R$ {expenses}"
+
+        location = posting.get("postingLocation") or {}
+        district = (location.get("location") or {}).get("name", "")
+        city = ((location.get("location") or {}).get("parent") or {}).get("name", "")
+        address = (location.get("address") or {}).get("name", "")
+
+        features = []
+        for feature in (posting.get("mainFeatures") or {}).values():
+            value, label = feature.get("value"), (feature.get("label") or "").lower()
+            if value is None:
+                continue
+            if feature.get("measure"):
+                features.append(f"{value} {feature['measure']}")
+            elif "quarto" in label:
+                features.append(f"{value} quartos")
+            elif "banheiro" in label:
+                features.append(f"{value} ban")
+            elif "vaga" in label:
+                features.append(f"{value} vagas")
+
+        pictures = (posting.get("visiblePictures") or {}).get("pictures") or [{}]
+
+        cards["address"].append(f"{address}\n{district}, {city}" if address else "")
+        cards["features"].append("\n".join(features))
+        cards["condo"].append(condo)
+        cards["location"].append(f"{district}, {city}" if district else "")
+        cards["image"].append(pictures[0].get("url730x532") or pictures[0].get("url360x266"))
+        cards["posting"].append(posting.get("url", ""))
+
+    return cards
+
+
+def parse_listing_page(html):
+    """Reads the property cards of a results page without a browser.
+
+    The cards are read from the static HTML when they are there, otherwise from the
+    JSON state embedded in the page.
+
+    Args:
+        html (str): Source of a results page.
+
+    Returns:
+        A dict with the same raw lists _scrape_page reads through Selenium, one entry per card.
+    """
+
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "lxml")
+    cards = _cards_from_html(soup)
+
+    if not cards["posting"]:
+        match = _STATE_RE.search(html)
+        if match:
+            try:
+                cards = _cards_from_state(json.loads(match.group(1)))
+            except ValueError:
+                pass
+
+    return cards
+
+
+def _count_cards(html):
+    # cheap count taken before parsing, enough to tell an empty page from a full one
+    return html.count('data-qa="posting PROPERTY"') or html.count('"postingId"')
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_page(html, elapsed, size):
+    if html is None:
+        return None
+    start_time = time.time()
+    page = parse_listing_page(html)
+    if not page["posting"]:
+        return None
+    page["extract"] = time.time() - start_time
+    page["elapsed"] = elapsed + page["extract"]
+    page["load"] = {"wait": elapsed, "cards": len(page["posting"]), "timed_out": False, "polls": 0}
+    page["round_trips"] = 0
+    page["bytes"] = size
+    return page
+
+
+class HttpFetcher:
+    """Fetches results pages over plain HTTP for a whole crawl, with bounded concurrency.
+
+    One event loop runs in a background thread with one pooled client, so connections are
+    reused from the first page to the last, and every page is fetched and parsed on its own:
+    submit() returns right away and a slow page never holds back the ones submitted after it.
+
+    Args:
+        concurrency (int, optional): Maximum number of requests in flight.
+        timeout (float, optional): Seconds allowed for each request.
+        controller (AdaptiveConcurrency, optional): Adapts the requests in flight, up to concurrency,
+                                                    to how the site responds, and decides on retries.
+    """
+
+    def __init__(self, concurrency=16, timeout=20, controller=None):
+        import asyncio
+        import threading
+
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.controller = controller
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._open(), self._loop).result()
+
+    async def _open(self):
+        import asyncio
+        import httpx
+
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        self._client = httpx.AsyncClient(headers=HEADERS, limits=limits, timeout=self.timeout,
+                                         follow_redirects=True)
+
+    async def _get(self, url):
+        import asyncio
+        import httpx
+
+        start_time = time.time()
+        try:
+            # httpx timeouts only bound each read, a trickling page gets a deadline too
+            response = await asyncio.wait_for(self._client.get(url), self.timeout)
+        except (httpx.HTTPError, asyncio.TimeoutError) as e:
+            print(f"Could not fetch {url}: {e!r}")
+            return None, time.time() - start_time, 0, None, None
+        if response.status_code != 200:
+            print(f"Could not fetch {url}: HTTP {response.status_code}")
+            return (None, time.time() - start_time, response.num_bytes_downloaded, response.status_code,
+                    _retry_after(response))
+        return response.text, time.time() - start_time, response.num_bytes_downloaded, 200, None
+
+    async def _fetch(self, url):
+        controller = self.controller
+        while True:
+            async with self._semaphore:
+                started = await controller.acquire_async() if controller is not None else None
+                html, elapsed, size, status, retry_after = await self._get(url)
+            if controller is None:
+                return html, elapsed, size, status
+
+            cards = _count_cards(html) if html is not None else None
+            blocked = cards == 0 and bool(_BLOCKED_RE.search(html))
+            controller.release(started, elapsed, cards=cards, status=status, blocked=blocked,
+                               retry_after=retry_after)
+
+            # timeouts, server errors and throttling are worth another try, a 404 is not
+            retryable = blocked or status is None or status >= 500 or status in THROTTLE_STATUSES
+            if (html is None or blocked) and retryable and controller.allow_retry():
+                print(f"Retrying {url}")
+                continue
+            return (None if blocked else html), elapsed, size, status
+
+    async def _fetch_page(self, url):
+        html, elapsed, size, status = await self._fetch(url)
+        # parsing runs off the loop, which keeps serving the other requests meanwhile
+        page = await self._loop.run_in_executor(None, _to_page, html, elapsed, size)
+        # a page that is not there (404 past the last page) is not there for a browser either
+        gone = status is not None and 400 <= status < 500 and status not in THROTTLE_STATUSES
+        return page, page is None and not gone
+
+    def submit(self, url):
+        """Starts fetching a page.
+
+        Returns:
+            A concurrent.futures.Future with a tuple (page, browse): the page dict, or None when
+            the page could not be fetched or had no cards; browse tells whether the page is worth
+            a try with Selenium, i.e. it did not fail with a client error like 404.
+        """
+
+        import asyncio
+
+        return asyncio.run_coroutine_threadsafe(self._fetch_page(url), self._loop)
+
+    async def _close(self):
+        import asyncio
+
+        # pages nobody is going to read
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._client.aclose()
+
+    def close(self):
+        """Cancels the pages still in flight and stops the client and its loop."""
+
+        import asyncio
+
+        if self._loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(self._close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def scrape_pages_http(urls, concurrency=16, timeout=20, controller=None):
+    """Fetches and parses results pages over plain HTTP with bounded concurrency.
+
+    Args:
+        urls (list): Results pages to fetch.
+        concurrency (int, optional): Maximum number of requests in flight.
+        timeout (float, optional): Seconds allowed for each request.
+        controller (AdaptiveConcurrency, optional): Adapts the requests in flight, up to concurrency,
+                                                    to how the site responds, and decides on retries.
+
+    Returns:
+        A list with one page dict per url, in the same order as urls, None for the pages that
+        could not be fetched or had no cards without JavaScript.
+    """
+
+    with HttpFetcher(concurrency, timeout, controller) as fetcher:
+        futures = [fetcher.submit(url) for url in urls]
+        return [future.result()[0] for future in futures]
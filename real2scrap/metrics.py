@@ -0,0 +1,160 @@
+import bisect
+import contextlib
+import heapq
+import json
+import os
+import threading
+import time
+
+# seconds, wide enough for a page waiting on its timeout
+DEFAULT_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60)
+
+
+class Metrics:
+    """Thread-safe counters, gauges, stage timers and latency histograms for one run.
+
+    The pipeline stages and helpers record into it while the crawl runs; summary() gives a
+    JSON-ready snapshot, which can be written as JSON or as a Prometheus textfile.
+
+    Args:
+        buckets (tuple, optional): Upper bounds, in seconds, of the histogram buckets.
+        slowest (int, optional): Number of slowest pages kept, to point at the pages to look at.
+        prefix (str, optional): Prefix of the Prometheus metric names.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, slowest=5, prefix="real2scrap"):
+        self.buckets = tuple(sorted(buckets))
+        self.slowest = slowest
+        self.prefix = prefix
+        self.counters = {}
+        self.gauges = {}
+        self.timers = {}
+        self.histograms = {}
+        self._slow_pages = []
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1):
+        """Adds value to a counter."""
+
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value):
+        """Sets a gauge, a value that can go down as well as up."""
+
+        with self._lock:
+            self.gauges[name] = value
+
+    def add_time(self, name, seconds):
+        """Adds the seconds of one call to a stage timer."""
+
+        with self._lock:
+            timer = self.timers.setdefault(name, {"count": 0, "sum": 0.0, "max": 0.0})
+            timer["count"] += 1
+            timer["sum"] += seconds
+            timer["max"] = max(timer["max"], seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """Times the body of a with block into a stage timer."""
+
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start_time)
+
+    def observe(self, name, seconds):
+        """Records one value in a histogram."""
+
+        with self._lock:
+            histogram = self.histograms.setdefault(
+                name, {"buckets": [0] * (len(self.buckets) + 1), "count": 0, "sum": 0.0})
+            histogram["buckets"][bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+
+    def observe_page(self, page_num, url, seconds):
+        """Records the latency of a page and keeps track of the slowest ones."""
+
+        self.observe("page_seconds", seconds)
+        with self._lock:
+            entry = (seconds, page_num, url)
+            if len(self._slow_pages) < self.slowest:
+                heapq.heappush(self._slow_pages, entry)
+            else:
+                heapq.heappushpop(self._slow_pages, entry)
+
+    def summary(self):
+        """Returns a JSON-ready snapshot of every metric."""
+
+        with self._lock:
+            histograms = {}
+            for name, histogram in self.histograms.items():
+                # cumulative counts per upper bound, like Prometheus buckets
+                cumulative, total = {}, 0
+                for bound, count in zip(self.buckets + ("+Inf",), histogram["buckets"]):
+                    total += count
+                    cumulative[str(bound)] = total
+                histograms[name] = {"buckets": cumulative, "count": histogram["count"], "sum": histogram["sum"]}
+
+            return {
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "timers": {name: dict(timer) for name, timer in self.timers.items()},
+                "histograms": histograms,
+                "slowest_pages": [{"page": page_num, "url": url, "seconds": seconds}
+                                  for seconds, page_num, url in sorted(self._slow_pages, reverse=True)],
+            }
+
+    def to_prometheus(self, labels=None):
+        """Renders the metrics in the Prometheus text exposition format.
+
+        Args:
+            labels (dict, optional): Labels added to every sample, e.g. {"operation": "buy"}.
+        """
+
+        summary = self.summary()
+        base = ",".join(f'{key}="{value}"' for key, value in (labels or {}).items())
+
+        def sample(name, value, extra=""):
+            label_text = ",".join(part for part in (base, extra) if part)
+            return f"{self.prefix}_{name}{{{label_text}}} {value}" if label_text else f"{self.prefix}_{name} {value}"
+
+        lines = []
+        for name, value in sorted(summary["counters"].items()):
+            lines += [f"# TYPE {self.prefix}_{name}_total counter", sample(f"{name}_total", value)]
+
+        for name, value in sorted(summary["gauges"].items()):
+            lines += [f"# TYPE {self.prefix}_{name} gauge", sample(name, value)]
+
+        if summary["timers"]:
+            lines.append(f"# TYPE {self.prefix}_stage_seconds summary")
+            for name, timer in sorted(summary["timers"].items()):
+                lines.append(sample("stage_seconds_sum", timer["sum"], f'stage="{name}"'))
+                lines.append(sample("stage_seconds_count", timer["count"], f'stage="{name}"'))
+
+        for name, histogram in sorted(summary["histograms"].items()):
+            lines.append(f"# TYPE {self.prefix}_{name} histogram")
+            for bound, count in histogram["buckets"].items():
+                lines.append(sample(f"{name}_bucket", count, f'le="{bound}"'))
+            lines.append(sample(f"{name}_sum", histogram["sum"]))
+            lines.append(sample(f"{name}_count", histogram["count"]))
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, labels=None):
+        """Writes the metrics to a file, as JSON for a .json path and as a Prometheus textfile otherwise.
+
+        The file is replaced atomically, so a collector never reads it half written.
+        """
+
+        if path.endswith(".json"):
+            content = json.dumps(self.summary(), indent=2)
+        else:
+            content = self.to_prometheus(labels)
+
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp, path)
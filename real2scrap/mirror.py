@@ -0,0 +1,253 @@
+import math
+import sqlite3
+import statistics
+import threading
+import time
+
+from .seen import listing_id
+
+# database column -> mirror column
+COLUMNS = {
+    "price(R$)": "price",
+    "condo(R$)": "condo",
+    "district": "district",
+    "address": "address",
+    "area(m²)": "area",
+    "bedroom": "bedroom",
+    "bathrooms": "bathrooms",
+    "parkings": "parkings",
+    "url(image)": "image_url",
+    "url(apt)": "url",
+    "regional": "regional",
+    "lat": "lat",
+    "lng": "lng",
+    "created_at": "created_at",
+    "iptu(R$)": "iptu",
+    "floor": "floor",
+    "amenities": "amenities",
+    "description": "description",
+    "published_at": "published_at",
+}
+
+NUMERIC_COLUMNS = {"price", "condo", "area", "bedroom", "bathrooms", "parkings", "lat", "lng", "iptu", "floor"}
+
+# degrees of latitude/longitude per grid cell, about 1.1 km
+CELL = 0.01
+
+# what aggregate() can compute, as SQL expressions over the mirror columns
+METRICS = {
+    "price": "price",
+    "price_per_m2": "price / NULLIF(area, 0)",
+    "area": "area",
+    "condo": "condo",
+    "iptu": "iptu",
+}
+STATS = ("median", "avg", "min", "max", "count")
+GROUPS = ("regional", "district", "bedroom", "bathrooms", "parkings")
+
+_EARTH_KM = 6371.0
+
+
+def _cell(lat, lng):
+    if lat is None or lng is None or lat != lat or lng != lng:
+        return None
+    # one integer per cell, so a radius query is a handful of index lookups
+    return int(math.floor(lat / CELL)) * 100000 + int(math.floor(lng / CELL))
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points, in km."""
+
+    if None in (lat1, lng1, lat2, lng2):
+        return None
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * _EARTH_KM * math.asin(math.sqrt(a))
+
+
+class _Median:
+    def __init__(self):
+        self.values = []
+
+    def step(self, value):
+        if value is not None:
+            self.values.append(value)
+
+    def finalize(self):
+        return statistics.median(self.values) if self.values else None
+
+
+class LocalMirror:
+    """Local SQLite copy of the scraped listings, for analytics without going through Supabase.
+
+    scrape() feeds it with the rows the database confirmed, so it follows the tables run
+    after run. Listings are keyed by operation and listing id, and indexed by regional,
+    district, created_at and a grid of about 1.1 km cells for radius queries. aggregate()
+    and within() cover the usual questions; query() runs any SQL on the listings table.
+
+    Args:
+        path (str, optional): SQLite file holding the mirror.
+    """
+
+    def __init__(self, path="listings.sqlite3"):
+        self.path = path
+        self._lock = threading.Lock()
+        # several worker processes may share the file
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.create_aggregate("median", 1, _Median)
+        self._conn.create_function("distance_km", 4, distance_km, deterministic=True)
+        columns = ", ".join(f"{name} {'REAL' if name in NUMERIC_COLUMNS else 'TEXT'}" for name in COLUMNS.values())
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS listings (operation TEXT NOT NULL, listing_key TEXT NOT NULL, {columns}, "
+            "cell INTEGER, first_seen TEXT, updated_at REAL, PRIMARY KEY (operation, listing_key))")
+        # the group indexes also hold what the usual aggregates read, so they never touch the table
+        for column in ("regional", "district"):
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS listings_{column} "
+                               f"ON listings (operation, {column}, created_at, price, area)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS listings_created_at ON listings (operation, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS listings_cell ON listings (cell)")
+
+    def upsert(self, operation, records):
+        """Adds or updates listings.
+
+        Columns a record does not carry keep their stored value, like the Supabase upsert.
+
+        Args:
+            operation (str): "buy" or "rent".
+            records (list): Dicts as sent to Supabase, keyed by the database column names.
+
+        Returns:
+            The number of listings written.
+        """
+
+        groups = {}
+        for record in records:
+            row = {COLUMNS[key]: value for key, value in record.items() if key in COLUMNS}
+            if row.get("url") is None:
+                continue
+            if "lat" in row or "lng" in row:
+                row["cell"] = _cell(row.get("lat"), row.get("lng"))
+            row["operation"] = operation
+            row["listing_key"] = str(listing_id(row["url"]))
+            row["first_seen"] = row.get("created_at")
+            row["updated_at"] = time.time()
+            groups.setdefault(tuple(row), []).append(row)
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for names, rows in groups.items():
+                    # first_seen keeps the timestamp of the first time the listing was stored
+                    updates = ", ".join(f"{name} = excluded.{name}" for name in names
+                                        if name not in ("operation", "listing_key", "first_seen"))
+                    self._conn.executemany(
+                        f"INSERT INTO listings ({', '.join(names)}) VALUES ({', '.join('?' * len(names))}) "
+                        f"ON CONFLICT (operation, listing_key) DO UPDATE SET {updates}",
+                        [tuple(row[name] for name in names) for row in rows])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return sum(len(rows) for rows in groups.values())
+
+    def sync_from(self, client, table, operation, page_size=1000):
+        """Copies a whole Supabase table into the mirror, e.g. to start it from existing data.
+
+        Args:
+            client (Client): Supabase client.
+            table (str): "data_scrap" or "rent_scrap".
+            operation (str): Operation of the table.
+            page_size (int, optional): Rows read per request.
+
+        Returns:
+            The number of listings copied.
+        """
+
+        offset = copied = 0
+        while True:
+            rows = client.table(table).select("*").range(offset, offset + page_size - 1).execute().data
+            copied += self.upsert(operation, rows)
+            offset += len(rows)
+            if len(rows) < page_size:
+                return copied
+
+    def query(self, sql, params=()):
+        """Runs SQL on the mirror and returns the rows as dicts."""
+
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            names = [description[0] for description in cursor.description or ()]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def aggregate(self, operation, metric="price_per_m2", stat="median", by="regional", since=None, until=None):
+        """Aggregates a metric of the listings, per group.
+
+        Args:
+            operation (str): "buy" or "rent".
+            metric (str, optional): One of METRICS, e.g. "price" or "price_per_m2".
+            stat (str, optional): "median", "avg", "min", "max" or "count".
+            by (str, optional): Column to group by, one of GROUPS, or None for a single row.
+            since (str, optional): Only listings with created_at from this timestamp on, e.g. "2024-05-01".
+            until (str, optional): Only listings with created_at before this timestamp.
+
+        Returns:
+            A list of dicts with the group value (when by is given), the stat as "value" and the
+            number of listings as "listings", largest groups first.
+        """
+
+        if metric not in METRICS:
+            raise ValueError(f"Invalid metric. Must be one of {', '.join(METRICS)}.")
+        if stat not in STATS:
+            raise ValueError(f"Invalid stat. Must be one of {', '.join(STATS)}.")
+        if by is not None and by not in GROUPS:
+            raise ValueError(f"Invalid group. Must be one of {', '.join(GROUPS)}.")
+
+        where, params = ["operation = ?"], [operation]
+        if since is not None:
+            where.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("created_at < ?")
+            params.append(until)
+
+        group = f"{by}, " if by else ""
+        sql = (f"SELECT {group}{stat}({METRICS[metric]}) AS value, COUNT(*) AS listings FROM listings "
+               f"WHERE {' AND '.join(where)}{f' GROUP BY {by}' if by else ''} ORDER BY listings DESC")
+        return self.query(sql, params)
+
+    def within(self, lat, lng, km, operation=None, limit=None):
+        """Returns the listings within km of a point, closest first.
+
+        Only the grid cells around the point are read, then the exact distance is checked.
+
+        Args:
+            lat (float): Latitude of the point.
+            lng (float): Longitude of the point.
+            km (float): Radius in km.
+            operation (str, optional): "buy" or "rent". Both by default.
+            limit (int, optional): Most listings returned.
+
+        Returns:
+            A list of listing dicts, each with its distance_km.
+        """
+
+        dlat = km / 111.32
+        dlng = km / (111.32 * max(math.cos(math.radians(lat)), 1e-6))
+        lat_cells = range(int(math.floor((lat - dlat) / CELL)), int(math.floor((lat + dlat) / CELL)) + 1)
+        lng_cells = range(int(math.floor((lng - dlng) / CELL)), int(math.floor((lng + dlng) / CELL)) + 1)
+        cells = ", ".join(str(i * 100000 + j) for i in lat_cells for j in lng_cells)
+
+        where, params = [f"cell IN ({cells})", "distance_km(?, ?, lat, lng) <= ?"], [lat, lng, km]
+        if operation is not None:
+            where.append("operation = ?")
+            params.append(operation)
+        # the operation indexes would otherwise win over the cells
+        sql = (f"SELECT *, distance_km(?, ?, lat, lng) AS distance_km FROM listings INDEXED BY listings_cell "
+               f"WHERE {' AND '.join(where)} "
+               f"ORDER BY distance_km{f' LIMIT {int(limit)}' if limit is not None else ''}")
+        return self.query(sql, [lat, lng] + params)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
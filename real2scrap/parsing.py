@@ -0,0 +1,185 @@
+import random
+import re
+import time
+from functools import lru_cache
+
+# every number followed by a unit, found in one pass over the features of a card
+_FEATURE_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*(m²|quartos?\b|ban|vagas?\b)", re.I)
+_PARENS_RE = re.compile(r"\([^)]*\)")
+
+
+def parse_price(text):
+    """Reads the price and condo fee out of the price block of a card.
+
+    Args:
+        text (str): Text like "R$ 450.000\\nCondominio R$ 800".
+
+    Returns:
+        A tuple (price, condo) of ints, None when missing. The fee only counts when the
+        block is exactly a price and a fee.
+    """
+
+    tokens = (text or "").replace("R$", "").replace("Condominio", "").replace(".", "").split()
+    price = int(tokens[0]) if tokens and tokens[0].isdigit() else None
+    condo = int(tokens[1]) if len(tokens) == 2 and tokens[1].isdigit() else None
+    return price, condo
+
+
+def parse_features(text):
+    """Reads area, bedrooms, bathrooms and parking spots out of the features of a card.
+
+    Singular and plural forms are both understood ("1 quarto", "3 quartos", "1 vaga").
+    When a card shows two areas (total and useful), the second one is used.
+
+    Args:
+        text (str): Text like "90 m²\\n80 m²\\n3 quartos\\n2 ban\\n1 vaga".
+
+    Returns:
+        A tuple (area, bedroom, bathrooms, parkings). area is a float, the others ints;
+        missing values are None, except parkings which defaults to 0.
+    """
+
+    areas = []
+    counts = {}
+    for number, unit in _FEATURE_RE.findall(text or ""):
+        kind = unit[0].lower()
+        if kind == "m":
+            areas.append(number)
+        else:
+            counts.setdefault(kind, number)
+
+    area = float((areas[1] if len(areas) > 1 else areas[0]).replace(",", ".")) if areas else None
+    bedroom = int(counts["q"]) if "q" in counts else None
+    bathrooms = int(counts["b"]) if "b" in counts else None
+    parkings = int(counts["v"]) if "v" in counts else 0
+    return area, bedroom, bathrooms, parkings
+
+
+@lru_cache(maxsize=4096)
+def clean_district(location):
+    """Turns the location line of a card ("Savassi, Belo Horizonte") into a district name.
+
+    The district is the part before the first comma, without accents or parentheses and in
+    title case. There are a few hundred districts, so each one is only cleaned once.
+
+    Returns:
+        The district, or None when the card has no location.
+    """
+
+    from unidecode import unidecode
+
+    if not location:
+        return None
+    return _PARENS_RE.sub("", unidecode(location.split(",", 1)[0]).title()).strip()
+
+
+def parse_cards(page, base_url="https://www.imovelweb.com.br"):
+    """Turns the raw card lists of a page, or of many pages put together, into listing columns.
+
+    Args:
+        page (dict): Page dict from the browser or http engine, with one list per card field.
+        base_url (str, optional): Prefix of the data-to-posting paths.
+
+    Returns:
+        A dict with one list per listing column: price, condo, district, address, area,
+        bedroom, bathrooms, parkings, image and url.
+    """
+
+    prices = [parse_price(text) for text in page["condo"]]
+    features = [parse_features(text) for text in page["features"]]
+    area, bedroom, bathrooms, parkings = (list(column) for column in zip(*features)) if features else ([],) * 4
+
+    return {
+        "price": [price for price, _ in prices],
+        "condo": [condo for _, condo in prices],
+        "district": [clean_district(text) for text in page["location"]],
+        "address": [text.split(",", 1)[0] if text else None for text in page["address"]],
+        "area": area,
+        "bedroom": bedroom,
+        "bathrooms": bathrooms,
+        "parkings": parkings,
+        "image": list(page["image"]),
+        "url": [base_url + posting for posting in page["posting"]],
+    }
+
+
+def fixture_cards(n=5000, seed=0):
+    """Builds a page dict with n synthetic cards in the formats seen on the listing pages."""
+
+    rng = random.Random(seed)
+    districts = ("Savassi", "Sion", "Funcionários", "Buritis", "Santo Antônio (Zona Sul)", "Gutierrez")
+    page = {"address": [], "features": [], "condo": [], "location": [], "image": [], "posting": []}
+
+    for i in range(n):
+        district = rng.choice(districts)
+        rooms, baths, spots = rng.randint(1, 4), rng.randint(1, 3), rng.randint(0, 3)
+        features = [f"{rng.randint(60, 200)} m²"] * rng.randint(1, 2)
+        features.append(f"{rooms} quarto{'s' if rooms > 1 else ''}")
+        features.append(f"{baths} ban")
+        if spots:
+            features.append(f"{spots} vaga{'s' if spots > 1 else ''}")
+        condo = f"R$ {rng.randint(200, 3000) * 1000:,}".replace(",", ".")
+        if rng.random() < 0.8:
+            condo += f"\nCondominio R$ {rng.randint(200, 2000)}"
+
+        page["address"].append(f"Rua {rng.randint(1, 500)}, {rng.randint(1, 2000)}\n{district}, Belo Horizonte")
+        page["features"].append("\n".join(features))
+        page["condo"].append(condo)
+        page["location"].append(f"{district}, Belo Horizonte")
+        page["image"].append(None)
+        page["posting"].append(f"/propriedades/apto-{i}.html")
+    return page
+
+
+def benchmark(n=5000, seed=0):
+    """Measures parse_cards on n fixture cards against the old per-field list comprehensions.
+
+    Args:
+        n (int, optional): Number of fixture cards.
+        seed (int, optional): Seed used to build the cards.
+
+    Returns:
+        A dict with the cards parsed per second by each approach, and how many bedroom and
+        parking values each one missed.
+    """
+
+    from unidecode import unidecode
+
+    page = fixture_cards(n, seed)
+    clean_district.cache_clear()
+
+    start_time = time.perf_counter()
+    features1 = [element.replace("\n", " ") for element in page["features"]]
+    condo1 = [x.replace("\n", " ").replace("R$", "").replace(
+        "Condominio", "").replace(".", "").strip() for x in page["condo"]]
+    [int(row.split()[0]) if len(row.split()) >= 1 and row.split()[0].isdigit() else None for row in condo1]
+    [int(row.split()[1]) if len(row.split()) == 2 and row.split()[1].isdigit() else None for row in condo1]
+    district_list = [str(text.split(",")[0]) if text else None for text in page["location"]]
+    [x.split(',')[0] if ',' in x and len(x.split(',')) >= 2 else x if x else None for x in page["address"]]
+    area_list = [x.split('m²')[1].strip() if x.count('m²') > 1 else
+                 (x.split('m²')[0] + 'm²' if 'm²' in x else None) for x in features1]
+    [x.split()[0].replace('m²', '').strip() if isinstance(x, str) else None for x in area_list]
+    old_bedrooms = [re.search(r'(\d+) quartos', x).group(1) if 'quartos' in x else None for x in features1]
+    [re.search(r'(\d+)\sban', x).group(1) if 'ban' in x else None for x in features1]
+    old_parkings = [int(re.search(r'(\d+)\svagas', x).group(1)) if 'vagas' in x else 0 for x in features1]
+    district_list = [re.sub(r'\([^)]*\)', '', unidecode(x).title()).strip() for x in district_list]
+    loop_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    listing = parse_cards(page)
+    parse_time = time.perf_counter() - start_time
+
+    expected_parkings = sum(1 for x in features1 if "vaga" in x)
+    return {
+        "cards": n,
+        "loop_per_s": n / loop_time,
+        "parse_cards_per_s": n / parse_time,
+        "loop_missed_bedrooms": old_bedrooms.count(None),
+        "parse_cards_missed_bedrooms": listing["bedroom"].count(None),
+        "loop_missed_parkings": expected_parkings - sum(1 for p in old_parkings if p),
+        "parse_cards_missed_parkings": expected_parkings - sum(1 for p in listing["parkings"] if p),
+    }
+
+
+if __name__ == "__main__":
+    print(benchmark())
@@ -0,0 +1,133 @@
+import queue
+import threading
+
+_DONE = object()
+
+
+class Stage:
+    """One step of a Pipeline.
+
+    Args:
+        name (str): Name used in error messages.
+        fn (callable): Called with each item; its return value goes to the next stage,
+                       unless it is None, which drops the item.
+        workers (int, optional): Threads running fn. With more than one worker the items
+                                 may leave the stage out of order.
+    """
+
+    def __init__(self, name, fn, workers=1):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+
+
+class Pipeline:
+    """Runs a source and a chain of stages in threads connected by bounded queues.
+
+    Each stage works on its own thread(s), so while one page is geocoded the next one is
+    already being browsed. The queues hold at most `queue_size` items, which caps memory:
+    a slow stage makes the stages before it wait instead of piling items up.
+
+    Args:
+        source (iterable): Items fed to the first stage.
+        stages (list): Stage objects, in order.
+        queue_size (int, optional): Items allowed to wait between two stages.
+    """
+
+    def __init__(self, source, stages, queue_size=4):
+        self.source = source
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self.error = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def stop(self):
+        """Asks the source to stop producing. Items already in flight still go through the stages."""
+
+        self._stopped.set()
+
+    @property
+    def stopped(self):
+        return self._stopped.is_set()
+
+    def _fail(self, stage, e):
+        with self._lock:
+            if self.error is None:
+                self.error = (stage, e)
+        self._stopped.set()
+
+    def _put(self, out, item):
+        # a blocked put gives up once the pipeline failed, so no thread is left hanging
+        while True:
+            try:
+                out.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                if self.error is not None:
+                    return
+
+    def _feed(self, out):
+        try:
+            for item in self.source:
+                if self._stopped.is_set():
+                    break
+                self._put(out, item)
+        except Exception as e:
+            self._fail("source", e)
+        finally:
+            close = getattr(self.source, "close", None)
+            if close is not None:
+                close()
+            # the stages keep draining after a failure, so this put always goes through
+            out.put(_DONE)
+
+    def _work(self, stage, inbox, out, remaining):
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                # let the sibling workers see it too
+                inbox.put(_DONE)
+                break
+            if self.error is not None:
+                # drain without working once something failed
+                continue
+            try:
+                result = stage.fn(item)
+            except Exception as e:
+                self._fail(stage.name, e)
+                continue
+            if result is not None and out is not None:
+                self._put(out, result)
+
+        with self._lock:
+            remaining[stage.name] -= 1
+            last = remaining[stage.name] == 0
+        if last and out is not None:
+            out.put(_DONE)
+
+    def run(self):
+        """Runs the pipeline until the source is exhausted or stopped and every stage is done.
+
+        Raises:
+            RuntimeError: When the source or a stage raised, chained to the original error.
+        """
+
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        remaining = {stage.name: stage.workers for stage in self.stages}
+        threads = [threading.Thread(target=self._feed, args=(queues[0],), daemon=True)]
+
+        for i, stage in enumerate(self.stages):
+            out = queues[i + 1] if i + 1 < len(queues) else None
+            for _ in range(stage.workers):
+                threads.append(threading.Thread(target=self._work, args=(stage, queues[i], out, remaining),
+                                                daemon=True))
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self.error is not None:
+            stage, e = self.error
+            raise RuntimeError(f"Pipeline stage '{stage}' failed: {e}") from e
@@ -1,590 +1,729 @@
-def scrap_buy(x, y=None, url_type="normal"):
-    """A function that scrapes a website called imovelweb and returns a csv file with some property characteristics.
+from .browser import BrowserPool, ResourcePolicy, build_options, extract_cards, wait_for_cards
+from .changes import ChangeTracker
+from .checkpoint import Checkpoint
+from .details import DETAIL_COLUMNS, DetailCache, DetailFetcher, HostRateLimiter
+from .export import ExportWriter
+from .geocoding import AddressIndex, GeocodeCache, TokenBucket, geocode_batch
+from .http_engine import HttpFetcher
+from .metrics import Metrics
+from .mirror import LocalMirror
+from .parsing import parse_cards
+from .pipeline import Pipeline, Stage
+from .regional import get_resolver
+from .rows import HEADER, RowAccumulator, rows_to_frame
+from .seen import SeenIndex, new_cards
+from .session import resolve_driver_path
+from .sink import SupabaseWriter, frame_to_records
+from .throttle import AdaptiveConcurrency
+
+BASE_URL = "https://www.imovelweb.com.br"
+
+# steps timed for every page, in the order a page goes through them
+STAGES = ("page_load", "extraction", "parsing", "regional", "geocoding", "details", "sink")
+
+# the searches scrap_buy and scrap_rent were written for
+DEFAULT_CITY = "belo-horizonte-mg"
+DEFAULT_PROPERTY_TYPE = "apartamentos"
+
+# scrap_buy and scrap_rent only differ by their urls (relative to the site root) and tables;
+# the urls take the property type and city slugs of the site, and the page number
+OPERATIONS = {
+    "buy": {
+        "urls": {
+            "normal": "/{property_type}-venda-{city}-pagina-{page}.html",
+            "last-day": "/{property_type}-venda-{city}-publicado-no-ultimo-dia-pagina-{page}.html",
+        },
+        "table": "data_scrap",
+        "log_table": "entradas",
+        "history_table": "data_scrap_history",
+    },
+    "rent": {
+        "urls": {
+            "normal": "/{property_type}-aluguel-{city}-pagina-{page}.html",
+            "last-day": "/{property_type}-aluguel-{city}-publicado-no-ultimo-dia-pagina-{page}.html",
+        },
+        "table": "rent_scrap",
+        "log_table": "rent_entradas",
+        "history_table": "rent_scrap_history",
+    },
+}
+
+
+def url_template_for(operation, url_type="normal", city=DEFAULT_CITY, property_type=DEFAULT_PROPERTY_TYPE,
+                     base_url=BASE_URL):
+    """Builds the url template of a search, with a {} left for the page number.
 
     Args:
-        x (int): First page to scrape. If y is not specified, this argument is treated as a single page input.
-        y (int, optional): Last page to scrape (not included in the range of pages to scrape).
-                           If specified, pages x to y-1 will be scraped.
-        url_type (str, optional): Type of URL template to use. "normal" for normal URL or "last-day" for last day URL.
+        operation (str): "buy" or "rent", see OPERATIONS.
+        url_type (str, optional): "normal" or "last-day".
+        city (str, optional): City slug of the site, e.g. "sao-paulo-sp".
+        property_type (str, optional): Property type slug of the site, e.g. "casas".
+        base_url (str, optional): Root of the site.
 
     Returns:
-        A csv file and feeds a database in supabase.
+        A string such as "https://.../apartamentos-venda-belo-horizonte-mg-pagina-{}.html".
     """
 
-    from selenium import webdriver
-    from selenium.webdriver.common.by import By
-    from selenium.webdriver.chrome.options import Options
-    from selenium.webdriver.chrome.service import Service
-    from webdriver_manager.chrome import ChromeDriverManager
-    from supabase import create_client
-    from datetime import datetime, timedelta
-    import numpy as np
-    import pandas as pd
-    import re
-    import googlemaps
-    import time
-    import os
-    from unidecode import unidecode
-    from dotenv import load_dotenv
-    from rapidfuzz import fuzz
-    import warnings
-    warnings.filterwarnings("ignore", category=FutureWarning)
-
-    load_dotenv()
-
-    url_supa = os.environ.get("SUPABASE_URL")
-    key_supa = os.environ.get("SUPABASE_KEY2")
-    key_google = os.environ.get("API_GOOGLE")
-
-    supabase = create_client(url_supa, key_supa)
-    gmaps = googlemaps.Client(key=key_google)
-
-    if x == 0:
-        raise ValueError("The value of x cannot be zero.")
-
-    if y is None:
-        # Single page input
-        page_range = [x]
-    else:
-        # Multiple pages input
-        page_range = range(x, y)
-
-    if url_type == "normal":
-        url_template = "https://www.imovelweb.com.br/apartamentos-venda-belo-horizonte-mg-pagina-{}.html"
-    elif url_type == "last-day":
-        url_template = "https://www.imovelweb.com.br/apartamentos-venda-belo-horizonte-mg-publicado-no-ultimo-dia-pagina-{}.html"
-    else:
+    if operation not in OPERATIONS:
+        raise ValueError(f"Invalid operation. Must be one of {', '.join(OPERATIONS)}.")
+    urls = OPERATIONS[operation]["urls"]
+    if url_type not in urls:
         raise ValueError("Invalid url_type. Must be 'normal' or 'last-day'.")
+    return base_url + urls[url_type].format(property_type=property_type, city=city, page="{}")
 
-    url_list = [url_template.format(page) for page in page_range]
-
-    base_url = "https://www.imovelweb.com.br"
-
-    # Get the current datetime in UTC
-    date1 = (datetime.utcnow() - timedelta(hours=3)
-             ).strftime("%Y-%m-%dT%H:%M:%S")
-
-    # Create a new Options object for configuring the Chrome driver
-    option = Options()
 
-    # Set the window size of the browser to 1920x1080 pixels
-    option.add_argument("--window-size=1920,1080")
+def city_name(city):
+    """Turns a city slug ("belo-horizonte-mg") into the name appended to addresses ("Belo Horizonte")."""
 
-    # Disable GPU acceleration to improve performance
-    option.add_argument("--disable-gpu")
+    return " ".join(part.title() for part in city.split("-")[:-1])
 
-    # Disable any installed browser extensions to avoid potential conflicts
-    option.add_argument("--disable-extensions")
 
-    # Disable the use of automation extensions, which could interfere with website behavior
-    option.add_argument('--disable-useAutomationExtension')
+def _scrape_page(driver, url, timeout=20, policy=None):
+    """Loads one results page on a live driver and reads the raw text of every card element.
 
-    # Specify a direct connection to the internet, bypassing any proxy settings
-    option.add_argument("--proxy-server='direct://'")
-    option.add_argument("--proxy-bypass-list=*")
-
-    # Start the browser maximized to fill the screen
-    option.add_argument("--start-maximized")
-
-    # Run the browser in headless mode, meaning without a visible user interface
-    option.add_argument("--headless")
-
-    # Set the User-Agent header of the browser to mimic a Windows 10 desktop machine running Chrome 87
-    option.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64)" +
-                        "AppleWebKit/537.36 (KHTML, like Gecko)"+"Chrome/87.0.4280.141 Safari/537.36")
-
-    header = ("price(R$)", "condo(R$)", "district", "address", "area(m²)",
-              "bedroom", "bathrooms", "parkings", "url(image)", "url(apt)", "regional", "lat", "lng")
-
-    servico = Service(ChromeDriverManager().install())
-    check = pd.DataFrame(columns=header)
-
-    # creating a header for my list
-
-    for page_num in page_range:
-        start_time = time.time()
-        url = url_template.format(page_num)
-        driver = webdriver.Chrome(service=servico, options=option)
-        driver.get(url)
-
-        time.sleep(5)
-        for i in range(16):
-            driver.execute_script("window.scrollBy(0, 550)")
-            time.sleep(0.4)
-
-        # finding the elements
-        scrap_img = driver.find_elements(
-            By.CSS_SELECTOR, '[data-qa="posting PROPERTY"] .flickity-slider img:first-child')
-        scrap_location = driver.find_elements(
-            By.CSS_SELECTOR, '[data-qa="posting PROPERTY"] [data-qa="POSTING_CARD_LOCATION"]')
-        scrap_location2 = driver.find_elements(By.CLASS_NAME, 'sc-ge2uzh-0')
-        scrap_features = driver.find_elements(
-            By.CSS_SELECTOR, '[data-qa="posting PROPERTY"] [data-qa="POSTING_CARD_FEATURES"]')
-        scrap_condo = driver.find_elements(By.CLASS_NAME, 'sc-12dh9kl-0')
-        scrap_link = driver.find_elements(
-            By.CSS_SELECTOR, '[data-qa="posting PROPERTY"]')
-
-        # cleaning / organizing lists
-        address = [str(element.text) for element in scrap_location2]
-        features1 = [element.text for element in scrap_features]
-        features1 = [element.replace("\n", " ") for element in features1]
-        condo1 = [str(element.text) for element in scrap_condo]
-        condo1 = [x.replace("\n", " ").replace("R$", "").replace(
-            "Condominio", "").replace(".", "").strip() for x in condo1]
-
-        # creating a list of each element we want to extract
-        prices_brl = [int(row.split()[0]) if len(row.split()) >= 1 and row.split()[
-            0].isdigit() else None for row in condo1]
-        condos_brl = [int(row.split()[1]) if len(row.split()) == 2 and row.split()[
-            1].isdigit() else None for row in condo1]
-        district_list = [str(element.text.split(",")[0])
-                         if element.text else None for element in scrap_location]
-        address_list = [x.split(',')[0] if ',' in x and len(x.split(','))
-                        >= 2 else x if x else None for x in address]
-        area_list = [x.split('m²')[1].strip() if x.count('m²') > 1 and isinstance(x, str) else
-                     (x.split('m²')[0] + 'm²' if 'm²' in x and isinstance(x, str) else np.nan) for x in features1]
-        area_list = [x.split()[0].replace('m²', '').strip()
-                     if isinstance(x, str) else np.nan for x in area_list]
-        bedrooms_list = [re.search(r'(\d+) quartos', x).group(1)
-                         if 'quartos' in x else None for x in features1]
-        baths_list = [re.search(r'(\d+)\sban', x).group(1)
-                      if 'ban' in x else None for x in features1]
-        parking_list = [int(re.search(r'(\d+)\svagas', x).group(1))
-                        if 'vagas' in x else 0 for x in features1]
-        src_list = [img.get_attribute('src') if img.get_attribute(
-            'src') else None for img in scrap_img]
-        full_links = [
-            base_url + element.get_attribute("data-to-posting") for element in scrap_link]
-
-        # cleaning district
-        district_list = [unidecode(x) for x in district_list]
-        district_list = [x.title() for x in district_list]
-        district_list = [re.sub(r'\([^)]*\)', '', x).strip()
-                         for x in district_list]
-        district_list = [x.replace("ç", "c") for x in district_list]
-
-        # creating Regional
-        regional = []
+    Args:
+        driver (WebDriver): Driver borrowed from the BrowserPool.
+        url (str): Results page to load.
+        timeout (float, optional): Seconds allowed for the page to load and show its cards.
+        policy (ResourcePolicy, optional): Policy of the pool, used to count the bytes of the page.
 
-        # Loop over the district_list
-        my_dict = {'Alta Tensao': 'Barreiro', 'Aarao Reis': 'Norte', 'Acaba Mundo': 'Centro-sul', 'Acaiaca': 'Nordeste', 'Ademar Maldonado': 'Barreiro', 'Aeroporto': 'Pampulha', 'Aguas Claras': 'Barreiro', 'Alipio De Melo': 'Pampulha', 'Alpes': 'Oeste', 'Alto Barroca': 'Oeste', 'Alto Caicaras': 'Noroeste', 'Alto Das Antenas': 'Barreiro', 'Alto Dos Pinheiros': 'Noroeste', 'Alto Vera Cruz': 'Leste', 'Alvaro Camargos': 'Noroeste', 'Ambrosina': 'Oeste', 'Anchieta': 'Centro-sul', 'Andiroba': 'Nordeste', 'Antonio Ribeiro De Abreu': 'Nordeste', 'Aparecida': 'Noroeste', 'Aparecida Setima Secao': 'Noroeste', 'Apia': 'Centro-sul', 'Apolonia': 'Venda nova', 'Araguaia': 'Barreiro', 'Atila De Paiva': 'Barreiro', 'Bacurau': 'Norte', 'Bairro Das Industrias I': 'Barreiro', 'Bairro Das Industrias II': 'Oeste', 'Bairro Novo Das Industrias': 'Barreiro', 'Baleia': 'Leste', 'Bandeirantes': 'Pampulha', 'Barao Homem De Melo': 'Oeste', 'Barreiro': 'Barreiro', 'Barro Preto': 'Centro-sul', 'Barroca': 'Oeste', 'Beija Flor': 'Nordeste', 'Beira-Linha': 'Nordeste', 'Bela Vitoria': 'Nordeste', 'Belem': 'Leste', 'Belmonte': 'Nordeste', 'Belvedere': 'Centro-sul', 'Bernadete': 'Barreiro', 'Betania': 'Oeste', 'Biquinhas': 'Norte', 'Bispo De Maura': 'Pampulha', 'Boa Esperanca': 'Nordeste', 'Boa Uniao': 'Norte', 'Boa Viagem': 'Centro-sul', 'Boa Vista': 'Leste', 'Bom Jesus': 'Noroeste', 'Bonfim': 'Noroeste', 'Bonsucesso': 'Barreiro', 'Brasil Industrial': 'Barreiro', 'Braunas': 'Pampulha', 'Buritis': 'Oeste', 'Cabana Do Pai Tomas': 'Oeste', 'Cachoeirinha': 'Nordeste', 'Caetano Furquim': 'Leste', 'Caicara-Adelaide': 'Noroeste', 'Caicaras': 'Noroeste', 'Caicara': 'Noroeste', 'Calafate': 'Oeste', 'California': 'Noroeste', 'Camargos': 'Oeste', 'Campo Alegre': 'Norte', 'Camponesa': 'Leste', 'Campus Ufmg': 'Pampulha', 'Canaa': 'Venda nova', 'Canada': 'Nordeste', 'Candelaria': 'Venda nova', 'Capitao Eduardo': 'Nordeste', 'Cardoso': 'Barreiro', 'Carlos Prates': 'Noroeste', 'Carmo': 'Centro-sul', 'Casa Branca': 'Leste', 'Castanheira': 'Barreiro', 'Castelo': 'Pampulha', 'Cdi Jatoba': 'Barreiro', 'Cenaculo': 'Venda nova', 'Centro': 'Centro-sul', 'Ceu Azul': 'Pampulha', 'Chacara Leonina': 'Oeste', 'Cidade Jardim': 'Centro-sul', 'Cidade Jardim Taquaril': 'Leste', 'Cidade Nova': 'Nordeste', 'Cinquentenario': 'Oeste', 'Colegio Batista': 'Nordeste', 'Comiteco': 'Centro-sul', 'Concordia': 'Nordeste', 'Conego Pinheiro': 'Leste', 'Conego Pinheiro A': 'Leste', 'Confisco': 'Pampulha', 'Conjunto Bonsucesso': 'Barreiro', 'Conjunto California': 'Noroeste', 'Conjunto Capitao Eduardo': 'Nordeste', 'Conjunto Celso Machado': 'Pampulha', 'Conjunto Floramar': 'Norte', 'Conjunto Jardim Filadelfia': 'Noroeste', 'Conjunto Jatoba': 'Barreiro', 'Conjunto Lagoa': 'Pampulha', 'Conjunto Minascaixa': 'Venda nova', 'Conjunto Novo Dom Bosco': 'Noroeste', 'Conjunto Paulo': 'Nordeste', 'Conjunto Providencia': 'Norte', 'Conjunto Santa Maria': 'Centro-sul', 'Conjunto Sao Francisco De Assis': 'Pampulha', 'Conjunto Serra Verde': 'Venda nova', 'Conjunto Taquaril': 'Leste', 'Copacabana': 'Pampulha', 'Coqueiros': 'Noroeste', 'Coracao De Jesus': 'Centro-sul', 'Coracao Eucaristico': 'Noroeste', 'Corumbiara': 'Barreiro', 'Cruzeiro': 'Centro-sul', 'Custodinha': 'Oeste', 'Delta': 'Noroeste', 'Diamante': 'Barreiro', 'Distrito Industrial Do Jatoba': 'Barreiro', 'Dom Bosco': 'Noroeste', 'Dom Cabral': 'Noroeste', 'Dom Joaquim': 'Nordeste', 'Dom Silverio': 'Nordeste', 'Dona Clara': 'Pampulha', 'Engenho Nogueira': 'Pampulha', 'Ermelinda': 'Noroeste', 'Ernesto Do Nascimento': 'Barreiro', 'Esperanca': 'Barreiro', 'Esplanada': 'Leste', 'Estoril': 'Oeste', 'Estrela': 'Centro-sul', 'Estrela Do Oriente': 'Oeste', 'Etelvina Carneiro': 'Norte', 'Europa': 'Venda nova', 'Eymard': 'Nordeste', 'Fazendinha': 'Centro-sul', 'Fernao Dias': 'Nordeste', 'Flamengo': 'Venda nova', 'Flavio De Oliveira': 'Barreiro', 'Flavio Marques Lisboa': 'Barreiro', 'Floramar': 'Norte', 'Floresta': 'Centro-sul', 'Frei Leopoldo': 'Norte', 'Funcionarios': 'Centro-sul', 'Gameleira': 'Oeste', 'Garcas': 'Pampulha', 'Gloria': 'Noroeste', 'Goiania': 'Nordeste', 'Graca': 'Nordeste', 'Grajau': 'Oeste', 'Granja De Freitas': 'Leste', 'Granja Werneck': 'Norte', 'Grota': 'Leste', 'Grotinha': 'Nordeste', 'Guanabara': 'Nordeste', 'Guarani': 'Norte', 'Guarata': 'Oeste', 'Gutierrez': 'Oeste', 'Havai': 'Oeste', 'Heliopolis': 'Norte', 'Horto': 'Leste', 'Horto Florestal': 'Leste', 'Imbaubas': 'Oeste', 'Inconfidencia': 'Pampulha', 'Indaia': 'Pampulha', 'Independencia': 'Barreiro', 'Ipe': 'Nordeste', 'Ipiranga': 'Nordeste', 'Itaipu': 'Barreiro', 'Itapoa': 'Pampulha', 'Itatiaia': 'Pampulha', 'Jaqueline': 'Norte', 'Jaragua': 'Pampulha', 'Jardim Alvorada': 'Pampulha', 'Jardim America': 'Oeste', 'Jardim Atlantico': 'Pampulha', 'Jardim Do Vale': 'Barreiro', 'Jardim Dos Comerciarios': 'Venda nova', 'Jardim Felicidade': 'Norte', 'Jardim Guanabara': 'Norte', 'Jardim Leblon': 'Venda nova', 'Jardim Montanhes': 'Noroeste', 'Jardim Sao Jose': 'Pampulha', 'Jardim Vitoria': 'Nordeste', 'Jardinopolis': 'Oeste', 'Jatoba': 'Barreiro', 'Joao Alfredo': 'Leste', 'Joao Paulo Ii': 'Barreiro', 'Joao Pinheiro': 'Noroeste', 'Jonas Veiga': 'Leste', 'Juliana': 'Norte', 'Lagoa': 'Venda nova', 'Lagoa Da Pampulha': 'Pampulha', 'Lagoinha': 'Noroeste', 'Lagoinha Leblon': 'Venda nova', 'Lajedo': 'Norte', 'Laranjeiras': 'Venda nova', 'Leonina': 'Oeste', 'Leticia': 'Venda nova', 'Liberdade': 'Pampulha', 'Lindeia': 'Barreiro', 'Lorena': 'Noroeste', 'Lourdes': 'Centro-sul', 'Luxemburgo': 'Centro-sul', 'Madre Gertrudes': 'Oeste', 'Madri': 'Norte', 'Mala E Cuia': 'Centro-sul', 'Manacas': 'Pampulha', 'Mangabeiras': 'Centro-sul', 'Mangueiras': 'Barreiro', 'Mantiqueira': 'Venda nova', 'Marajo': 'Oeste', 'Maravilha': 'Oeste', 'Marcola': 'Centro-sul', 'Maria Goretti': 'Nordeste', 'Maria Helena': 'Venda nova', 'Maria Teresa': 'Norte', 'Maria Virginia': 'Nordeste', 'Mariano De Abreu': 'Leste', 'Marieta': 'Barreiro', 'Marilandia': 'Barreiro', 'Mariquinhas': 'Norte', 'Marmiteiros': 'Noroeste', 'Milionarios': 'Barreiro', 'Minas Brasil': 'Noroeste', 'Minascaixa': 'Venda nova', 'Minaslandia': 'Norte', 'Mineirao': 'Barreiro', 'Miramar': 'Barreiro', 'Mirante': 'Norte', 'Mirtes': 'Nordeste', 'Monsenhor Messias': 'Noroeste', 'Monte Azul': 'Norte', 'Monte Sao Jose': 'Centro-sul', 'Morro Dos Macacos': 'Nordeste', 'Nazare': 'Nordeste', 'Nossa Senhora Da Aparecida': 'Centro-sul', 'Nossa Senhora Da Conceicao': 'Centro-sul', 'Nossa Senhora De Fatima': 'Centro-sul',
-                   'Nossa Senhora Do Rosario': 'Centro-sul', 'Nova America': 'Venda nova', 'Nova Cachoeirinha': 'Noroeste', 'Nova Cintra': 'Oeste', 'Nova Esperanca': 'Noroeste', 'Nova Floresta': 'Nordeste', 'Nova Gameleira': 'Oeste', 'Nova Granada': 'Oeste', 'Nova Pampulha': 'Pampulha', 'Nova Suissa': 'Oeste', 'Nova Vista': 'Leste', 'Novo Aarao Reis': 'Norte', 'Novo Gloria': 'Noroeste', 'Novo Ouro Preto': 'Pampulha', 'Novo Santa Cecilia': 'Barreiro', 'Novo Sao Lucas': 'Centro-sul', 'Novo Tupi': 'Norte', 'Oeste': 'Oeste', 'Olaria': 'Barreiro', "Olhos D'Agua": 'Barreiro', 'Ouro Minas': 'Nordeste', 'Ouro Preto': 'Pampulha', 'Padre Eustaquio': 'Noroeste', 'Palmares': 'Nordeste', 'Palmeiras': 'Oeste', 'Pantanal': 'Oeste', 'Paqueta': 'Pampulha', 'Paraiso': 'Leste', 'Parque Sao Jose': 'Oeste', 'Parque Sao Pedro': 'Venda nova', 'Paulo Vi': 'Nordeste', 'Pedreira Prado Lopes': 'Noroeste', 'Penha': 'Nordeste', 'Petropolis': 'Barreiro', 'Pilar': 'Barreiro', 'Pindorama': 'Noroeste', 'Pindura Saia': 'Centro-sul', 'Piraja': 'Nordeste', 'Piratininga': 'Venda nova', 'Pirineus': 'Leste', 'Planalto': 'Norte', 'Pompeia': 'Leste', 'Pongelupe': 'Barreiro', 'Pousada Santo Antonio': 'Nordeste', 'Prado': 'Oeste', 'Primeiro De Maio': 'Norte', 'Providencia': 'Norte', 'Renascenca': 'Nordeste', 'Ribeiro De Abreu': 'Nordeste', 'Rio Branco': 'Venda nova', 'Sagrada Familia': 'Leste', 'Salgado Filho': 'Oeste', 'Santa Amelia': 'Pampulha', 'Santa Branca': 'Pampulha', 'Santa Cecilia': 'Barreiro', 'Santa Cruz': 'Nordeste', 'Santa Efigenia': 'Leste', 'Santa Helena': 'Barreiro', 'Santa Ines': 'Leste', 'Santa Isabel': 'Centro-sul', 'Santa Lucia': 'Oeste', 'Santa Margarida': 'Barreiro', 'Santa Maria': 'Oeste', 'Santa Monica': 'Pampulha', 'Santa Rita': 'Barreiro', 'Santa Rita De Cassia': 'Centro-sul', 'Santa Rosa': 'Pampulha', 'Santa Sofia': 'Oeste', 'Santa Tereza': 'Leste', 'Santa Terezinha': 'Pampulha', 'Santana Do Cafezal': 'Centro-sul', 'Santo Agostinho': 'Centro-sul', 'Santo Andre': 'Noroeste', 'Santo Antonio': 'Centro-sul', 'Sao Benedito': 'Nordeste', 'Sao Bento': 'Centro-sul', 'Sao Bernardo': 'Norte', 'Sao Cristovao': 'Noroeste', 'Sao Damiao': 'Venda nova', 'Sao Francisco': 'Pampulha', 'Sao Francisco Das Chagas': 'Noroeste', 'Sao Gabriel': 'Nordeste', 'Sao Geraldo': 'Leste', 'Sao Goncalo': 'Norte', 'Sao Joao': 'Barreiro', 'Sao Joao Batista': 'Venda nova', 'Sao Jorge': 'Oeste', 'Sao Jose': 'Pampulha', 'Sao Lucas': 'Centro-sul', 'Sao Luiz': 'Pampulha', 'Sao Marcos': 'Nordeste', 'Sao Paulo': 'Nordeste', 'Sao Pedro': 'Centro-sul', 'Sao Salvador': 'Noroeste', 'Sao Sebastiao': 'Nordeste', 'Sao Tomaz': 'Norte', 'Sao Vicente': 'Leste', 'Satelite': 'Norte', 'Saudade': 'Leste', 'Savassi': 'Centro-sul', 'Senhor Dos Passos': 'Noroeste', 'Serra': 'Centro-sul', 'Serra Do Curral': 'Barreiro', 'Serra Verde': 'Venda nova', 'Serrano': 'Pampulha', 'Silveira': 'Nordeste', 'Sion': 'Centro-sul', 'Solar Do Barreiro': 'Barreiro', 'Solimoes': 'Norte', 'Sport Club': 'Oeste', 'Sumare': 'Noroeste', 'Suzana': 'Pampulha', 'Taquaril': 'Leste', 'Teixeira Dias': 'Barreiro', 'Tiradentes': 'Nordeste', 'Tirol': 'Barreiro', 'Tres Marias': 'Nordeste', 'Trevo': 'Pampulha', 'Tunel De Ibirite': 'Barreiro', 'Tupi A': 'Norte', 'Tupi B': 'Norte', 'Uniao': 'Nordeste', 'Unidas': 'Venda nova', 'Universitario': 'Pampulha', 'Universo': 'Venda nova', 'Urca': 'Pampulha', 'Vale Do Jatoba': 'Barreiro', 'Varzea Da Palma': 'Venda nova', 'Venda Nova': 'Venda nova', 'Ventosa': 'Oeste', 'Vera Cruz': 'Leste', 'Vila Aeroporto': 'Norte', 'Vila Aeroporto Jaragua': 'Pampulha', 'Vila Antena': 'Oeste', 'Vila Antena Montanhes': 'Pampulha', 'Vila Atila De Paiva': 'Barreiro', 'Vila Bandeirantes': 'Centro-sul', 'Vila Barragem Santa Lucia': 'Centro-sul', 'Vila Batik': 'Barreiro', 'Vila Betania': 'Oeste', 'Vila Boa Vista': 'Leste', 'Vila Calafate': 'Oeste', 'Vila California': 'Noroeste', 'Vila Canto Do Sabia': 'Venda nova', 'Vila Cemig': 'Barreiro', 'Vila Cloris': 'Norte', 'Vila Copacabana': 'Venda nova', 'Vila Copasa': 'Barreiro', 'Vila Coqueiral': 'Noroeste', 'Vila Da Amizade': 'Oeste', 'Vila Da Area': 'Leste', 'Vila Da Luz': 'Nordeste', 'Vila Da Paz': 'Nordeste', 'Vila Das Oliveiras': 'Noroeste', 'Vila De Sa': 'Nordeste', 'Vila Dias': 'Leste', 'Vila Do Pombal': 'Nordeste', 'Vila Dos Anjos': 'Venda nova', 'Vila Ecologica': 'Barreiro', 'Vila Engenho Nogueira': 'Pampulha', 'Vila Esplanada': 'Nordeste', 'Vila Formosa': 'Barreiro', 'Vila Fumec': 'Centro-sul', 'Vila Havai': 'Oeste', 'Vila Independencia': 'Barreiro', 'Vila Inestan': 'Nordeste', 'Vila Ipiranga': 'Nordeste', 'Vila Jardim Alvorada': 'Pampulha', 'Vila Jardim Leblon': 'Venda nova', 'Vila Jardim Montanhes': 'Pampulha', 'Vila Jardim Sao Jose': 'Pampulha', 'Vila Madre Gertrudes': 'Oeste', 'Vila Maloca': 'Noroeste', 'Vila Mangueiras': 'Barreiro', 'Vila Mantiqueira': 'Venda nova', 'Vila Maria': 'Nordeste', 'Vila Minaslandia': 'Norte', 'Vila Nossa Senhora Aparecida': 'Venda nova', 'Vila Nossa Senhora Do Rosario': 'Leste', 'Vila Nova': 'Norte', 'Vila Nova Cachoeirinha': 'Noroeste', 'Vila Nova Dos Milionarios': 'Barreiro', 'Vila Nova Gameleira': 'Oeste', 'Vila Nova Paraiso': 'Oeste', 'Vila Novo Sao Lucas': 'Centro-sul', 'Vila Oeste': 'Oeste', "Vila Olhos D'Agua": 'Barreiro', 'Vila Ouro Minas': 'Nordeste', 'Vila Paqueta': 'Pampulha', 'Vila Paraiso': 'Leste', 'Vila Paris': 'Centro-sul', 'Vila Petropolis': 'Barreiro', 'Vila Pilar': 'Barreiro', 'Vila Pinho': 'Barreiro', 'Vila Piratininga': 'Barreiro', 'Vila Piratininga Venda Nova': 'Venda nova', 'Vila Primeiro De Maio': 'Norte', 'Vila Puc': 'Noroeste', 'Vila Real': 'Pampulha', 'Vila Rica': 'Pampulha', 'Vila Santa Monica': 'Venda nova', 'Vila Santa Rosa': 'Pampulha', 'Vila Santo Antonio': 'Pampulha', 'Vila Santo Antonio Barroquinha': 'Pampulha', 'Vila Sao Dimas': 'Nordeste', 'Vila Sao Francisco': 'Pampulha', 'Vila Sao Gabriel': 'Nordeste', 'Vila Sao Gabriel Jacui': 'Nordeste', 'Vila Sao Geraldo': 'Leste', 'Vila Sao Joao Batista': 'Venda nova', 'Vila Sao Paulo': 'Nordeste', 'Vila Sao Rafael': 'Leste', 'Vila Satelite': 'Venda nova', 'Vila Sesc': 'Venda nova', 'Vila Sumare': 'Noroeste', 'Vila Suzana': 'Pampulha', 'Vila Tirol': 'Barreiro', 'Vila Trinta E Um De Marco': 'Noroeste', 'Vila Uniao': 'Leste', 'Vila Vera Cruz': 'Leste', 'Vila Vista Alegre': 'Oeste', 'Virginia': 'Oeste', 'Vista Alegre': 'Oeste', 'Vista Do Sol': 'Nordeste', 'Vitoria': 'Nordeste', 'Vitoria Da Conquista': 'Barreiro', 'Xangri-La': 'Pampulha', 'Xodo-Marize': 'Norte', 'Zilah Sposito': 'Norte'}
+    Returns:
+        A dict with the raw lists read from the page, the seconds spent browsing it, the
+        load statistics from wait_for_cards and the bytes transferred (None when not tracked).
+    """
 
-        for district in district_list:
-            # Check if the district is in my_dict
-            if district in my_dict:
-                regional.append(my_dict[district])
-            else:
-                # find the closest match to the district in my_dict
-                ratios = [(fuzz.ratio(district, key), key)
-                          for key in my_dict.keys()]
-                closest_match = max(ratios, key=lambda x: x[0])[1]
-                # add the value for the closest match to the regional list
-                regional.append(my_dict[closest_match])
+    import time
 
-        endereco_list = [str(address) + ", " + str(district) +
-                         ", Belo Horizonte" for address, district in zip(address_list, district_list)]
+    start_time = time.time()
+    driver.set_page_load_timeout(timeout)
+    driver.get(url)
 
-        lat = []
-        lng = []
-        geocode_result = gmaps.geocode(endereco_list)
+    load = wait_for_cards(driver, timeout=max(0, timeout - (time.time() - start_time)))
 
-        for endereco in endereco_list:
-            geocode_result = gmaps.geocode(endereco)
-            if not geocode_result:
-                lat.append(np.nan)
-                lng.append(np.nan)
-            else:
-                location = geocode_result[0]['geometry']['location']
-                lat.append(location['lat'])
-                lng.append(location['lng'])
+    # one round trip for every card of the page, read while the driver is still on it
+    extract_time = time.time()
+    page = extract_cards(driver)
+    page["extract"] = time.time() - extract_time
+    page["elapsed"] = time.time() - start_time
+    # set_page_load_timeout, get, the load checks and the extraction
+    page["round_trips"] = 3 + load["polls"]
+    page["bytes"] = None
+    if policy is not None and policy.track_bytes:
+        page["bytes"] = policy.bytes_transferred(driver)
+        page["round_trips"] += 1
+    page["load"] = load
 
-        # creating a list of tuples
-        total = list(zip(prices_brl, condos_brl, district_list, address_list, area_list,
-                     bedrooms_list, baths_list, parking_list, src_list, full_links, regional, lat, lng))
+    return page
 
-        unique_total = []
-        # iterate over each tuple in the total list
-        for row in total:
-            # check if the row is already in the unique_total list
-            if row not in unique_total:
-                # if not, append the row to the unique_total list
-                unique_total.append(row)
 
-        check = check.append(pd.DataFrame(unique_total, columns=header))
+def _iter_pages(urls, engine="selenium", workers=4, recycle_after=10, page_timeout=20, concurrency=16,
+                driver_path=None, policy=None, controller=None):
+    """Yields the page dict of every url, in order, fetching ahead of the consumer.
 
-        # check.drop_duplicates(inplace=True)
-        check["price(R$)"] = check["price(R$)"].astype(float)
-        check["area(m²)"] = check["area(m²)"].astype(float)
-        check['parkings'] = check['parkings'].astype('Int64')
+    Urls are consumed lazily, so they can come from an open-ended generator; closing the
+    generator stops the browsers.
 
-        end_time = time.time()
-        diference_time = end_time - start_time
-
-        print(f"page {page_num} was scraped in {round(diference_time)} seconds")
-
-        total_shape = check.shape
-        unique_check = check.drop_duplicates()
-        unique_shape = unique_check.shape
-        print("Total shape of check DataFrame: ", total_shape)
-        print("Shape of unique rows in check DataFrame: ", unique_shape)
-        driver.quit()
-
-    # Get existing IDs in the table
-    existing_ids = supabase.table("data_scrap").select("id").execute().data
-
-    # Convert the IDs to a set for efficient membership testing
-    existing_ids = set([row["id"] for row in existing_ids])
-
-    # Get the last used ID in the table
-    last_id = max(existing_ids) if existing_ids else 0
-
-    new_rows_added = 0
-
-    for index, row in check.iterrows():
-        # Increment the ID for each new row
-        last_id += 1
-
-        if last_id not in existing_ids:
-            values = {
-                "id": last_id,
-                "price(R$)": row["price(R$)"],
-                "condo(R$)": row["condo(R$)"],
-                "district": row["district"],
-                "address": row["address"],
-                "area(m²)": row["area(m²)"],
-                "bedroom": row["bedroom"],
-                "bathrooms": row["bathrooms"],
-                "parkings": row["parkings"],
-                "url(image)": row["url(image)"],
-                "url(apt)": row["url(apt)"],
-                "created_at": date1,
-                "regional": row["regional"],
-                "lat": row["lat"],
-                "lng": row["lng"]
-            }
-            for key, value in values.items():
-                if pd.isna(value):
-                    values[key] = None
+    Args:
+        urls (iterable): Results pages to scrape.
+        engine (str, optional): "selenium" or "http", see scrape.
+        workers (int, optional): Number of headless Chrome drivers.
+        recycle_after (int, optional): Pages a driver serves before it is restarted.
+        page_timeout (float, optional): Seconds a page gets to load.
+        concurrency (int, optional): Maximum number of HTTP requests in flight.
+        driver_path (str or callable, optional): Chromedriver binary, or a function returning it,
+                                                 called only when a browser is needed.
+        policy (ResourcePolicy, optional): What the browsers are allowed to download.
+        controller (AdaptiveConcurrency, optional): Adapts the pages loaded at the same time to how the
+                                                    site responds, and decides on retries.
+
+    Yields:
+        The page dict of each url, or None when the page could not be scraped.
+    """
 
+    import time
+    from collections import deque
+    from concurrent.futures import Future
+    from functools import partial
+
+    page_fn = partial(_scrape_page, timeout=page_timeout, policy=policy)
+    pool = None
+
+    if controller is not None:
+        scrape_page = page_fn
+
+        def page_fn(driver, url):
+            # browsers cannot see HTTP statuses, slow and empty pages tell of throttling
+            while True:
+                started = controller.acquire()
+                start_time = time.time()
+                try:
+                    page = scrape_page(driver, url)
+                except Exception:
+                    controller.release(started, time.time() - start_time)
+                    raise
+                outcome = controller.release(started, page["elapsed"], cards=len(page["posting"]))
+                if outcome == "throttled" and not page["posting"] and controller.allow_retry():
+                    print(f"Retrying {url}")
+                    continue
+                return page
+
+    def browser_pool():
+        nonlocal pool
+        if pool is None:
+            from selenium.webdriver.chrome.service import Service
+
+            path = driver_path() if callable(driver_path) else driver_path
+            servico = Service(path or resolve_driver_path())
+            pool = BrowserPool(servico, build_options(policy), workers=workers, recycle_after=recycle_after,
+                               policy=policy)
+        return pool
+
+    if engine == "selenium":
+        yield from browser_pool().imap(page_fn, urls)
+        return
+
+    def browse(failed):
+        nonlocal browser_error
+        if browser_error is None:
             try:
-                res = supabase.table("data_scrap").upsert(values).execute()
-                new_rows_added += 1
-                print(f"Row {last_id} inserted successfully")
+                return browser_pool().map(page_fn, failed)
             except Exception as e:
-                supabase.table("entradas").upsert(
-                    {"error": str(e), "status": "failed"}).execute()
-                print(f"Error inserting row {last_id}: {e}")
-
-    if new_rows_added > 0:
-        print(f"{new_rows_added} rows added to 'data_scrap' table")
-        date2 = (datetime.utcnow() - timedelta(hours=3)
-                 ).strftime("%Y-%m-%dT%H:%M:%S")
-        try:
-            # Insert the number of new rows added into the 'entrada' table
-            supabase.table("entradas").upsert(
-                {"error": None, "prop_scrap": new_rows_added, "created_at": date1, "status": "complete", "completed_at": date2, "pages": url_list}).execute()
-        except Exception as e:
-            # Insert the error message into the table
-            supabase.table("entradas").upsert(
-                {"error": str(e), "status": "failed"}).execute()
-    else:
-        print("There is nothing to add")
-
-    print("Time to look at your supabase!!!")
-
-
-def scrap_rent(x, y=None, url_type="normal"):
-    """A function that scrapes a website called imovelweb and returns a csv file with some property characteristics.
+                # without Chrome the pages it should have read fail, the crawl goes on
+                browser_error = e
+                print(f"Could not start Chrome for the pages the http engine could not read: {e!r}")
+        return [None] * len(failed)
+
+    # the next pages are fetched while the consumer is busy with the current one, so a slow
+    # page only delays its own turn, not the fetching of the pages after it
+    browser_error = None
+    urls = iter(urls)
+    window = deque()
+    with HttpFetcher(concurrency, page_timeout, controller) as fetcher:
+        while True:
+            while len(window) < 2 * concurrency:
+                url = next(urls, None)
+                if url is None:
+                    break
+                window.append([url, fetcher.submit(url)])
+            if not window:
+                return
+
+            head = window[0]
+            if isinstance(head[1], Future) and head[1].result()[1]:
+                # pages the http engine could not read go through Chrome, together with the
+                # ones of the window it already gave up on
+                failed = [entry for entry in window
+                          if isinstance(entry[1], Future) and entry[1].done() and entry[1].result()[1]]
+                for entry, page in zip(failed, browse([entry[0] for entry in failed])):
+                    entry[1] = page
+            url, page = window.popleft()
+            yield page.result()[0] if isinstance(page, Future) else page
+
+
+def scrape(operation, x, y=None, url_type="normal", workers=4, recycle_after=10, page_timeout=20,
+           engine="selenium", concurrency=16, adaptive=True, retry_budget=0.5,
+           geocode_cache="geocode_cache.sqlite3", geocode_ttl=90 * 24 * 3600, geocode_workers=8, geocode_qps=10,
+           address_match=0.9,
+           regional_memo="regional_memo.json", batch_size=500,
+           new_only=False, seen_index="seen_listings_{operation}.bin", stop_after=2, max_pages=200, queue_size=4,
+           resume=None, checkpoint_dir="checkpoints", export=None,
+           base_url=BASE_URL, supabase_client=None, geocoder=None, metrics_file=None, on_metrics=None,
+           driver_path=None, resource_policy=None, city=DEFAULT_CITY, property_type=DEFAULT_PROPERTY_TYPE,
+           pages=None, track_changes=True, listing_state="listing_state.sqlite3", details=False,
+           detail_cache="detail_cache.sqlite3", detail_workers=4, detail_qps=2, mirror="listings.sqlite3"):
+    """Scrapes imovelweb listings through a staged pipeline and feeds a database in supabase.
+
+    Pages go through four stages running at the same time, connected by bounded queues:
+    fetch (browser pool or http engine), parse, enrich (regional and geocoding) and sink
+    (batched upserts). While a page is geocoded the next ones are already being browsed,
+    and rows are written as soon as their batch is full.
 
     Args:
+        operation (str): "buy" or "rent", see OPERATIONS.
         x (int): First page to scrape. If y is not specified, this argument is treated as a single page input.
         y (int, optional): Last page to scrape (not included in the range of pages to scrape).
                            If specified, pages x to y-1 will be scraped.
         url_type (str, optional): Type of URL template to use. "normal" for normal URL or "last-day" for last day URL.
+        workers (int, optional): Number of headless Chrome drivers browsing pages in parallel.
+        recycle_after (int, optional): Number of pages a driver serves before it is restarted.
+        page_timeout (float, optional): Seconds a page gets to load its property cards.
+        engine (str, optional): "selenium" to browse every page with Chrome or "http" to fetch the pages
+                                over plain HTTP, using Chrome only for pages that need JavaScript.
+        concurrency (int, optional): Maximum number of HTTP requests in flight with the "http" engine.
+        adaptive (bool, optional): Adapt the pages fetched at the same time, up to workers or concurrency,
+                                   to the latency, empty pages and throttling of the site (AIMD), and
+                                   back off when it throttles.
+        retry_budget (float, optional): Retries of throttled or failed pages allowed per page fetched,
+                                        with adaptive.
+        geocode_cache (str, optional): SQLite file caching geocoding results between runs.
+        geocode_ttl (float, optional): Seconds a cached geocoding result stays valid.
+        geocode_workers (int, optional): Number of geocoding requests in flight.
+        geocode_qps (float, optional): Maximum geocoding queries per second, to stay within the API quota.
+        address_match (float, optional): Lowest confidence, between 0 and 1, for an address to take the
+                                         location of a variant already resolved instead of being geocoded.
+                                         None sends every address not cached to the API.
+        regional_memo (str, optional): JSON file remembering fuzzy district -> regional matches between runs.
+        batch_size (int, optional): Rows sent to supabase per upsert request.
+        new_only (bool, optional): Skip listings already stored by earlier runs and stop paginating once
+                                   `stop_after` pages in a row have no new listings. With new_only, a
+                                   missing y means "keep going" (up to max_pages pages).
+        seen_index (str, optional): File with the ids of the listings already stored. "{operation}" is replaced
+                                    by the operation, so buy and rent listings are tracked apart.
+        stop_after (int, optional): Pages in a row without new listings that end a new_only crawl.
+        max_pages (int, optional): Most pages an open-ended new_only crawl visits.
+        queue_size (int, optional): Pages allowed to wait between two pipeline stages.
+        resume (str, optional): Run id of an interrupted run to pick up. Its finished pages are skipped
+                                and only its rows the database did not confirm are written again.
+                                x, y and url_type should be the ones of the original run.
+        checkpoint_dir (str, optional): Directory keeping the checkpoint of every run.
+        export (str, optional): Parquet or CSV file also receiving the rows, written in chunks with
+                                compact dtypes while the crawl runs.
+        base_url (str, optional): Root of the site, prefixed to the OPERATIONS urls and the listing links.
+        supabase_client (Client, optional): Supabase client to use instead of one built from the environment.
+        geocoder (optional): Object with a googlemaps-like geocode(address) method to use instead of a
+                             googlemaps.Client built from the environment.
+        metrics_file (str, optional): File receiving the run metrics at the end, as JSON for a .json
+                                      path and as a Prometheus textfile otherwise.
+        on_metrics (callable, optional): Called with the metrics summary at the end of the run.
+        driver_path (str or callable, optional): Chromedriver binary, or a function returning it. Defaults to
+                                                 the path cached by resolve_driver_path.
+        resource_policy (ResourcePolicy, optional): What the browsers may download. Defaults to
+                                                    ResourcePolicy(): eager loads, no images, media,
+                                                    fonts or analytics, and bytes counted per page.
+        city (str, optional): City slug of the site. Regionals are only resolved for Belo Horizonte.
+        property_type (str, optional): Property type slug of the site, e.g. "casas".
+        pages (list, optional): Page numbers to scrape, used instead of the x to y range.
+        track_changes (bool, optional): Only write listings that are new or whose price, condo fee, area
+                                        or features changed since they were last stored, and write
+                                        what changed into the history table of the operation.
+        listing_state (str, optional): SQLite file with the content hash of every listing stored.
+        details (bool, optional): Also visit the page of every listing no earlier run stored, and add its
+                                  IPTU, floor, amenities, description and publish date to the row.
+        detail_cache (str, optional): SQLite file caching the parsed listing pages by listing id.
+        detail_workers (int, optional): Number of listing pages fetched at the same time.
+        detail_qps (float, optional): Maximum listing page requests per second to each host.
+        mirror (str, optional): SQLite file of the LocalMirror receiving every row the database confirmed,
+                                for local analytics. None turns it off.
 
     Returns:
-        Feeds a database in supabase.
+        Feeds a database in supabase, and the export file if one was given. Also returns a dict
+        summarizing the run: pages, rows, unique rows, rows written, elapsed seconds, the
+        seconds spent in each stage, the seconds until the first page came in, the pages that
+        could not be scraped and the metrics summary, which is also stored in the run record of
+        log_table.
     """
 
-    from selenium import webdriver
-    from selenium.webdriver.common.by import By
-    from selenium.webdriver.chrome.options import Options
-    from selenium.webdriver.chrome.service import Service
-    from webdriver_manager.chrome import ChromeDriverManager
-    from supabase import create_client
-    from datetime import datetime, timedelta
-    import numpy as np
-    import pandas as pd
-    import re
-    import googlemaps
     import time
+    call_time = time.time()
+
+    import contextlib
+    from datetime import datetime, timedelta
     import os
-    from unidecode import unidecode
-    from dotenv import load_dotenv
-    from rapidfuzz import fuzz
     import warnings
     warnings.filterwarnings("ignore", category=FutureWarning)
 
-    load_dotenv()
-
-    url_supa = os.environ.get("SUPABASE_URL")
-    key_supa = os.environ.get("SUPABASE_KEY2")
-    key_google = os.environ.get("API_GOOGLE")
-
-    supabase = create_client(url_supa, key_supa)
-    gmaps = googlemaps.Client(key=key_google)
+    if operation not in OPERATIONS:
+        raise ValueError(f"Invalid operation. Must be one of {', '.join(OPERATIONS)}.")
+    config = OPERATIONS[operation]
 
     if x == 0:
         raise ValueError("The value of x cannot be zero.")
 
-    if y is None:
+    if pages is not None:
+        # Explicit pages, as handed out by the scheduler
+        page_range = list(pages)
+    elif y is None and new_only:
+        # Open-ended input, stops once no new listings show up
+        page_range = range(x, x + max_pages)
+    elif y is None:
         # Single page input
         page_range = [x]
     else:
         # Multiple pages input
         page_range = range(x, y)
 
-    if url_type == "normal":
-        url_template = "https://www.imovelweb.com.br/apartamentos-aluguel-belo-horizonte-mg-pagina-{}.html"
-    elif url_type == "last-day":
-        url_template = "https://www.imovelweb.com.br/apartamentos-aluguel-belo-horizonte-mg-publicado-no-ultimo-dia-pagina-{}.html"
-    else:
-        raise ValueError("Invalid url_type. Must be 'normal' or 'last-day'.")
-
-    url_list = [url_template.format(page) for page in page_range]
-
-    base_url = "https://www.imovelweb.com.br"
+    url_template = url_template_for(operation, url_type, city, property_type, base_url)
+
+    if engine not in ("selenium", "http"):
+        raise ValueError("Invalid engine. Must be 'selenium' or 'http'.")
+
+    if supabase_client is None or geocoder is None:
+        from dotenv import load_dotenv
+        load_dotenv()
+
+    if supabase_client is None:
+        from supabase import create_client
+        url_supa = os.environ.get("SUPABASE_URL")
+        key_supa = os.environ.get("SUPABASE_KEY2")
+        supabase_client = create_client(url_supa, key_supa)
+    if geocoder is None:
+        import googlemaps
+        key_google = os.environ.get("API_GOOGLE")
+        geocoder = googlemaps.Client(key=key_google)
+    supabase = supabase_client
+    gmaps = geocoder
+    cache = GeocodeCache(geocode_cache, ttl=geocode_ttl)
+    # one bucket for the whole run, the quota is per second and not per page
+    geocode_bucket = TokenBucket(geocode_qps)
+    # spelling variants of streets already resolved are answered from memory
+    index = AddressIndex.from_cache(cache) if address_match is not None else None
+    resolver = get_resolver(regional_memo)
+
+    url_list = []
 
     # Get the current datetime in UTC
     date1 = (datetime.utcnow() - timedelta(hours=3)
              ).strftime("%Y-%m-%dT%H:%M:%S")
 
-    # Create a new Options object for configuring the Chrome driver
-    option = Options()
-
-    # Set the window size of the browser to 1920x1080 pixels
-    option.add_argument("--window-size=1920,1080")
-
-    # Disable GPU acceleration to improve performance
-    option.add_argument("--disable-gpu")
-
-    # Disable any installed browser extensions to avoid potential conflicts
-    option.add_argument("--disable-extensions")
-
-    # Disable the use of automation extensions, which could interfere with website behavior
-    option.add_argument('--disable-useAutomationExtension')
-
-    # Specify a direct connection to the internet, bypassing any proxy settings
-    option.add_argument("--proxy-server='direct://'")
-    option.add_argument("--proxy-bypass-list=*")
-
-    # Start the browser maximized to fill the screen
-    option.add_argument("--start-maximized")
-
-    # Run the browser in headless mode, meaning without a visible user interface
-    option.add_argument("--headless")
-
-    # Set the User-Agent header of the browser to mimic a Windows 10 desktop machine running Chrome 87
-    option.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64)" +
-                        "AppleWebKit/537.36 (KHTML, like Gecko)"+"Chrome/87.0.4280.141 Safari/537.36")
-
-    header = ("price(R$)", "condo(R$)", "district", "address", "area(m²)",
-              "bedroom", "bathrooms", "parkings", "url(image)", "url(apt)", "regional", "lat", "lng")
-
-    servico = Service(ChromeDriverManager().install())
-    check = pd.DataFrame(columns=header)
-
-    # creating a header for my list
+    # the rows are streamed to the sinks, only their keys are kept for the dedup
+    rows = RowAccumulator(HEADER, keep_rows=False)
+    # a resumed run adds its rows to the export of the pages already done
+    exporter = ExportWriter(export, append=resume is not None) if export is not None else None
+
+    if resume is not None:
+        checkpoint = Checkpoint.open(checkpoint_dir, resume)
+        if checkpoint.manifest["operation"] != operation:
+            raise ValueError(f"Run {resume!r} is a {checkpoint.manifest['operation']!r} run.")
+        # the resumed rows keep the timestamp of the original run
+        date1 = checkpoint.manifest["created_at"]
+        done = checkpoint.pages_done()
+        page_range = [page for page in page_range if page not in done]
+        # listings of the finished pages still count for the dedup
+        for page in checkpoint.pages():
+            rows.add(tuple(record[column] for column in HEADER) for record in page["rows"])
+        print(f"Resuming run {resume}: {len(done)} pages already done")
+    else:
+        checkpoint = Checkpoint.create(checkpoint_dir, operation,
+                                       {"x": x, "y": y, "url_type": url_type, "created_at": date1})
+        print(f"Checkpointing run {checkpoint.run_id}, pass resume={checkpoint.run_id!r} to pick it up if it stops")
+
+    # unchanged listings are not written again, changed ones also get a row in the history table
+    tracker = ChangeTracker(operation, listing_state) if track_changes else None
+    history = SupabaseWriter(supabase, config["history_table"], config["log_table"], batch_size=batch_size,
+                             on_conflict="change_id")
+
+    # the local copy for analytics follows what the database stored
+    local_mirror = LocalMirror(mirror) if mirror is not None else None
+
+    def confirmed(written_rows):
+        checkpoint.record_written(written_rows)
+        if local_mirror is not None:
+            local_mirror.upsert(operation, written_rows)
+        if tracker is not None:
+            history.write(tracker.commit(written_rows, date1))
+
+    # rows are upserted in batches on their url, so a listing is never stored twice
+    writer = SupabaseWriter(supabase, config["table"], config["log_table"], batch_size=batch_size,
+                            on_written=confirmed)
+
+    if resume is not None:
+        pending = checkpoint.pending_rows()
+        if pending:
+            print(f"Writing {len(pending)} checkpointed rows the database did not confirm")
+            writer.write(pending)
+
+    # every run records what it stored, new_only runs also use it to skip known listings
+    seen = SeenIndex(seen_index.format(operation=operation))
+
+    state = {"idle_pages": 0, "done": False, "pages": 0, "failed_pages": []}
+
+    # stage timers, counters and page latencies of the run
+    metrics = Metrics()
+
+    detail_store = DetailCache(detail_cache) if details else None
+    # one client and one pool for the listing pages of the whole run
+    detail_fetcher = DetailFetcher(detail_store, workers=detail_workers, limiter=HostRateLimiter(detail_qps),
+                                   timeout=page_timeout, metrics=metrics) if details else None
+
+    # starts low, grows while the site keeps up and backs off as soon as it throttles
+    controller = None
+    if adaptive:
+        controller = AdaptiveConcurrency(maximum=concurrency if engine == "http" else workers,
+                                         slow_after=page_timeout / 2, retry_budget=retry_budget)
+
+    pages = _iter_pages((url_template.format(page) for page in page_range), engine=engine, workers=workers,
+                        recycle_after=recycle_after, page_timeout=page_timeout, concurrency=concurrency,
+                        driver_path=driver_path,
+                        policy=resource_policy if resource_policy is not None else ResourcePolicy(),
+                        controller=controller)
+
+    def source():
+        try:
+            for page_num, page in zip(page_range, pages):
+                if not url_list:
+                    # imports, clients and browser start-up all happen before the first page
+                    metrics.add_time("time_to_first_page", time.time() - call_time)
+                    print(f"First page in {time.time() - call_time:.1f} seconds")
+                url_list.append(url_template.format(page_num))
+                yield page_num, page
+        finally:
+            pages.close()
+
+    def parse(item):
+        page_num, page = item
+        if state["done"]:
+            return None
+
+        metrics.inc("pages_fetched")
+        if page is None:
+            metrics.inc("pages_failed")
+            state["failed_pages"].append(page_num)
+        else:
+            metrics.inc("cards_found", len(page["posting"]))
+            metrics.inc("webdriver_round_trips", page.get("round_trips", 0))
+            if page.get("bytes") is not None:
+                metrics.inc("bytes_transferred", page["bytes"])
+
+        if new_only:
+            # listings stored by an earlier run are not enriched again
+            found = len(page["posting"]) if page is not None else 0
+            page = new_cards(page, seen) if page is not None else None
+            metrics.inc("cards_known", found - (len(page["posting"]) if page is not None else 0))
+            if page is None or not page["posting"]:
+                state["idle_pages"] += 1
+                print(f"page {page_num} has no new listings ({found} cards)")
+                if state["idle_pages"] >= stop_after:
+                    print(f"Stopping after {state['idle_pages']} pages in a row without new listings")
+                    state["done"] = True
+                    pipeline.stop()
+                return None
+            state["idle_pages"] = 0
+        elif page is None:
+            # the page kept crashing its browser, keep going with the others
+            return None
 
-    for page_num in page_range:
         start_time = time.time()
-        url = url_template.format(page_num)
-        driver = webdriver.Chrome(service=servico, options=option)
-        driver.get(url)
-
-        time.sleep(5)
-        for i in range(16):
-            driver.execute_script("window.scrollBy(0, 550)")
-            time.sleep(0.4)
-
-        # finding the elements
-        scrap_img = driver.find_elements(
-            By.CSS_SELECTOR, '[data-qa="posting PROPERTY"] .flickity-slider img:first-child')
-        scrap_location = driver.find_elements(
-            By.CSS_SELECTOR, '[data-qa="posting PROPERTY"] [data-qa="POSTING_CARD_LOCATION"]')
-        scrap_location2 = driver.find_elements(By.CLASS_NAME, 'sc-ge2uzh-0')
-        scrap_features = driver.find_elements(
-            By.CSS_SELECTOR, '[data-qa="posting PROPERTY"] [data-qa="POSTING_CARD_FEATURES"]')
-        scrap_condo = driver.find_elements(By.CLASS_NAME, 'sc-12dh9kl-0')
-        scrap_link = driver.find_elements(
-            By.CSS_SELECTOR, '[data-qa="posting PROPERTY"]')
-
-        # cleaning / organizing lists
-        address = [str(element.text) for element in scrap_location2]
-        features1 = [element.text for element in scrap_features]
-        features1 = [element.replace("\n", " ") for element in features1]
-        condo1 = [str(element.text) for element in scrap_condo]
-        condo1 = [x.replace("\n", " ").replace("R$", "").replace(
-            "Condominio", "").replace(".", "").strip() for x in condo1]
-
-        # creating a list of each element we want to extract
-        prices_brl = [int(row.split()[0]) if len(row.split()) >= 1 and row.split()[
-            0].isdigit() else None for row in condo1]
-        condos_brl = [int(row.split()[1]) if len(row.split()) == 2 and row.split()[
-            1].isdigit() else None for row in condo1]
-        district_list = [str(element.text.split(",")[0])
-                         if element.text else None for element in scrap_location]
-        address_list = [x.split(',')[0] if ',' in x and len(x.split(','))
-                        >= 2 else x if x else None for x in address]
-        area_list = [x.split('m²')[1].strip() if x.count('m²') > 1 and isinstance(x, str) else
-                     (x.split('m²')[0] + 'm²' if 'm²' in x and isinstance(x, str) else np.nan) for x in features1]
-        area_list = [x.split()[0].replace('m²', '').strip()
-                     if isinstance(x, str) else np.nan for x in area_list]
-        bedrooms_list = [re.search(r'(\d+) quartos', x).group(1)
-                         if 'quartos' in x else None for x in features1]
-        baths_list = [re.search(r'(\d+)\sban', x).group(1)
-                      if 'ban' in x else None for x in features1]
-        parking_list = [int(re.search(r'(\d+)\svagas', x).group(1))
-                        if 'vagas' in x else 0 for x in features1]
-        src_list = [img.get_attribute('src') if img.get_attribute(
-            'src') else None for img in scrap_img]
-        full_links = [
-            base_url + element.get_attribute("data-to-posting") for element in scrap_link]
-
-        # cleaning district
-        district_list = [unidecode(x) for x in district_list]
-        district_list = [x.title() for x in district_list]
-        district_list = [re.sub(r'\([^)]*\)', '', x).strip()
-                         for x in district_list]
-        district_list = [x.replace("ç", "c") for x in district_list]
+        listing = parse_cards(page, base_url)
+        metrics.add_time("parsing", time.time() - start_time)
+        metrics.add_time("page_load", page["elapsed"] - page["extract"])
+        metrics.add_time("extraction", page["extract"])
 
-        # creating Regional
-        regional = []
+        return page_num, page, listing, start_time
 
-        # Loop over the district_list
-        my_dict = {'Alta Tensao': 'Barreiro', 'Aarao Reis': 'Norte', 'Acaba Mundo': 'Centro-sul', 'Acaiaca': 'Nordeste', 'Ademar Maldonado': 'Barreiro', 'Aeroporto': 'Pampulha', 'Aguas Claras': 'Barreiro', 'Alipio De Melo': 'Pampulha', 'Alpes': 'Oeste', 'Alto Barroca': 'Oeste', 'Alto Caicaras': 'Noroeste', 'Alto Das Antenas': 'Barreiro', 'Alto Dos Pinheiros': 'Noroeste', 'Alto Vera Cruz': 'Leste', 'Alvaro Camargos': 'Noroeste', 'Ambrosina': 'Oeste', 'Anchieta': 'Centro-sul', 'Andiroba': 'Nordeste', 'Antonio Ribeiro De Abreu': 'Nordeste', 'Aparecida': 'Noroeste', 'Aparecida Setima Secao': 'Noroeste', 'Apia': 'Centro-sul', 'Apolonia': 'Venda nova', 'Araguaia': 'Barreiro', 'Atila De Paiva': 'Barreiro', 'Bacurau': 'Norte', 'Bairro Das Industrias I': 'Barreiro', 'Bairro Das Industrias II': 'Oeste', 'Bairro Novo Das Industrias': 'Barreiro', 'Baleia': 'Leste', 'Bandeirantes': 'Pampulha', 'Barao Homem De Melo': 'Oeste', 'Barreiro': 'Barreiro', 'Barro Preto': 'Centro-sul', 'Barroca': 'Oeste', 'Beija Flor': 'Nordeste', 'Beira-Linha': 'Nordeste', 'Bela Vitoria': 'Nordeste', 'Belem': 'Leste', 'Belmonte': 'Nordeste', 'Belvedere': 'Centro-sul', 'Bernadete': 'Barreiro', 'Betania': 'Oeste', 'Biquinhas': 'Norte', 'Bispo De Maura': 'Pampulha', 'Boa Esperanca': 'Nordeste', 'Boa Uniao': 'Norte', 'Boa Viagem': 'Centro-sul', 'Boa Vista': 'Leste', 'Bom Jesus': 'Noroeste', 'Bonfim': 'Noroeste', 'Bonsucesso': 'Barreiro', 'Brasil Industrial': 'Barreiro', 'Braunas': 'Pampulha', 'Buritis': 'Oeste', 'Cabana Do Pai Tomas': 'Oeste', 'Cachoeirinha': 'Nordeste', 'Caetano Furquim': 'Leste', 'Caicara-Adelaide': 'Noroeste', 'Caicaras': 'Noroeste', 'Caicara': 'Noroeste', 'Calafate': 'Oeste', 'California': 'Noroeste', 'Camargos': 'Oeste', 'Campo Alegre': 'Norte', 'Camponesa': 'Leste', 'Campus Ufmg': 'Pampulha', 'Canaa': 'Venda nova', 'Canada': 'Nordeste', 'Candelaria': 'Venda nova', 'Capitao Eduardo': 'Nordeste', 'Cardoso': 'Barreiro', 'Carlos Prates': 'Noroeste', 'Carmo': 'Centro-sul', 'Casa Branca': 'Leste', 'Castanheira': 'Barreiro', 'Castelo': 'Pampulha', 'Cdi Jatoba': 'Barreiro', 'Cenaculo': 'Venda nova', 'Centro': 'Centro-sul', 'Ceu Azul': 'Pampulha', 'Chacara Leonina': 'Oeste', 'Cidade Jardim': 'Centro-sul', 'Cidade Jardim Taquaril': 'Leste', 'Cidade Nova': 'Nordeste', 'Cinquentenario': 'Oeste', 'Colegio Batista': 'Nordeste', 'Comiteco': 'Centro-sul', 'Concordia': 'Nordeste', 'Conego Pinheiro': 'Leste', 'Conego Pinheiro A': 'Leste', 'Confisco': 'Pampulha', 'Conjunto Bonsucesso': 'Barreiro', 'Conjunto California': 'Noroeste', 'Conjunto Capitao Eduardo': 'Nordeste', 'Conjunto Celso Machado': 'Pampulha', 'Conjunto Floramar': 'Norte', 'Conjunto Jardim Filadelfia': 'Noroeste', 'Conjunto Jatoba': 'Barreiro', 'Conjunto Lagoa': 'Pampulha', 'Conjunto Minascaixa': 'Venda nova', 'Conjunto Novo Dom Bosco': 'Noroeste', 'Conjunto Paulo': 'Nordeste', 'Conjunto Providencia': 'Norte', 'Conjunto Santa Maria': 'Centro-sul', 'Conjunto Sao Francisco De Assis': 'Pampulha', 'Conjunto Serra Verde': 'Venda nova', 'Conjunto Taquaril': 'Leste', 'Copacabana': 'Pampulha', 'Coqueiros': 'Noroeste', 'Coracao De Jesus': 'Centro-sul', 'Coracao Eucaristico': 'Noroeste', 'Corumbiara': 'Barreiro', 'Cruzeiro': 'Centro-sul', 'Custodinha': 'Oeste', 'Delta': 'Noroeste', 'Diamante': 'Barreiro', 'Distrito Industrial Do Jatoba': 'Barreiro', 'Dom Bosco': 'Noroeste', 'Dom Cabral': 'Noroeste', 'Dom Joaquim': 'Nordeste', 'Dom Silverio': 'Nordeste', 'Dona Clara': 'Pampulha', 'Engenho Nogueira': 'Pampulha', 'Ermelinda': 'Noroeste', 'Ernesto Do Nascimento': 'Barreiro', 'Esperanca': 'Barreiro', 'Esplanada': 'Leste', 'Estoril': 'Oeste', 'Estrela': 'Centro-sul', 'Estrela Do Oriente': 'Oeste', 'Etelvina Carneiro': 'Norte', 'Europa': 'Venda nova', 'Eymard': 'Nordeste', 'Fazendinha': 'Centro-sul', 'Fernao Dias': 'Nordeste', 'Flamengo': 'Venda nova', 'Flavio De Oliveira': 'Barreiro', 'Flavio Marques Lisboa': 'Barreiro', 'Floramar': 'Norte', 'Floresta': 'Centro-sul', 'Frei Leopoldo': 'Norte', 'Funcionarios': 'Centro-sul', 'Gameleira': 'Oeste', 'Garcas': 'Pampulha', 'Gloria': 'Noroeste', 'Goiania': 'Nordeste', 'Graca': 'Nordeste', 'Grajau': 'Oeste', 'Granja De Freitas': 'Leste', 'Granja Werneck': 'Norte', 'Grota': 'Leste', 'Grotinha': 'Nordeste', 'Guanabara': 'Nordeste', 'Guarani': 'Norte', 'Guarata': 'Oeste', 'Gutierrez': 'Oeste', 'Havai': 'Oeste', 'Heliopolis': 'Norte', 'Horto': 'Leste', 'Horto Florestal': 'Leste', 'Imbaubas': 'Oeste', 'Inconfidencia': 'Pampulha', 'Indaia': 'Pampulha', 'Independencia': 'Barreiro', 'Ipe': 'Nordeste', 'Ipiranga': 'Nordeste', 'Itaipu': 'Barreiro', 'Itapoa': 'Pampulha', 'Itatiaia': 'Pampulha', 'Jaqueline': 'Norte', 'Jaragua': 'Pampulha', 'Jardim Alvorada': 'Pampulha', 'Jardim America': 'Oeste', 'Jardim Atlantico': 'Pampulha', 'Jardim Do Vale': 'Barreiro', 'Jardim Dos Comerciarios': 'Venda nova', 'Jardim Felicidade': 'Norte', 'Jardim Guanabara': 'Norte', 'Jardim Leblon': 'Venda nova', 'Jardim Montanhes': 'Noroeste', 'Jardim Sao Jose': 'Pampulha', 'Jardim Vitoria': 'Nordeste', 'Jardinopolis': 'Oeste', 'Jatoba': 'Barreiro', 'Joao Alfredo': 'Leste', 'Joao Paulo Ii': 'Barreiro', 'Joao Pinheiro': 'Noroeste', 'Jonas Veiga': 'Leste', 'Juliana': 'Norte', 'Lagoa': 'Venda nova', 'Lagoa Da Pampulha': 'Pampulha', 'Lagoinha': 'Noroeste', 'Lagoinha Leblon': 'Venda nova', 'Lajedo': 'Norte', 'Laranjeiras': 'Venda nova', 'Leonina': 'Oeste', 'Leticia': 'Venda nova', 'Liberdade': 'Pampulha', 'Lindeia': 'Barreiro', 'Lorena': 'Noroeste', 'Lourdes': 'Centro-sul', 'Luxemburgo': 'Centro-sul', 'Madre Gertrudes': 'Oeste', 'Madri': 'Norte', 'Mala E Cuia': 'Centro-sul', 'Manacas': 'Pampulha', 'Mangabeiras': 'Centro-sul', 'Mangueiras': 'Barreiro', 'Mantiqueira': 'Venda nova', 'Marajo': 'Oeste', 'Maravilha': 'Oeste', 'Marcola': 'Centro-sul', 'Maria Goretti': 'Nordeste', 'Maria Helena': 'Venda nova', 'Maria Teresa': 'Norte', 'Maria Virginia': 'Nordeste', 'Mariano De Abreu': 'Leste', 'Marieta': 'Barreiro', 'Marilandia': 'Barreiro', 'Mariquinhas': 'Norte', 'Marmiteiros': 'Noroeste', 'Milionarios': 'Barreiro', 'Minas Brasil': 'Noroeste', 'Minascaixa': 'Venda nova', 'Minaslandia': 'Norte', 'Mineirao': 'Barreiro', 'Miramar': 'Barreiro', 'Mirante': 'Norte', 'Mirtes': 'Nordeste', 'Monsenhor Messias': 'Noroeste', 'Monte Azul': 'Norte', 'Monte Sao Jose': 'Centro-sul', 'Morro Dos Macacos': 'Nordeste', 'Nazare': 'Nordeste', 'Nossa Senhora Da Aparecida': 'Centro-sul', 'Nossa Senhora Da Conceicao': 'Centro-sul', 'Nossa Senhora De Fatima': 'Centro-sul',
-                   'Nossa Senhora Do Rosario': 'Centro-sul', 'Nova America': 'Venda nova', 'Nova Cachoeirinha': 'Noroeste', 'Nova Cintra': 'Oeste', 'Nova Esperanca': 'Noroeste', 'Nova Floresta': 'Nordeste', 'Nova Gameleira': 'Oeste', 'Nova Granada': 'Oeste', 'Nova Pampulha': 'Pampulha', 'Nova Suissa': 'Oeste', 'Nova Vista': 'Leste', 'Novo Aarao Reis': 'Norte', 'Novo Gloria': 'Noroeste', 'Novo Ouro Preto': 'Pampulha', 'Novo Santa Cecilia': 'Barreiro', 'Novo Sao Lucas': 'Centro-sul', 'Novo Tupi': 'Norte', 'Oeste': 'Oeste', 'Olaria': 'Barreiro', "Olhos D'Agua": 'Barreiro', 'Ouro Minas': 'Nordeste', 'Ouro Preto': 'Pampulha', 'Padre Eustaquio': 'Noroeste', 'Palmares': 'Nordeste', 'Palmeiras': 'Oeste', 'Pantanal': 'Oeste', 'Paqueta': 'Pampulha', 'Paraiso': 'Leste', 'Parque Sao Jose': 'Oeste', 'Parque Sao Pedro': 'Venda nova', 'Paulo Vi': 'Nordeste', 'Pedreira Prado Lopes': 'Noroeste', 'Penha': 'Nordeste', 'Petropolis': 'Barreiro', 'Pilar': 'Barreiro', 'Pindorama': 'Noroeste', 'Pindura Saia': 'Centro-sul', 'Piraja': 'Nordeste', 'Piratininga': 'Venda nova', 'Pirineus': 'Leste', 'Planalto': 'Norte', 'Pompeia': 'Leste', 'Pongelupe': 'Barreiro', 'Pousada Santo Antonio': 'Nordeste', 'Prado': 'Oeste', 'Primeiro De Maio': 'Norte', 'Providencia': 'Norte', 'Renascenca': 'Nordeste', 'Ribeiro De Abreu': 'Nordeste', 'Rio Branco': 'Venda nova', 'Sagrada Familia': 'Leste', 'Salgado Filho': 'Oeste', 'Santa Amelia': 'Pampulha', 'Santa Branca': 'Pampulha', 'Santa Cecilia': 'Barreiro', 'Santa Cruz': 'Nordeste', 'Santa Efigenia': 'Leste', 'Santa Helena': 'Barreiro', 'Santa Ines': 'Leste', 'Santa Isabel': 'Centro-sul', 'Santa Lucia': 'Oeste', 'Santa Margarida': 'Barreiro', 'Santa Maria': 'Oeste', 'Santa Monica': 'Pampulha', 'Santa Rita': 'Barreiro', 'Santa Rita De Cassia': 'Centro-sul', 'Santa Rosa': 'Pampulha', 'Santa Sofia': 'Oeste', 'Santa Tereza': 'Leste', 'Santa Terezinha': 'Pampulha', 'Santana Do Cafezal': 'Centro-sul', 'Santo Agostinho': 'Centro-sul', 'Santo Andre': 'Noroeste', 'Santo Antonio': 'Centro-sul', 'Sao Benedito': 'Nordeste', 'Sao Bento': 'Centro-sul', 'Sao Bernardo': 'Norte', 'Sao Cristovao': 'Noroeste', 'Sao Damiao': 'Venda nova', 'Sao Francisco': 'Pampulha', 'Sao Francisco Das Chagas': 'Noroeste', 'Sao Gabriel': 'Nordeste', 'Sao Geraldo': 'Leste', 'Sao Goncalo': 'Norte', 'Sao Joao': 'Barreiro', 'Sao Joao Batista': 'Venda nova', 'Sao Jorge': 'Oeste', 'Sao Jose': 'Pampulha', 'Sao Lucas': 'Centro-sul', 'Sao Luiz': 'Pampulha', 'Sao Marcos': 'Nordeste', 'Sao Paulo': 'Nordeste', 'Sao Pedro': 'Centro-sul', 'Sao Salvador': 'Noroeste', 'Sao Sebastiao': 'Nordeste', 'Sao Tomaz': 'Norte', 'Sao Vicente': 'Leste', 'Satelite': 'Norte', 'Saudade': 'Leste', 'Savassi': 'Centro-sul', 'Senhor Dos Passos': 'Noroeste', 'Serra': 'Centro-sul', 'Serra Do Curral': 'Barreiro', 'Serra Verde': 'Venda nova', 'Serrano': 'Pampulha', 'Silveira': 'Nordeste', 'Sion': 'Centro-sul', 'Solar Do Barreiro': 'Barreiro', 'Solimoes': 'Norte', 'Sport Club': 'Oeste', 'Sumare': 'Noroeste', 'Suzana': 'Pampulha', 'Taquaril': 'Leste', 'Teixeira Dias': 'Barreiro', 'Tiradentes': 'Nordeste', 'Tirol': 'Barreiro', 'Tres Marias': 'Nordeste', 'Trevo': 'Pampulha', 'Tunel De Ibirite': 'Barreiro', 'Tupi A': 'Norte', 'Tupi B': 'Norte', 'Uniao': 'Nordeste', 'Unidas': 'Venda nova', 'Universitario': 'Pampulha', 'Universo': 'Venda nova', 'Urca': 'Pampulha', 'Vale Do Jatoba': 'Barreiro', 'Varzea Da Palma': 'Venda nova', 'Venda Nova': 'Venda nova', 'Ventosa': 'Oeste', 'Vera Cruz': 'Leste', 'Vila Aeroporto': 'Norte', 'Vila Aeroporto Jaragua': 'Pampulha', 'Vila Antena': 'Oeste', 'Vila Antena Montanhes': 'Pampulha', 'Vila Atila De Paiva': 'Barreiro', 'Vila Bandeirantes': 'Centro-sul', 'Vila Barragem Santa Lucia': 'Centro-sul', 'Vila Batik': 'Barreiro', 'Vila Betania': 'Oeste', 'Vila Boa Vista': 'Leste', 'Vila Calafate': 'Oeste', 'Vila California': 'Noroeste', 'Vila Canto Do Sabia': 'Venda nova', 'Vila Cemig': 'Barreiro', 'Vila Cloris': 'Norte', 'Vila Copacabana': 'Venda nova', 'Vila Copasa': 'Barreiro', 'Vila Coqueiral': 'Noroeste', 'Vila Da Amizade': 'Oeste', 'Vila Da Area': 'Leste', 'Vila Da Luz': 'Nordeste', 'Vila Da Paz': 'Nordeste', 'Vila Das Oliveiras': 'Noroeste', 'Vila De Sa': 'Nordeste', 'Vila Dias': 'Leste', 'Vila Do Pombal': 'Nordeste', 'Vila Dos Anjos': 'Venda nova', 'Vila Ecologica': 'Barreiro', 'Vila Engenho Nogueira': 'Pampulha', 'Vila Esplanada': 'Nordeste', 'Vila Formosa': 'Barreiro', 'Vila Fumec': 'Centro-sul', 'Vila Havai': 'Oeste', 'Vila Independencia': 'Barreiro', 'Vila Inestan': 'Nordeste', 'Vila Ipiranga': 'Nordeste', 'Vila Jardim Alvorada': 'Pampulha', 'Vila Jardim Leblon': 'Venda nova', 'Vila Jardim Montanhes': 'Pampulha', 'Vila Jardim Sao Jose': 'Pampulha', 'Vila Madre Gertrudes': 'Oeste', 'Vila Maloca': 'Noroeste', 'Vila Mangueiras': 'Barreiro', 'Vila Mantiqueira': 'Venda nova', 'Vila Maria': 'Nordeste', 'Vila Minaslandia': 'Norte', 'Vila Nossa Senhora Aparecida': 'Venda nova', 'Vila Nossa Senhora Do Rosario': 'Leste', 'Vila Nova': 'Norte', 'Vila Nova Cachoeirinha': 'Noroeste', 'Vila Nova Dos Milionarios': 'Barreiro', 'Vila Nova Gameleira': 'Oeste', 'Vila Nova Paraiso': 'Oeste', 'Vila Novo Sao Lucas': 'Centro-sul', 'Vila Oeste': 'Oeste', "Vila Olhos D'Agua": 'Barreiro', 'Vila Ouro Minas': 'Nordeste', 'Vila Paqueta': 'Pampulha', 'Vila Paraiso': 'Leste', 'Vila Paris': 'Centro-sul', 'Vila Petropolis': 'Barreiro', 'Vila Pilar': 'Barreiro', 'Vila Pinho': 'Barreiro', 'Vila Piratininga': 'Barreiro', 'Vila Piratininga Venda Nova': 'Venda nova', 'Vila Primeiro De Maio': 'Norte', 'Vila Puc': 'Noroeste', 'Vila Real': 'Pampulha', 'Vila Rica': 'Pampulha', 'Vila Santa Monica': 'Venda nova', 'Vila Santa Rosa': 'Pampulha', 'Vila Santo Antonio': 'Pampulha', 'Vila Santo Antonio Barroquinha': 'Pampulha', 'Vila Sao Dimas': 'Nordeste', 'Vila Sao Francisco': 'Pampulha', 'Vila Sao Gabriel': 'Nordeste', 'Vila Sao Gabriel Jacui': 'Nordeste', 'Vila Sao Geraldo': 'Leste', 'Vila Sao Joao Batista': 'Venda nova', 'Vila Sao Paulo': 'Nordeste', 'Vila Sao Rafael': 'Leste', 'Vila Satelite': 'Venda nova', 'Vila Sesc': 'Venda nova', 'Vila Sumare': 'Noroeste', 'Vila Suzana': 'Pampulha', 'Vila Tirol': 'Barreiro', 'Vila Trinta E Um De Marco': 'Noroeste', 'Vila Uniao': 'Leste', 'Vila Vera Cruz': 'Leste', 'Vila Vista Alegre': 'Oeste', 'Virginia': 'Oeste', 'Vista Alegre': 'Oeste', 'Vista Do Sol': 'Nordeste', 'Vitoria': 'Nordeste', 'Vitoria Da Conquista': 'Barreiro', 'Xangri-La': 'Pampulha', 'Xodo-Marize': 'Norte', 'Zilah Sposito': 'Norte'}
+    def enrich(item):
+        page_num, page, listing, start_time = item
 
-        for district in district_list:
-            # Check if the district is in my_dict
-            if district in my_dict:
-                regional.append(my_dict[district])
+        # creating Regional
+        with metrics.timer("regional"):
+            if city == DEFAULT_CITY:
+                regional = resolver.resolve(listing["district"])
             else:
-                # find the closest match to the district in my_dict
-                ratios = [(fuzz.ratio(district, key), key)
-                          for key in my_dict.keys()]
-                closest_match = max(ratios, key=lambda x: x[0])[1]
-                # add the value for the closest match to the regional list
-                regional.append(my_dict[closest_match])
+                # the regional table only covers Belo Horizonte
+                regional = [None] * len(listing["district"])
 
         endereco_list = [str(address) + ", " + str(district) +
-                         ", Belo Horizonte" for address, district in zip(address_list, district_list)]
+                         ", " + city_name(city) for address, district in zip(listing["address"], listing["district"])]
 
         lat = []
         lng = []
-        geocode_result = gmaps.geocode(endereco_list)
 
-        for endereco in endereco_list:
-            geocode_result = gmaps.geocode(endereco)
-            if not geocode_result:
-                lat.append(np.nan)
-                lng.append(np.nan)
+        # repeated addresses and their variants are answered locally, the rest are geocoded concurrently
+        with metrics.timer("geocoding"):
+            locations = geocode_batch(gmaps, endereco_list, cache, workers=geocode_workers, bucket=geocode_bucket,
+                                      metrics=metrics, index=index, min_confidence=address_match,
+                                      with_confidence=True)
+        # a location borrowed from a variant keeps its match score, exported with the row
+        confidence = {url: score for url, (_, score) in zip(listing["url"], locations)}
+
+        for location, _ in locations:
+            if location is None:
+                lat.append(float("nan"))
+                lng.append(float("nan"))
             else:
-                location = geocode_result[0]['geometry']['location']
-                lat.append(location['lat'])
-                lng.append(location['lng'])
+                lat.append(location[0])
+                lng.append(location[1])
 
         # creating a list of tuples
-        total = list(zip(prices_brl, condos_brl, district_list, address_list, area_list,
-                     bedrooms_list, baths_list, parking_list, src_list, full_links, regional, lat, lng))
+        total = list(zip(listing["price"], listing["condo"], listing["district"], listing["address"],
+                         listing["area"], listing["bedroom"], listing["bathrooms"], listing["parkings"],
+                         listing["image"], listing["url"], regional, lat, lng))
+
+        return page_num, page, total, start_time, confidence, {}
+
+    url_index = HEADER.index("url(apt)")
+
+    def enrich_details(item):
+        page_num, page, total, start_time, confidence, _ = item
+
+        # only listings no earlier run stored are worth a visit, so the cost follows the new listings
+        urls = list(dict.fromkeys(row[url_index] for row in total if row[url_index] not in seen))
+        with metrics.timer("details"):
+            fetched = detail_fetcher.fetch(urls)
+        page_details = {url: fields for url, fields in zip(urls, fetched) if fields}
+        return page_num, page, total, start_time, confidence, page_details
+
+    def sink(item):
+        page_num, page, total, start_time, confidence, page_details = item
+        sink_time = time.time()
+
+        # listings already seen on an earlier page are dropped by their url
+        kept = rows.add(total)
+        metrics.inc("rows_deduped", len(total) - len(kept))
+        frame = rows_to_frame(kept)
+        records = frame_to_records(frame, date1) if kept else []
+        if tracker is not None and records:
+            records = tracker.diff(records)
+        for record in records:
+            record.update(page_details.get(record["url(apt)"], {}))
+        if exporter is not None:
+            export_frame = frame.assign(created_at=date1,
+                                        geocode_confidence=[confidence.get(url) for url in frame["url(apt)"]])
+            if details:
+                for column in DETAIL_COLUMNS:
+                    export_frame[column] = [page_details.get(url, {}).get(column) for url in frame["url(apt)"]]
+            exporter.write(export_frame)
+
+        # the page is on disk before its rows are sent, so a crash never loses it
+        checkpoint.record_page(page_num, url_template.format(page_num), records)
+        if records:
+            writer.write(records)
+
+        end_time = time.time()
+        diference_time = page["elapsed"] + end_time - start_time
+        metrics.add_time("sink", end_time - sink_time)
+        metrics.observe_page(page_num, url_template.format(page_num), diference_time)
+        state["pages"] += 1
+
+        size = f", {page['bytes'] / 1024:.0f} KB" if page.get("bytes") is not None else ""
+        print(f"page {page_num} was scraped in {round(diference_time)} seconds "
+              f"(waited {page['load']['wait']:.1f}s for {page['load']['cards']} cards"
+              f"{', timed out' if page['load']['timed_out'] else ''}{size})")
+
+        print("Total rows scraped: ", rows.total)
+        print("Unique listings: ", len(rows))
+
+    stages = [Stage("parse", parse), Stage("enrich", enrich), Stage("sink", sink)]
+    if details:
+        stages.insert(2, Stage("details", enrich_details))
+    pipeline = Pipeline(source(), stages, queue_size=queue_size)
+    status = "failed"
+    summary = None
+    run_time = time.time()
+    try:
+        pipeline.run()
+        status = "complete"
+    finally:
+        def flush():
+            with metrics.timer("sink"):
+                try:
+                    writer.flush()
+                finally:
+                    history.flush()
+
+        def report():
+            nonlocal summary
+            metrics.inc("sink_batches", writer.batches + history.batches)
+            metrics.inc("rows_written", writer.written)
+            metrics.inc("rows_failed", len(writer.errors))
+            if tracker is not None:
+                for name, value in tracker.stats.items():
+                    metrics.inc(f"listings_{name}", value)
+                metrics.inc("history_rows_written", history.written)
+                metrics.inc("history_rows_failed", len(history.errors))
+            for name, value in cache.stats.items():
+                metrics.inc(f"geocode_cache_{name}", value)
+            if detail_store is not None:
+                for name, value in detail_store.stats.items():
+                    metrics.inc(f"detail_cache_{name}", value)
+            if controller is not None:
+                for name, value in controller.stats.items():
+                    if name == "peak":
+                        metrics.set("fetch_peak_concurrency", value)
+                    else:
+                        metrics.inc(f"fetch_{name}", value)
+                metrics.set("fetch_concurrency", int(controller.limit))
+            summary = metrics.summary()
+
+            if writer.written > 0:
+                print(f"{writer.written} rows written to '{config['table']}' table in {writer.batches} batches")
+            else:
+                print("There is nothing to add")
+
+            if tracker is not None:
+                print(f"{tracker.stats['unchanged']} unchanged listings skipped, {history.written} changes written "
+                      f"to '{config['history_table']}'")
+
+            if writer.errors:
+                print(f"{len(writer.errors)} rows could not be written, see the '{config['log_table']}' table")
+            if history.errors:
+                print(f"{len(history.errors)} changes could not be written to '{config['history_table']}'")
+
+            if writer.written > 0 or writer.errors:
+                writer.log_run(date1, url_list, metrics=summary)
+
+            if metrics_file is not None:
+                metrics.write(metrics_file, labels={"operation": operation})
+            if on_metrics is not None:
+                on_metrics(summary)
+
+        def mark_seen():
+            failed = {error["url(apt)"] for error in writer.errors}
+            seen.update(url for url in rows.keys() if url not in failed)
+            seen.save()
+
+        def close_export():
+            if exporter is not None:
+                exporter.close()
+                print(f"{exporter.rows} rows exported to {export}")
+
+        def close_cache():
+            print("Geocoding cache: ", cache.stats)
+            cache.close()
+
+        steps = [flush, report, mark_seen, lambda: checkpoint.finish(status if not writer.errors else "partial"),
+                 close_export, close_cache, resolver.save]
+        steps += [store.close for store in (detail_fetcher, tracker, detail_store, local_mirror) if store is not None]
+        # every step runs even when an earlier one fails, e.g. with the database down; the
+        # error is raised once they all ran
+        with contextlib.ExitStack() as cleanup:
+            for step in reversed(steps):
+                cleanup.callback(step)
 
-        unique_total = []
-        # iterate over each tuple in the total list
-        for row in total:
-            # check if the row is already in the unique_total list
-            if row not in unique_total:
-                # if not, append the row to the unique_total list
-                unique_total.append(row)
+    print("Time to look at your supabase!!!")
 
-        check = check.append(pd.DataFrame(unique_total, columns=header))
+    return {
+        "operation": operation,
+        "pages": state["pages"],
+        "rows": rows.total,
+        "unique_rows": len(rows),
+        "written": writer.written,
+        "elapsed": time.time() - run_time,
+        "timings": {stage: metrics.timers.get(stage, {}).get("sum", 0.0) for stage in STAGES},
+        "time_to_first_page": metrics.timers.get("time_to_first_page", {}).get("sum"),
+        "failed_pages": state["failed_pages"],
+        "metrics": summary,
+    }
 
-        # check.drop_duplicates(inplace=True)
-        check["price(R$)"] = check["price(R$)"].astype(float)
-        check["area(m²)"] = check["area(m²)"].astype(float)
-        check['parkings'] = check['parkings'].astype('Int64')
 
-        end_time = time.time()
-        diference_time = end_time - start_time
-
-        print(f"page {page_num} was scraped in {round(diference_time)} seconds")
-
-        total_shape = check.shape
-        unique_check = check.drop_duplicates()
-        unique_shape = unique_check.shape
-        print("Total shape of check DataFrame: ", total_shape)
-        print("Shape of unique rows in check DataFrame: ", unique_shape)
-        driver.quit()
-
-    # Get existing IDs in the table
-    existing_ids = supabase.table("rent_scrap").select("id").execute().data
-
-    # Convert the IDs to a set for efficient membership testing
-    existing_ids = set([row["id"] for row in existing_ids])
-
-    # Get the last used ID in the table
-    last_id = max(existing_ids) if existing_ids else 0
-
-    new_rows_added = 0
-
-    for index, row in check.iterrows():
-        # Increment the ID for each new row
-        last_id += 1
-
-        if last_id not in existing_ids:
-            values = {
-                "id": last_id,
-                "price(R$)": row["price(R$)"],
-                "condo(R$)": row["condo(R$)"],
-                "district": row["district"],
-                "address": row["address"],
-                "area(m²)": row["area(m²)"],
-                "bedroom": row["bedroom"],
-                "bathrooms": row["bathrooms"],
-                "parkings": row["parkings"],
-                "url(image)": row["url(image)"],
-                "url(apt)": row["url(apt)"],
-                "created_at": date1,
-                "regional": row["regional"],
-                "lat": row["lat"],
-                "lng": row["lng"]
-            }
-            for key, value in values.items():
-                if pd.isna(value):
-                    values[key] = None
+def scrap_buy(x, y=None, url_type="normal", **options):
+    """A function that scrapes apartments for sale on imovelweb and feeds the data_scrap table in supabase.
 
-            try:
-                res = supabase.table("rent_scrap").upsert(values).execute()
-                new_rows_added += 1
-                print(f"Row {last_id} inserted successfully")
-            except Exception as e:
-                supabase.table("rent_entradas").upsert(
-                    {"error": str(e), "status": "failed"}).execute()
-                print(f"Error inserting row {last_id}: {e}")
-
-    if new_rows_added > 0:
-        print(f"{new_rows_added} rows added to 'rent_scrap' table")
-        date2 = (datetime.utcnow() - timedelta(hours=3)
-                 ).strftime("%Y-%m-%dT%H:%M:%S")
-        try:
-            # Insert the number of new rows added into the 'entrada' table
-            supabase.table("rent_entradas").upsert(
-                {"error": None, "prop_scrap": new_rows_added, "created_at": date1, "status": "complete", "completed_at": date2, "pages": url_list}).execute()
-        except Exception as e:
-            # Insert the error message into the table
-            supabase.table("rent_entradas").upsert(
-                {"error": str(e), "status": "failed"}).execute()
-    else:
-        print("There is nothing to add")
+    Args:
+        x (int): First page to scrape. If y is not specified, this argument is treated as a single page input.
+        y (int, optional): Last page to scrape (not included in the range of pages to scrape).
+                           If specified, pages x to y-1 will be scraped.
+        url_type (str, optional): Type of URL template to use. "normal" for normal URL or "last-day" for last day URL.
+        **options: Any other argument of scrape().
 
-    print("Time to look at your supabase!!!")
+    Returns:
+        Feeds a database in supabase and returns the run summary of scrape().
+    """
+
+    return scrape("buy", x, y, url_type, **options)
+
+
+def scrap_rent(x, y=None, url_type="normal", **options):
+    """A function that scrapes apartments for rent on imovelweb and feeds the rent_scrap table in supabase.
+
+    Args:
+        x (int): First page to scrape. If y is not specified, this argument is treated as a single page input.
+        y (int, optional): Last page to scrape (not included in the range of pages to scrape).
+                           If specified, pages x to y-1 will be scraped.
+        url_type (str, optional): Type of URL template to use. "normal" for normal URL or "last-day" for last day URL.
+        **options: Any other argument of scrape().
+
+    Returns:
+        Feeds a database in supabase and returns the run summary of scrape().
+    """
+
+    return scrape("rent", x, y, url_type, **options)
@@ -0,0 +1,91 @@
+HEADER = ("price(R$)", "condo(R$)", "district", "address", "area(m²)",
+          "bedroom", "bathrooms", "parkings", "url(image)", "url(apt)", "regional", "lat", "lng")
+
+# dtypes applied once, when the final DataFrame is built; the counts are nullable, so a card
+# without a value does not turn the whole column into floats
+DTYPES = {"price(R$)": float, "condo(R$)": float, "area(m²)": float, "bedroom": "Int64", "bathrooms": "Int64",
+          "parkings": "Int64"}
+
+
+class RowAccumulator:
+    """Collects scraped rows column by column, keeping only the first row of each listing.
+
+    Duplicates are found through a set of listing keys, so adding a page costs the same no
+    matter how many pages came before it, and the DataFrame is only built once at the end.
+    When the rows are streamed somewhere else, keep_rows=False keeps only the keys, so
+    memory does not grow with the row width.
+
+    Args:
+        columns (tuple, optional): Column names, in the order of the row tuples.
+        key (str, optional): Column identifying a listing.
+        keep_rows (bool, optional): Keep the rows for to_frame, or only their keys.
+    """
+
+    def __init__(self, columns=HEADER, key="url(apt)", keep_rows=True):
+        self.columns = tuple(columns)
+        self.key = key
+        self.keep_rows = keep_rows
+        self.total = 0
+        self._key_index = self.columns.index(key)
+        self._data = {column: [] for column in self.columns}
+        # a dict rather than a set, to remember the order the listings came in
+        self._seen = {}
+
+    def add(self, rows):
+        """Adds the rows of a page.
+
+        Args:
+            rows (iterable): Tuples with one value per column.
+
+        Returns:
+            The rows kept, i.e. rows whose listing was not seen before.
+        """
+
+        added = []
+        for row in rows:
+            self.total += 1
+            key = row[self._key_index]
+            if key in self._seen:
+                continue
+            self._seen[key] = None
+            if self.keep_rows:
+                for column, value in zip(self.columns, row):
+                    self._data[column].append(value)
+            added.append(row)
+        return added
+
+    def keys(self):
+        """Listing keys of the unique rows, in the order they were added."""
+
+        return list(self._seen)
+
+    def __len__(self):
+        return len(self._seen)
+
+    @property
+    def duplicates(self):
+        return self.total - len(self)
+
+    def to_frame(self):
+        """Builds the typed DataFrame holding every unique row."""
+
+        if not self.keep_rows:
+            raise ValueError("The rows were not kept, build the accumulator with keep_rows=True.")
+        return rows_to_frame(self._data, self.columns)
+
+
+def rows_to_frame(rows, columns=HEADER):
+    """Builds a typed DataFrame from row tuples, or from a dict of columns.
+
+    Args:
+        rows (list or dict): Row tuples in the order of columns, or one list per column.
+        columns (tuple, optional): Column names.
+
+    Returns:
+        A DataFrame with the dtypes in DTYPES applied.
+    """
+
+    import pandas as pd
+
+    frame = pd.DataFrame(rows, columns=list(columns))
+    return frame.astype({column: dtype for column, dtype in DTYPES.items() if column in frame})
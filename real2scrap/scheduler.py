@@ -0,0 +1,297 @@
+import itertools
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from .realstate_scrap import DEFAULT_CITY, DEFAULT_PROPERTY_TYPE, OPERATIONS
+
+
+def expand_job(spec):
+    """Expands a job spec into (query, page) work items.
+
+    A spec lists the searches to crawl; every combination of its operations, cities and
+    property types is a query, and every query gets every page of the spec:
+
+        {"name": "weekly", "operations": ["buy", "rent"], "cities": ["belo-horizonte-mg", "sao-paulo-sp"],
+         "property_types": ["apartamentos", "casas"], "url_type": "normal", "pages": [1, 50]}
+
+    Args:
+        spec (dict): Job spec. "pages" is a [first, last) range; only "name" and "pages" are required.
+
+    Returns:
+        A list of (query, page) tuples, query being a dict with operation, city,
+        property_type and url_type.
+    """
+
+    if "name" not in spec or "pages" not in spec:
+        raise ValueError("A job spec needs a name and a pages range.")
+    first, last = spec["pages"]
+    if first < 1 or last <= first:
+        raise ValueError("The pages range must be [first, last) with 1 <= first < last.")
+
+    operations = spec.get("operations", list(OPERATIONS))
+    unknown = set(operations) - set(OPERATIONS)
+    if unknown:
+        raise ValueError(f"Invalid operations: {', '.join(sorted(unknown))}.")
+
+    items = []
+    for operation, city, property_type in itertools.product(
+            operations, spec.get("cities", [DEFAULT_CITY]), spec.get("property_types", [DEFAULT_PROPERTY_TYPE])):
+        query = {"operation": operation, "city": city, "property_type": property_type,
+                 "url_type": spec.get("url_type", "normal")}
+        items.extend((query, page) for page in range(first, last))
+    return items
+
+
+class WorkQueue:
+    """Durable queue of (query, page) work items in SQLite, shared by any number of workers.
+
+    Workers lease items for `visibility_timeout` seconds. An item whose worker died, or
+    failed, becomes visible again once its lease expires and is retried until it was tried
+    `max_attempts` times, then it is marked failed. Leasing runs in an immediate
+    transaction, so two workers never get the same item; workers on other machines can
+    share the file if it lives on storage with working file locks.
+
+    Args:
+        path (str, optional): SQLite file holding the queue.
+        visibility_timeout (float, optional): Seconds a lease lasts before the item is handed out again.
+        max_attempts (int, optional): Attempts before an item is given up on.
+    """
+
+    def __init__(self, path="work_queue.sqlite3", visibility_timeout=600, max_attempts=3):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # autocommit, the transactions are explicit
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "id INTEGER PRIMARY KEY, job TEXT NOT NULL, query TEXT NOT NULL, page INTEGER NOT NULL, "
+            "status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, "
+            "lease_owner TEXT, lease_expires REAL, last_error TEXT, updated_at REAL, "
+            "UNIQUE (job, query, page))")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS items_status ON items (status, lease_expires)")
+
+    def add(self, job, items):
+        """Enqueues work items. Items already in the queue for this job are left alone.
+
+        Args:
+            job (str): Job name.
+            items (list): (query, page) tuples, as returned by expand_job.
+
+        Returns:
+            The number of items added.
+        """
+
+        rows = [(job, json.dumps(query, sort_keys=True), page, time.time()) for query, page in items]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO items (job, query, page, updated_at) VALUES (?, ?, ?, ?)", rows)
+            added = self._conn.total_changes - before
+            self._conn.execute("COMMIT")
+        return added
+
+    def lease(self, owner, limit=1):
+        """Leases up to limit visible items of a single query.
+
+        Items are handed out in insertion order; the batch only holds pages of the query of
+        its first item, so they can be scraped by one call.
+
+        Args:
+            owner (str): Worker id, checked when the item is completed or failed.
+            limit (int, optional): Most items leased at once.
+
+        Returns:
+            A list of dicts with id, job, query, page and attempts. Empty when nothing is visible.
+        """
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # expired leases that used up their attempts are given up on
+                self._conn.execute(
+                    "UPDATE items SET status = 'failed', updated_at = ? "
+                    "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                    (now, now, self.max_attempts))
+
+                visible = ("(status = 'pending' OR (status = 'leased' AND lease_expires < ?)) "
+                           "AND attempts < ?")
+                first = self._conn.execute(
+                    f"SELECT job, query FROM items WHERE {visible} ORDER BY id LIMIT 1",
+                    (now, self.max_attempts)).fetchone()
+                if first is None:
+                    self._conn.execute("COMMIT")
+                    return []
+
+                rows = self._conn.execute(
+                    f"SELECT id, job, query, page, attempts FROM items WHERE {visible} "
+                    f"AND job = ? AND query = ? ORDER BY page LIMIT ?",
+                    (now, self.max_attempts, first[0], first[1], limit)).fetchall()
+                self._conn.executemany(
+                    "UPDATE items SET status = 'leased', attempts = attempts + 1, lease_owner = ?, "
+                    "lease_expires = ?, updated_at = ? WHERE id = ?",
+                    [(owner, now + self.visibility_timeout, now, row[0]) for row in rows])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        return [{"id": id_, "job": job, "query": json.loads(query), "page": page, "attempts": attempts + 1}
+                for id_, job, query, page, attempts in rows]
+
+    def _finish(self, ids, owner, status, error=None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            # a worker whose lease expired and was taken over cannot overwrite the new owner
+            self._conn.executemany(
+                "UPDATE items SET status = ?, last_error = ?, lease_owner = NULL, lease_expires = NULL, "
+                "updated_at = ? WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                [(status, error, now, id_, owner) for id_ in ids])
+            self._conn.execute("COMMIT")
+
+    def complete(self, ids, owner):
+        """Marks leased items as done."""
+
+        self._finish(ids, owner, "done")
+
+    def fail(self, ids, owner, error):
+        """Hands leased items back for a retry, or marks them failed once out of attempts."""
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany(
+                "UPDATE items SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "last_error = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                [(self.max_attempts, str(error), now, id_, owner) for id_ in ids])
+            self._conn.execute("COMMIT")
+
+    def stats(self, job=None):
+        """Returns the number of items per status, for one job or for the whole queue."""
+
+        query = "SELECT status, COUNT(*) FROM items"
+        args = ()
+        if job is not None:
+            query += " WHERE job = ?"
+            args = (job,)
+        with self._lock:
+            return dict(self._conn.execute(query + " GROUP BY status", args).fetchall())
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def run_worker(queue_path="work_queue.sqlite3", batch=5, worker_id=None, idle_wait=5.0, exit_when_idle=True,
+               visibility_timeout=600, max_attempts=3, session=None, **options):
+    """Leases work items and scrapes them until the queue is drained.
+
+    Args:
+        queue_path (str, optional): SQLite file of the WorkQueue.
+        batch (int, optional): Pages of the same query leased and scraped per scrape() call.
+        worker_id (str, optional): Lease owner. Defaults to host:pid.
+        idle_wait (float, optional): Seconds to wait when nothing is visible before asking again.
+        exit_when_idle (bool, optional): Return once nothing is pending or leased by anyone.
+        visibility_timeout (float, optional): Seconds a lease lasts, see WorkQueue.
+        max_attempts (int, optional): Attempts per item, see WorkQueue.
+        session (ScraperSession, optional): Session whose clients and driver are reused between batches.
+        **options: Any other argument of scrape().
+
+    Returns:
+        A dict with the number of pages done and failed by this worker.
+    """
+
+    from .session import ScraperSession
+
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    queue = WorkQueue(queue_path, visibility_timeout=visibility_timeout, max_attempts=max_attempts)
+    session = session or ScraperSession()
+    done = failed = 0
+
+    try:
+        while True:
+            items = queue.lease(worker_id, batch)
+            if not items:
+                counts = queue.stats()
+                if exit_when_idle and not counts.get("pending") and not counts.get("leased"):
+                    break
+                time.sleep(idle_wait)
+                continue
+
+            query = items[0]["query"]
+            pages = [item["page"] for item in items]
+            ids = {item["page"]: item["id"] for item in items}
+            print(f"{worker_id} scraping {query['operation']} {query['property_type']} in {query['city']}, "
+                  f"pages {pages}")
+
+            try:
+                summary = session.scrape(query["operation"], pages[0], url_type=query["url_type"],
+                                         city=query["city"], property_type=query["property_type"],
+                                         pages=pages, **options)
+            except Exception as e:
+                queue.fail(list(ids.values()), worker_id, e)
+                failed += len(ids)
+                continue
+
+            bad = set(summary["failed_pages"])
+            if bad:
+                queue.fail([ids[page] for page in bad], worker_id, "page could not be scraped")
+            queue.complete([ids[page] for page in pages if page not in bad], worker_id)
+            done += len(pages) - len(bad)
+            failed += len(bad)
+    finally:
+        queue.close()
+
+    return {"worker": worker_id, "done": done, "failed": failed}
+
+
+def run_workers(processes=4, queue_path="work_queue.sqlite3", **options):
+    """Runs run_worker in several local processes sharing the same queue.
+
+    Args:
+        processes (int, optional): Number of worker processes.
+        queue_path (str, optional): SQLite file of the WorkQueue.
+        **options: Any other argument of run_worker or scrape().
+    """
+
+    import multiprocessing
+
+    workers = [multiprocessing.Process(target=run_worker, args=(queue_path,), kwargs=options)
+               for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sharded crawl scheduler.")
+    parser.add_argument("command", choices=("enqueue", "work", "stats"))
+    parser.add_argument("spec", nargs="?", help="JSON job spec, for enqueue")
+    parser.add_argument("--queue", default="work_queue.sqlite3")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--batch", type=int, default=5)
+    parser.add_argument("--engine", default="selenium")
+    args = parser.parse_args()
+
+    if args.command == "enqueue":
+        with open(args.spec, encoding="utf-8") as f:
+            spec = json.load(f)
+        work_queue = WorkQueue(args.queue)
+        print(f"{work_queue.add(spec['name'], expand_job(spec))} items added to {args.queue}")
+    elif args.command == "work":
+        run_workers(args.processes, args.queue, batch=args.batch, engine=args.engine)
+    else:
+        print(WorkQueue(args.queue).stats())
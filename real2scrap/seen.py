@@ -0,0 +1,83 @@
+import hashlib
+import os
+import re
+from array import array
+
+from .browser import CARD_FIELDS
+
+# listing urls end with the numeric posting id, e.g. /propriedades/apartamento-...-2987654321.html
+_ID_RE = re.compile(r"-(\d+)\.html")
+
+
+def listing_id(posting):
+    """Returns the numeric id of a listing from its data-to-posting path or full url.
+
+    Urls without a numeric id are hashed to a 64-bit integer instead.
+    """
+
+    match = _ID_RE.search(posting or "")
+    if match:
+        return int(match.group(1))
+    return int.from_bytes(hashlib.blake2b((posting or "").encode(), digest_size=8).digest(), "little")
+
+
+class SeenIndex:
+    """Persistent set of the listing ids already stored, kept on disk as packed 64-bit integers.
+
+    New ids are appended to the file by save(), so the file only grows by what each run adds.
+
+    Args:
+        path (str, optional): File holding the ids.
+    """
+
+    def __init__(self, path="seen_listings.bin"):
+        self.path = path
+        self._ids = set()
+        self._new = array("Q")
+
+        if os.path.exists(path):
+            ids = array("Q")
+            with open(path, "rb") as f:
+                ids.frombytes(f.read())
+            self._ids.update(ids)
+
+    def __contains__(self, posting):
+        return listing_id(posting) in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def update(self, postings):
+        """Marks listings as seen. They are written to disk by save()."""
+
+        for posting in postings:
+            key = listing_id(posting)
+            if key not in self._ids:
+                self._ids.add(key)
+                self._new.append(key)
+
+    def save(self):
+        """Appends the ids added since the last save to the file."""
+
+        if self._new:
+            with open(self.path, "ab") as f:
+                self._new.tofile(f)
+            self._new = array("Q")
+
+
+def new_cards(page, seen):
+    """Keeps only the cards of a page whose listing is not in the seen index.
+
+    Args:
+        page (dict): Page dict with one list per field in CARD_FIELDS.
+        seen (SeenIndex): Listings already stored.
+
+    Returns:
+        A copy of the page restricted to the new cards.
+    """
+
+    keep = [i for i, posting in enumerate(page["posting"]) if posting not in seen]
+    fresh = dict(page)
+    for field in CARD_FIELDS:
+        fresh[field] = [page[field][i] for i in keep]
+    return fresh
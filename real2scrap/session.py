@@ -0,0 +1,151 @@
+import json
+import os
+import time
+
+# where resolved chromedriver paths are remembered between runs
+DRIVER_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "real2scrap", "chromedriver.json")
+
+
+def _installed_chrome():
+    # the major version of the local Chrome, read from its binary without going online
+    try:
+        from webdriver_manager.core.utils import ChromeType, get_browser_version_from_os
+
+        version = get_browser_version_from_os(ChromeType.GOOGLE)
+    except Exception:
+        return None
+    return version.split(".")[0] if version else None
+
+
+def resolve_driver_path(version=None, cache_path=DRIVER_CACHE, refresh=False):
+    """Returns the path of a chromedriver binary, going to the network only when it is not cached.
+
+    ChromeDriverManager().install() checks online for the latest driver on every call. Here
+    the path it returns is remembered per version in cache_path and reused for as long as the
+    binary exists, so later runs start offline. Without a pinned version, the entry is keyed by
+    the major version of the installed Chrome, so a Chrome update resolves a matching driver.
+    The CHROMEDRIVER_PATH environment variable, when set, wins over both.
+
+    Args:
+        version (str, optional): Chromedriver version to pin, e.g. "114.0.5735.90". Defaults to
+                                 the one matching the installed Chrome at the first resolution.
+        cache_path (str, optional): JSON file remembering the resolved paths.
+        refresh (bool, optional): Resolve again even if a cached path exists.
+
+    Returns:
+        The path of the chromedriver binary.
+    """
+
+    if os.environ.get("CHROMEDRIVER_PATH"):
+        return os.environ["CHROMEDRIVER_PATH"]
+
+    chrome = _installed_chrome() if version is None else None
+    key = version or (f"chrome-{chrome}" if chrome else "installed-chrome")
+    cached = {}
+    if os.path.exists(cache_path):
+        with open(cache_path, encoding="utf-8") as f:
+            cached = json.load(f)
+    if not refresh and key in cached and os.path.exists(cached[key]):
+        return cached[key]
+
+    from webdriver_manager.chrome import ChromeDriverManager
+
+    path = ChromeDriverManager(version=version).install()
+    cached[key] = path
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump(cached, f, indent=2)
+    return path
+
+
+class ScraperSession:
+    """Keeps what every run needs, so a process scraping several times only sets it up once.
+
+    The environment is read, the clients are built and the chromedriver path is resolved on
+    first use only, so a run with the http engine never loads selenium, and a run given its
+    own clients never imports supabase or googlemaps.
+
+    Args:
+        supabase_client (Client, optional): Supabase client. Built from SUPABASE_URL and SUPABASE_KEY2 otherwise.
+        geocoder (optional): googlemaps-like client. Built from API_GOOGLE otherwise.
+        driver_version (str, optional): Chromedriver version to pin, see resolve_driver_path.
+        driver_path (str, optional): Chromedriver binary to use, skipping the resolution.
+        **options: Default arguments of scrape() for every run of the session.
+    """
+
+    def __init__(self, supabase_client=None, geocoder=None, driver_version=None, driver_path=None, **options):
+        self.driver_version = driver_version
+        self.options = options
+        self.runs = []
+        self._supabase = supabase_client
+        self._geocoder = geocoder
+        self._driver_path = driver_path
+        self._env_loaded = False
+
+    def _load_env(self):
+        if not self._env_loaded:
+            from dotenv import load_dotenv
+            load_dotenv()
+            self._env_loaded = True
+
+    @property
+    def supabase(self):
+        if self._supabase is None:
+            from supabase import create_client
+            self._load_env()
+            self._supabase = create_client(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY2"))
+        return self._supabase
+
+    @property
+    def geocoder(self):
+        if self._geocoder is None:
+            import googlemaps
+            self._load_env()
+            self._geocoder = googlemaps.Client(key=os.environ.get("API_GOOGLE"))
+        return self._geocoder
+
+    def driver_path(self):
+        """Returns the chromedriver path, resolving it on the first call only."""
+
+        if self._driver_path is None:
+            self._driver_path = resolve_driver_path(self.driver_version)
+        return self._driver_path
+
+    def scrape(self, operation, x, y=None, url_type="normal", **options):
+        """Runs scrape() with the clients and driver of the session.
+
+        Args:
+            operation (str): "buy" or "rent".
+            x (int): First page to scrape.
+            y (int, optional): Last page to scrape (not included).
+            url_type (str, optional): "normal" or "last-day".
+            **options: Any other argument of scrape(), overriding the session defaults.
+
+        Returns:
+            The run summary of scrape() with the seconds spent building the clients ("setup"),
+            also appended to runs.
+        """
+
+        from .realstate_scrap import scrape
+
+        # clients are built on the first run only, later runs start straight away
+        start_time = time.time()
+        clients = {"supabase_client": self.supabase, "geocoder": self.geocoder}
+        setup = time.time() - start_time
+
+        # the driver path is only resolved if a page needs Chrome
+        summary = scrape(operation, x, y, url_type, **{**clients, "driver_path": self.driver_path,
+                                                       **self.options, **options})
+        summary["setup"] = setup
+        self.runs.append(summary)
+        return summary
+
+    def scrap_buy(self, x, y=None, url_type="normal", **options):
+        """Scrapes apartments for sale, see scrape."""
+
+        return self.scrape("buy", x, y, url_type, **options)
+
+    def scrap_rent(self, x, y=None, url_type="normal", **options):
+        """Scrapes apartments for rent, see scrape."""
+
+        return self.scrape("rent", x, y, url_type, **options)
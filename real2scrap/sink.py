@@ -0,0 +1,172 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+# characters PostgREST reads as syntax in a list of columns, unless the name is double-quoted
+POSTGREST_RESERVED = set(',.:()" ')
+
+
+def now_brt():
+    """Current time in Brasilia (UTC-3), formatted like the created_at column."""
+
+    return (datetime.utcnow() - timedelta(hours=3)).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def quote_column(name):
+    """Quotes a column name for PostgREST query parameters such as on_conflict, when it needs it.
+
+    Args:
+        name (str): Column name, e.g. "url(apt)".
+
+    Returns:
+        The name as is, or double-quoted when it holds reserved characters ('"url(apt)"').
+    """
+
+    if not set(name) & POSTGREST_RESERVED:
+        return name
+    return '"' + name.replace('"', '\\"') + '"'
+
+
+def _clean(value):
+    import pandas as pd
+
+    if value is None or (not isinstance(value, (list, dict)) and pd.isna(value)):
+        return None
+    # numpy scalars are not JSON serializable
+    return value.item() if hasattr(value, "item") else value
+
+
+def frame_to_records(frame, created_at):
+    """Turns the scraped DataFrame into JSON-ready rows for the database.
+
+    Args:
+        frame (DataFrame): Rows to write.
+        created_at (str): Timestamp stored with every row.
+
+    Returns:
+        A list of dicts, with missing values as None.
+    """
+
+    records = []
+    for row in frame.to_dict("records"):
+        record = {column: _clean(value) for column, value in row.items()}
+        record["created_at"] = created_at
+        records.append(record)
+    return records
+
+
+class SupabaseWriter:
+    """Upserts rows into a Supabase table in batches, keyed by the listing url.
+
+    The table needs a unique constraint on `on_conflict`, which makes every write
+    idempotent: rows of a listing already stored are updated instead of duplicated, and the
+    database assigns the ids. A batch that keeps failing after `retries` attempts is written
+    row by row to isolate the bad rows; their errors end up in a single run summary.
+
+    Args:
+        client (Client): Supabase client.
+        table (str): Table receiving the rows.
+        log_table (str): Table receiving the run summary ("entradas" or "rent_entradas").
+        batch_size (int, optional): Rows sent per request.
+        on_conflict (str, optional): Unique column used by the upsert.
+        retries (int, optional): Extra attempts for a failed batch.
+        backoff (float, optional): Base delay in seconds before retrying a batch.
+        on_written (callable, optional): Called with the rows of every successful request.
+    """
+
+    def __init__(self, client, table, log_table, batch_size=500, on_conflict="url(apt)", retries=3, backoff=1.0,
+                 on_written=None):
+        self.client = client
+        self.table = table
+        self.log_table = log_table
+        self.batch_size = batch_size
+        self.on_conflict = on_conflict
+        self.retries = retries
+        self.backoff = backoff
+        self.on_written = on_written
+        self.written = 0
+        self.batches = 0
+        self.errors = []
+        self._buffer = []
+
+    def _upsert(self, rows):
+        # every row of a request needs the same columns; rows without the optional ones go in
+        # their own request, which leaves the stored values of those columns alone
+        groups = {}
+        for row in rows:
+            groups.setdefault(tuple(row), []).append(row)
+        on_conflict = quote_column(self.on_conflict)
+        for group in groups.values():
+            self.client.table(self.table).upsert(group, on_conflict=on_conflict).execute()
+        if self.on_written is not None:
+            self.on_written(rows)
+
+    def _send(self, rows):
+        for attempt in range(self.retries + 1):
+            try:
+                self._upsert(rows)
+                self.written += len(rows)
+                self.batches += 1
+                return
+            except Exception as e:
+                if attempt < self.retries:
+                    print(f"Batch of {len(rows)} rows failed, retrying: {e}")
+                    time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+                    continue
+                print(f"Batch of {len(rows)} rows failed {self.retries + 1} times: {e}")
+
+        # find out which rows the database refuses
+        for row in rows:
+            try:
+                self._upsert([row])
+                self.written += 1
+            except Exception as e:
+                self.errors.append({"url(apt)": row.get(self.on_conflict), "error": str(e)})
+
+    def write(self, rows):
+        """Queues rows and sends every full batch.
+
+        Args:
+            rows (list): Dicts as returned by frame_to_records.
+        """
+
+        self._buffer.extend(rows)
+        while len(self._buffer) >= self.batch_size:
+            batch, self._buffer = self._buffer[:self.batch_size], self._buffer[self.batch_size:]
+            self._send(batch)
+
+    def flush(self):
+        """Sends the rows still queued."""
+
+        if self._buffer:
+            batch, self._buffer = self._buffer, []
+            self._send(batch)
+
+    def log_run(self, created_at, pages, metrics=None):
+        """Writes one summary row for the run into log_table.
+
+        Args:
+            created_at (str): Start of the run.
+            pages (list): Urls scraped in the run.
+            metrics (dict, optional): Metrics summary stored in the json "metrics" column.
+        """
+
+        self.flush()
+        summary = {
+            "error": "\n".join(f"{e['url(apt)']}: {e['error']}" for e in self.errors) or None,
+            "prop_scrap": self.written,
+            "created_at": created_at,
+            "status": "complete" if not self.errors else "partial",
+            "completed_at": now_brt(),
+            "pages": pages,
+        }
+        if metrics is not None:
+            summary["metrics"] = metrics
+        try:
+            self.client.table(self.log_table).upsert(summary).execute()
+        except Exception as e:
+            try:
+                self.client.table(self.log_table).upsert({"error": str(e), "status": "failed"}).execute()
+            except Exception as e:
+                # the database is unreachable, the run still has to finish cleanly
+                print(f"Could not log the run to '{self.log_table}': {e}")
@@ -0,0 +1,168 @@
+import collections
+import random
+import threading
+import time
+
+# statuses the site answers with when it throttles or blocks a client
+THROTTLE_STATUSES = (403, 429, 503)
+
+
+class AdaptiveConcurrency:
+    """AIMD controller of the number of results pages fetched at the same time.
+
+    Every page takes a slot with acquire() and gives it back with release(), which reports
+    how the page went. While pages come back fast and with cards, the limit grows: by one
+    per page until the first sign of trouble (slow start), then by one per `limit` pages.
+    A page slower than `slow_after`, an HTTP 403/429/503, a captcha, or `zero_card_rate`
+    of the last `window` pages without cards cuts the limit by `decrease`; throttling also
+    pauses every new page for a jittered backoff that doubles while throttling goes on.
+    The limit is only cut, and the backoff only grows, once per round of pages in flight,
+    so one burst of errors does not bring it down to the minimum.
+
+    Retries share a budget of `retry_budget` times the pages fetched (at least
+    `min_retries`), so a blocked site cannot keep a run retrying forever. The floor covers a
+    full round of pages in flight, since throttling early in a crawl hits the whole round.
+
+    Args:
+        maximum (int, optional): Highest number of pages in flight.
+        minimum (int, optional): Lowest number of pages in flight.
+        initial (int, optional): Starting limit. Defaults to a quarter of maximum.
+        decrease (float, optional): Factor applied to the limit on throttling or slow pages.
+        slow_after (float, optional): Seconds above which a page counts as slow.
+        zero_card_rate (float, optional): Share of pages without cards, over the last window, read as throttling.
+        window (int, optional): Number of recent pages the zero card rate is computed on.
+        backoff (float, optional): Base pause in seconds after throttling.
+        max_backoff (float, optional): Longest pause in seconds.
+        retry_budget (float, optional): Retries allowed per page fetched.
+        min_retries (int, optional): Retries allowed whatever the number of pages. Defaults to maximum.
+    """
+
+    def __init__(self, maximum=16, minimum=1, initial=None, decrease=0.5, slow_after=10.0, zero_card_rate=0.5,
+                 window=10, backoff=2.0, max_backoff=60.0, retry_budget=0.5, min_retries=None):
+        if minimum < 1 or maximum < minimum:
+            raise ValueError("The limits must satisfy 1 <= minimum <= maximum.")
+        if not 0 < decrease < 1:
+            raise ValueError("decrease must be between 0 and 1.")
+
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(min(maximum, max(minimum, initial or maximum // 4)))
+        self.decrease = decrease
+        self.slow_after = slow_after
+        self.zero_card_rate = zero_card_rate
+        self.base_backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_budget = retry_budget
+        self.min_retries = maximum if min_retries is None else min_retries
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.stats = {"pages": 0, "throttled": 0, "slow": 0, "cuts": 0, "retries": 0, "retries_denied": 0,
+                      "peak": int(self.limit)}
+        self._backoff = backoff
+        self._slow_start = True
+        self._last_cut = 0.0
+        self._recent = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """Takes a slot if one is free.
+
+        Returns:
+            A tuple (started, wait): the start time to hand to release() and 0 when the slot
+            was taken, or None and the seconds to wait before asking again.
+        """
+
+        with self._lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return None, self.paused_until - now
+            if self.in_flight >= int(self.limit):
+                return None, 0.05
+            self.in_flight += 1
+            self.stats["pages"] += 1
+            return now, 0
+
+    def acquire(self):
+        """Blocks until a slot is free and takes it. Returns the start time to hand to release()."""
+
+        while True:
+            started, wait = self.try_acquire()
+            if started is not None:
+                return started
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """acquire() for coroutines."""
+
+        import asyncio
+
+        while True:
+            started, wait = self.try_acquire()
+            if started is not None:
+                return started
+            await asyncio.sleep(wait)
+
+    def release(self, started, latency, cards=None, status=None, blocked=False, retry_after=None):
+        """Gives a slot back and adapts the limit to how the page went.
+
+        Args:
+            started (float): Value returned by acquire().
+            latency (float): Seconds the page took.
+            cards (int, optional): Cards found on the page, None when it could not be read.
+            status (int, optional): HTTP status of the page, None with a browser.
+            blocked (bool, optional): The page is a captcha or an access denied page.
+            retry_after (float, optional): Seconds the site asked to wait (Retry-After header).
+
+        Returns:
+            "throttled", "slow" or "ok".
+        """
+
+        with self._lock:
+            self.in_flight -= 1
+            if cards is not None:
+                self._recent.append(cards == 0)
+            full = len(self._recent) == self._recent.maxlen
+            zero_rate = sum(self._recent) / len(self._recent) if full else 0.0
+
+            if blocked or status in THROTTLE_STATUSES or zero_rate >= self.zero_card_rate:
+                outcome = "throttled"
+            elif latency > self.slow_after:
+                outcome = "slow"
+            else:
+                outcome = "ok"
+
+            if outcome == "ok":
+                self.limit = min(self.maximum, self.limit + (1 if self._slow_start else 1 / self.limit))
+                self._backoff = self.base_backoff
+                self.stats["peak"] = max(self.stats["peak"], int(self.limit))
+                return outcome
+
+            self.stats[outcome] += 1
+            now = time.monotonic()
+            if outcome == "throttled":
+                # the pages fetched after the pause get a window of their own
+                self._recent.clear()
+                if retry_after is not None:
+                    self.paused_until = max(self.paused_until, now + retry_after)
+
+            # pages started before the last cut saw the old limit, they neither cut nor back off again
+            if started < self._last_cut:
+                return outcome
+            self._slow_start = False
+            self.limit = max(self.minimum, self.limit * self.decrease)
+            self._last_cut = now
+            self.stats["cuts"] += 1
+            if outcome == "throttled" and retry_after is None:
+                self.paused_until = max(self.paused_until, now + self._backoff * random.uniform(0.5, 1.5))
+                self._backoff = min(self.max_backoff, self._backoff * 2)
+            return outcome
+
+    def allow_retry(self):
+        """Takes a retry from the budget. Returns False once the budget is spent."""
+
+        with self._lock:
+            if self.stats["retries"] < max(self.min_retries, self.retry_budget * self.stats["pages"]):
+                self.stats["retries"] += 1
+                return True
+            self.stats["retries_denied"] += 1
+            return False
@@ -4,19 +4,21 @@ import os
 setup(
     author="Lucas Abreu",
     author_email='lag.programmer@gmail.com',
-    python_requires='>=3.6',
+    python_requires='>=3.8',
     classifiers=[
         'Development Status :: 2 - Pre-Alpha',
         'Intended Audience :: Developers',
         'Natural Language :: English',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.6',
-        'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
     ],
     description="extract all the data like: price, address, features from imovelweb.com.br",
     include_package_data=True,
     name='real2scrap',
     packages=find_packages(),
+    package_data={'real2scrap': ['data/*.json']},
     version='0.2.3',
 )
@@ -0,0 +1,56 @@
+import time
+
+from real2scrap.fakes import FakeGeocoder
+from real2scrap.geocoding import AddressIndex, TokenBucket, geocode_batch
+
+ADDRESSES = [f"Rua {i}, Savassi, Belo Horizonte" for i in range(60)]
+
+
+def test_results_follow_input_order_and_repeats_are_geocoded_once():
+    client = FakeGeocoder(latency=0.01, unknown={ADDRESSES[3]})
+    addresses = ADDRESSES[:10] + ADDRESSES[:10]
+
+    locations = geocode_batch(client, addresses, workers=4, qps=1000)
+
+    expected = [client.geocode(address) for address in ADDRESSES[:10]]
+    expected = [(r[0]["geometry"]["location"]["lat"], r[0]["geometry"]["location"]["lng"]) if r else None
+                for r in expected]
+    assert locations == expected + expected
+    assert locations[3] is None
+    assert client.calls == 20
+
+
+def test_rate_limit_errors_are_retried():
+    client = FakeGeocoder(latency=0, error_rate=0.3, seed=1)
+
+    addresses = ADDRESSES[:50]
+
+    locations = geocode_batch(client, addresses, workers=1, qps=1000, retries=8, backoff=0.001)
+
+    assert all(location is not None for location in locations)
+    assert client.errors > 0
+    assert client.calls == len(addresses) + client.errors
+
+
+def test_shared_bucket_holds_the_quota_across_batches():
+    client = FakeGeocoder(latency=0)
+    bucket = TokenBucket(20)
+
+    started = time.monotonic()
+    for start in range(0, 60, 20):
+        geocode_batch(client, ADDRESSES[start:start + 20], workers=4, bucket=bucket)
+    elapsed = time.monotonic() - started
+
+    # a burst of 20, then 40 calls at 20 per second
+    assert client.calls == 60
+    assert elapsed >= 1.8
+
+
+def test_address_index_matches_street_names_but_not_house_numbers():
+    index = AddressIndex([("Avenida Afonso Pena 1500, Centro, Belo Horizonte", -19.92, -43.93),
+                          ("Rua Antonio de Albuquerque 300, Savassi, Belo Horizonte", -19.93, -43.94)])
+
+    assert index.lookup("Av. Afonso Pena 1500, Centro, Belo Horizonte") == ((-19.92, -43.93), 1.0)
+    assert index.lookup("Av. Afonso Pena 3500, Centro, Belo Horizonte", 0.5) == (None, 0.0)
+    location, confidence = index.lookup("R. Antônio Albuquerq 300, Savassi, Belo Horizonte")
+    assert location == (-19.93, -43.94) and 0.9 <= confidence < 1
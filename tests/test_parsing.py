@@ -0,0 +1,40 @@
+import pytest
+
+from real2scrap.parsing import clean_district, parse_features, parse_price
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("R$ 450.000\nCondominio R$ 800", (450000, 800)),
+    ("R$ 1.250.000", (1250000, None)),
+    ("R$ 2.500\nCondominio R$ 350", (2500, 350)),
+    ("Sob consulta", (None, None)),
+    ("", (None, None)),
+    (None, (None, None)),
+])
+def test_parse_price(text, expected):
+    assert parse_price(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("90 m²\n3 quartos\n2 ban\n2 vagas", (90.0, 3, 2, 2)),
+    ("45 m²\n1 quarto\n1 ban\n1 vaga", (45.0, 1, 1, 1)),
+    ("120 m²\n100 m²\n4 quartos\n3 ban\n2 vagas", (100.0, 4, 3, 2)),
+    ("72,5 m²\n2 quartos", (72.5, 2, None, 0)),
+    ("3 quartos\n2 ban", (None, 3, 2, 0)),
+    ("", (None, None, None, 0)),
+    (None, (None, None, None, 0)),
+])
+def test_parse_features(text, expected):
+    assert parse_features(text) == expected
+
+
+@pytest.mark.parametrize("location, expected", [
+    ("Savassi, Belo Horizonte", "Savassi"),
+    ("santo antônio, Belo Horizonte", "Santo Antonio"),
+    ("Jardim América (Barreiro), Belo Horizonte", "Jardim America"),
+    ("Funcionários", "Funcionarios"),
+    ("", None),
+    (None, None),
+])
+def test_clean_district(location, expected):
+    assert clean_district(location) == expected
@@ -0,0 +1,28 @@
+import tempfile
+
+from real2scrap.bench import serve_fixtures, write_fixture_pages
+from real2scrap.http_engine import HttpFetcher
+from real2scrap.realstate_scrap import url_template_for
+from real2scrap.throttle import AdaptiveConcurrency
+
+
+def test_retry_budget_covers_a_round_of_pages_in_flight():
+    controller = AdaptiveConcurrency(maximum=16)
+
+    assert sum(controller.allow_retry() for _ in range(20)) == 16
+    assert controller.stats["retries_denied"] == 4
+
+
+def test_throttled_crawl_recovers_every_page():
+    with tempfile.TemporaryDirectory() as directory:
+        write_fixture_pages(directory, pages=30, cards_per_page=5)
+        with serve_fixtures(directory, throttle_qps=15) as base_url:
+            template = url_template_for("buy", base_url=base_url)
+            controller = AdaptiveConcurrency(maximum=16)
+            with HttpFetcher(concurrency=16, controller=controller) as fetcher:
+                futures = [fetcher.submit(template.format(page)) for page in range(1, 31)]
+                pages = [future.result()[0] for future in futures]
+
+    assert controller.stats["throttled"] > 0
+    assert controller.stats["retries_denied"] == 0
+    assert all(page is not None for page in pages)